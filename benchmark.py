@@ -0,0 +1,228 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.path import Path as polygonPath
+
+from delaunay_mesh import mesh
+from boundaries import spiral_example, square_c, square_oo, square_3o, scale_loop
+from video import frameRecorder, renderFrames
+
+# Benchmarks of the phases of meshing, drawing and rendering, on the shapes of boundaries.py
+# scaled up to a range of node counts (see boundaries.scale_loop). For example,
+#
+#   python benchmark.py --sizes 100 1000 10000 --output results.json
+#   python benchmark.py --sizes 100 1000 10000 --baseline results.json
+#
+# The time taken by the default 'insert' engine of addBoundaryLoop grows with about the square of
+# the number of nodes or faster: some 20 s for 1000 nodes and 100-150 s for 2000. So by default
+# (--engine auto) loops of up to insertLimit nodes are meshed with the 'insert' engine and larger
+# ones with the 'recover' engine, which takes some 15 s for 10000 nodes and a minute for 100000.
+# --engine insert or --engine recover uses the one engine at every size. The engine used is
+# recorded with each result, and only results with the same engine are compared.
+#
+# For each shape and size, the phases are timed as follows (the best of 'repeat' runs):
+#
+#   addBoundaryLoop                 meshing the scaled boundary loop with the engine, everything included.
+#   removeNonFeatureBoundaryEdges   the part of addBoundaryLoop spent removing the outer triangles.
+#   insertNodes                     bulk insertion of as many random points, from inside the boundary,
+#                                   into an empty mesh.
+#   plot                            drawing the mesh with its default options, on an Agg canvas.
+#   renderFrames                    rendering the first 'frames' frames of a video of the meshing,
+#                                   made with the same engine.
+#
+# The results are written as JSON, and compared with a baseline written in the same way: the
+# ratio of each time to that of the baseline is reported, and those that are slower by more than
+# the tolerance are flagged as regressions.
+
+shapes = {'spiral_example': spiral_example, 'square_c': square_c, 'square_oo': square_oo, 'square_3o': square_3o}
+
+phases = ('addBoundaryLoop', 'removeNonFeatureBoundaryEdges', 'insertNodes', 'plot', 'renderFrames')
+
+engines = ('auto', 'insert', 'recover')
+
+insertLimit = 1000  # the most nodes meshed with the 'insert' engine by --engine auto.
+
+
+class limitedRecorder(frameRecorder):
+
+# A frameRecorder that records the first 'limit' frames only.
+
+    def __init__(self, limit):
+        frameRecorder.__init__(self, labels=False, arrows=False)
+        self.limit = limit
+
+    def record(self, nodes, edges, elements):
+        if len(self) < self.limit: frameRecorder.record(self, nodes, edges, elements)
+
+
+def timed(fn, times, key):
+    # fn wrapped so that the time taken by each call is added to times[key].
+
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            times[key] = times.get(key, 0.0) + time.perf_counter() - t0
+
+    return wrapper
+
+
+def interiorPoints(nodeList, num, seed):
+    # num random points inside the boundary loop nodeList.
+
+    xy = np.asarray(nodeList, dtype=float)
+    lo, hi = xy.min(axis=0), xy.max(axis=0)
+    inside = polygonPath(xy)
+
+    rng = np.random.default_rng(seed)
+    res = np.zeros((0, 2))
+    while len(res) < num:
+        pts = lo + rng.random((2*num, 2)) * (hi - lo)
+        res = np.concatenate([res, pts[inside.contains_points(pts)]])
+
+    return res[:num]
+
+
+def engineFor(engine, numNodes):
+    # The addBoundaryLoop engine used for a loop of numNodes nodes.
+
+    if engine == 'auto': return 'insert' if numNodes <= insertLimit else 'recover'
+    return engine
+
+
+def runOnce(nodeList, phaseList, frames, seed, engine='insert'):
+    # The times of the phases in phaseList for one run on the boundary loop nodeList.
+
+    times = {}
+
+    m = mesh()
+    m.removeNonFeatureBoundaryEdges = timed(m.removeNonFeatureBoundaryEdges, times, 'removeNonFeatureBoundaryEdges')
+    timed(m.addBoundaryLoop, times, 'addBoundaryLoop')(nodeList, engine=engine)
+
+    if 'insertNodes' in phaseList:
+        points = interiorPoints(nodeList, len(nodeList), seed)
+        timed(mesh().insertNodes, times, 'insertNodes')(points, seed=seed)
+
+    if 'plot' in phaseList:
+        fig = Figure(figsize=(6, 6))
+        canvas = FigureCanvasAgg(fig)
+
+        t0 = time.perf_counter()
+        axs = fig.subplots(1, 1)
+        axs.set_aspect(aspect = 1.0)
+        m.draw_mesh(axs)
+        axs.autoscale()
+        axs.axis('off')
+        canvas.draw()
+        times['plot'] = time.perf_counter() - t0
+
+    if 'renderFrames' in phaseList:
+        mv = mesh()
+        mv.recorder = limitedRecorder(frames)
+        mv.addBoundaryLoop(nodeList, video=True, engine=engine)
+
+        t0 = time.perf_counter()
+        for rgba in renderFrames(mv.recorder, (6, 6), 100, workers=1): pass
+        times['renderFrames'] = time.perf_counter() - t0
+
+    return {key: times[key] for key in phaseList if key in times}
+
+
+def run(shapeNames=tuple(shapes), sizes=(100, 1000), phaseList=phases, repeat=3, frames=100, seed=0, log=None, engine='auto'):
+
+# Run the benchmarks and return the results as a dict that can be saved as JSON. log, if given,
+# is called with a line of text as each result is obtained. engine is one of 'engines'.
+
+    if engine not in engines:
+        raise ValueError("Unknown meshing engine '{}'; the engines are {}.".format(engine, ', '.join(engines)))
+
+    results = []
+    for name in shapeNames:
+        for size in sizes:
+            nodeList = scale_loop(shapes[name](), size)
+            used = engineFor(engine, len(nodeList))
+
+            best = {}
+            for irep in range(repeat):
+                for key, t in runOnce(nodeList, phaseList, frames, seed, used).items():
+                    best[key] = min(t, best.get(key, t))
+
+            for key in phaseList:
+                if key not in best: continue
+                results.append({'shape': name, 'nodes': len(nodeList), 'engine': used, 'phase': key, 'seconds': best[key]})
+                if log: log('{:16s} {:8d} {:8s} {:30s} {:10.4f}'.format(name, len(nodeList), used, key, best[key]))
+
+    return {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'matplotlib': matplotlib.__version__, 'machine': platform.machine(),
+                            'platform': platform.platform(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'settings': {'repeat': repeat, 'frames': frames, 'seed': seed, 'engine': engine},
+            'results': results}
+
+
+def compare(results, baseline, tolerance=0.1):
+
+# Compare two sets of results from run(). Returns a list of (shape, nodes, phase, seconds,
+# baseline seconds, ratio, regression) for the results found in both with the same engine, where
+# ratio is the time as a multiple of the baseline, and regression is True if it exceeds 1 + tolerance.
+# Results without an engine were made with the 'insert' engine.
+
+    def key(xx): return xx['shape'], xx['nodes'], xx.get('engine', 'insert'), xx['phase']
+    base = {key(xx): xx['seconds'] for xx in baseline['results']}
+
+    res = []
+    for xx in results['results']:
+        if key(xx) not in base: continue
+        t, tb = xx['seconds'], base[key(xx)]
+        ratio = t / tb if tb > 0 else float('inf')
+        res.append((xx['shape'], xx['nodes'], xx['phase'], t, tb, ratio, ratio > 1.0 + tolerance))
+
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark meshing, drawing and rendering on scaled boundary loops.")
+    parser.add_argument('--shapes', nargs='+', default=list(shapes), choices=list(shapes))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000], help="numbers of boundary nodes")
+    parser.add_argument('--engine', default='auto', choices=list(engines),
+                        help="addBoundaryLoop engine; auto uses 'insert' up to {} nodes and 'recover' above".format(insertLimit))
+    parser.add_argument('--phases', nargs='+', default=list(phases), choices=list(phases))
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each benchmark, of which the fastest is kept")
+    parser.add_argument('--frames', type=int, default=100, help="video frames rendered by renderFrames")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="JSON file of earlier results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="slowdown relative to the baseline reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.shapes, args.sizes, args.phases, args.repeat, args.frames, args.seed, log=print, engine=args.engine)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        rows = compare(results, baseline, args.tolerance)
+
+        print()
+        print('{:16s} {:>8s} {:30s} {:>10s} {:>10s} {:>8s}'.format('shape', 'nodes', 'phase', 'seconds', 'baseline', 'ratio'))
+        for name, size, key, t, tb, ratio, regression in rows:
+            print('{:16s} {:8d} {:30s} {:10.4f} {:10.4f} {:8.2f}{}'.format(name, size, key, t, tb, ratio, '  REGRESSION' if regression else ''))
+
+        if any(xx[-1] for xx in rows): return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -80,4 +80,26 @@ def square_3o():
     nodeList.append([8,-2])
     nodeList.append([4,-2])
     
-    return nodeList
\ No newline at end of file
+    return nodeList
+
+def scale_loop(nodeList, numNodes):
+    # The boundary loop nodeList with nodes added along its edges to make numNodes nodes in all.
+    # The original nodes are kept, and each edge receives a share of the new nodes in proportion
+    # to its length.
+
+    xy = np.asarray(nodeList, dtype=float).reshape(-1, 2)
+    if numNodes <= len(xy): return xy.tolist()
+
+    dxy = np.roll(xy, -1, axis=0) - xy
+    length = np.hypot(dxy[:,0], dxy[:,1])
+
+    # Share out the new nodes by the largest remainder method.
+    share = (numNodes - len(xy)) * length / length.sum()
+    extra = np.floor(share).astype(int)
+    extra[np.argsort(extra - share)[:numNodes - len(xy) - extra.sum()]] += 1
+
+    res = []
+    for p, d, k in zip(xy, dxy, extra):
+        res.extend(p + d * (np.arange(k + 1) / (k + 1))[:, None])
+
+    return np.array(res).tolist()
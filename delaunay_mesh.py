@@ -3,714 +3,1434 @@ import matplotlib.pyplot as plt
 
 from pathlib import Path
 
-from matplotlib.animation import FFMpegWriter
-
 import numpy as np
 import math
 
+from collections import deque
+
 from geometry import *
 
-from draw import draw_mesh_external 
+from draw import draw_mesh_external, meshArtist, canvasWriter
+from video import frameRecorder, writeVideo
 from mesh_utils import orderEdgesPolyline, orderEdgesLoop, findSingleElementEdges
+from topology import nodeTable, edgeTable, elementTable, edgeListView, elementListView
+from spatial_index import segmentGrid, brioOrder, hilbertIndex
+from refinement import refiner
 
 class mesh:
     def __init__(self):
-        self.nodes = []         # A list of nodes.
-        self.edges = []         # A list of edges.
-        self.elements = []      # A list of elements.
-        
+        self.nodeTable    = nodeTable()     # Node co-ordinates.
+        self.edgeTable    = edgeTable()     # Edge end nodes, parent elements and flags.
+        self.elementTable = elementTable()  # Element edges and orientations.
+
+        self.featureGrid  = segmentGrid()   # Spatial index of the feature edges.
+
         # The following data members are used when producing an animation.
         # They are initialized by a call to vplot_init() and referenced subsequently by
         # calls to vplot().
-        
+
         self.fig = None         # A matplotlib Figure object.
         self.axs = None         # A matplotlib Axis object.
         self.fpath = None       # file path for the mpeg file.
-        
+        self.writer = None      # A canvasWriter that encodes the frames.
+        self.artist = None      # A meshArtist holding the artists drawn in the previous frame.
+        self.recorder = None    # A frameRecorder that collects the frames for rendering later.
+
+        self.log = None    # An opLogWriter recording the changes to the mesh, see startLog().
+        self.stats = None  # A meshStats collecting timings and counts, see startProfile().
+
+    @property
+    def nodes(self):
+        # (N,2) array of node co-ordinates.
+        return self.nodeTable.coords
+
+    @property
+    def edges(self):
+        # Compatibility view of the edges as a list of dicts.
+        return edgeListView(self.edgeTable)
+
+    @property
+    def elements(self):
+        # Compatibility view of the elements as a list of lists of dicts.
+        return elementListView(self.elementTable)
+
     def addNodes(self, nodeList):
-        self.nodes.extend([np.array(qq) for qq in nodeList])
-        
+        self.nodeTable.extend(nodeList)
+
     def addEdges(self, edgeList):
-        edgeList = [{'nodes':ix, 'parent_elements':[], 'bnd': False} for ix in edgeList]
-        self.edges.extend(edgeList)        
-        
+        for ix in edgeList:
+            self.edgeTable.append(ix)
+
     def addElements(self, elementList):
-        
-        numElements = len(self.elements)    
-        
-        elementList = [ [{'edge':iq[0], 'orn':iq[1]} for iq in ix] for ix in elementList]
-        self.elements.extend(elementList) 
-        
+
+        numElements = len(self.elementTable)
+
+        for ix in elementList:
+            self.elementTable.append([(iq[0], iq[1]) for iq in ix])
+
         # update edge connectivity
-               
-        for ix, ee in enumerate(elementList):          
+
+        for ix, ee in enumerate(elementList):
             for xx in ee:
-                self.edges[xx['edge']]['parent_elements'].append(numElements + ix)
-    
+                self.edgeTable.addParent(xx[0], numElements + ix)
+
     def getElementNodes(self, ielem):
         res = []
-        if len(self.elements[ielem])>0:
-            iedge = self.elements[ielem][0]['edge']
-            res   = self.edges[iedge]['nodes'].copy()
-    
-            for xx in self.elements[ielem][1:]:
-                for yy in self.edges[xx['edge']]['nodes']:
+        sides = self.elementTable.getSides(ielem)
+        if len(sides)>0:
+            res = self.edgeTable.getNodes(sides[0][0])
+
+            for xx in sides[1:]:
+                for yy in self.edgeTable.getNodes(xx[0]):
                     if yy not in res: res.append(yy)
-            
+
         return res
-    
+
     def getElementOrderedNodes(self, ielem):
-        xx = self.elements[ielem]     
+        xx = self.elementTable.getSides(ielem)
         return list(self.getOrderedEdgeNodes(xx))
-    
+
+    def getElementNodeArray(self, ielems):
+        # (k,3) array of the ordered nodes of the triangles ielems (the first node of each side).
+
+        el = self.elementTable
+        return self.edgeTable.nodes[el.edges[ielems], np.where(el.orn[ielems], 0, 1)]
+
     def getOrderedEdgeNodes(self, xx):
-        
-        if len(xx)==1:          
-            nn  = self.edges[xx[0]['edge'] ]['nodes']
-            n1 = nn[0] if xx[0]['orn'] else nn[1]
-            n2 = nn[1] if xx[0]['orn'] else nn[0]
-                    
+        # xx is a list of (edge, orientation) pairs.
+
+        if len(xx)==1:
+            nn = self.edgeTable.getNodes(xx[0][0])
+            n1 = nn[0] if xx[0][1] else nn[1]
+            n2 = nn[1] if xx[0][1] else nn[0]
+
             return n1, n2
-        
+
         elif len(xx) == 3:
-            nn = self.edges[xx[0]['edge']]['nodes']
-            n1 = nn[0] if xx[0]['orn'] else nn[1]
-            nn = self.edges[xx[1]['edge']]['nodes']
-            n2 = nn[0] if xx[1]['orn'] else nn[1]
-            nn = self.edges[xx[2]['edge']]['nodes']
-            n3 = nn[0] if xx[2]['orn'] else nn[1]
-            
+            nn = self.edgeTable.getNodes(xx[0][0])
+            n1 = nn[0] if xx[0][1] else nn[1]
+            nn = self.edgeTable.getNodes(xx[1][0])
+            n2 = nn[0] if xx[1][1] else nn[1]
+            nn = self.edgeTable.getNodes(xx[2][0])
+            n3 = nn[0] if xx[2][1] else nn[1]
+
             return n1, n2, n3
-   
+
     def findEdge(self, nodes):
-        for ix, xx in enumerate(self.edges):
-             if (xx['nodes'] == nodes) | (xx['nodes'] == nodes[-1::-1]):
-                return ix
-            
-        return None
-    
-    def isElementObscured(self, ielem, txy):
+        return self.edgeTable.find(nodes[0], nodes[1])
+
+    def featuresNear(self, xyList):
+        # Feature edges whose bounding boxes overlap that of the points in xyList.
+
+        et = self.edgeTable
+
+        # Bring the grid up to date with any features added or moved since the last query.
+        for ie in et.newFeatures:
+            if et.feature[ie]:
+                self.featureGrid.insert(ie, self.nodes[et.nodes[ie, 0]], self.nodes[et.nodes[ie, 1]])
+            else:
+                self.featureGrid.remove(ie)
+        et.newFeatures = []
+
+        xs = [float(xy[0]) for xy in xyList]
+        ys = [float(xy[1]) for xy in xyList]
+
+        return self.featureGrid.query((min(xs), min(ys), max(xs), max(ys)))
+
+    def isElementObscured(self, ielem, txy, batch=None):
         # Is the view of element ielem from co-ordinate xy obscured by any feature ?
         # txy is the test point (numpy array)
-        
+
+        # Only a feature that meets the region between txy and the element can obscure it,
+        # so the search is limited to the features near that region. With batch=True the
+        # shadow tests for all of those features are evaluated in one vectorized pass, with
+        # batch=False they are evaluated one at a time. By default the vectorized pass is used
+        # once there are enough features to outweigh its fixed cost.
+
         nodes = self.getElementNodes(ielem)
-        
-        pxy1 = self.nodes[nodes[0]]
-        pxy2 = self.nodes[nodes[1]]
-        
-        if len(self.elements[ielem]) == 1: 
-            iedge = self.elements[ielem][0]['edge']
-                  
-            for ix, xx in enumerate(self.edges):
-                if not xx['feature']: continue
-                               
-                if iedge==ix:
-                    bleft = pointOnFeatureLeft(txy, pxy1, pxy2)
-                    born  = self.elements[ielem][0]['orn']                  
-                    
-                    if born & (not bleft): return True
-                    if (not born) & bleft: return True                   
-                
-                fxy1 = self.nodes[xx['nodes'][0]]
-                fxy2 = self.nodes[xx['nodes'][1]]
-                               
-                if lineInFeatureShadow(pxy1, pxy2, fxy1, fxy2, txy): return True
-                
-            return False
-        else:
-            pxy3 = self.nodes[nodes[2]]
-            
-            for ix, xx in enumerate(self.edges):
-                if not xx['feature']: continue
-                fxy1 = self.nodes[xx['nodes'][0]]
-                fxy2 = self.nodes[xx['nodes'][1]]
-                               
-                if elementInFeatureShadow(pxy1, pxy2, pxy3, fxy1, fxy2, txy): return True
-                
-            return False  
+        pxyList = [self.nodes[n] for n in nodes]
+
+        features = self.featuresNear([txy] + pxyList)
+        if len(features) == 0: return False
+
+        if self.elementTable.numSides(ielem) == 1:
+            iedge, born = self.elementTable.getSides(ielem)[0]
+
+            if iedge in features:
+                bleft = pointOnFeatureLeft(txy, pxyList[0], pxyList[1])
+
+                if born & (not bleft): return True
+                if (not born) & bleft: return True
+
+        if batch is None: batch = len(features) >= 8
+
+        if batch:
+            if self.stats is not None: self.stats.shadowTests += len(features)
+            fxy = self.nodes[self.edgeTable.nodes[features]]
+            return bool(elementInFeatureShadowBatch(pxyList, fxy, txy).any())
+
+        for ix in features:
+            if self.stats is not None: self.stats.shadowTests += 1
+            fn = self.edgeTable.nodes[ix]
+            fxy1 = self.nodes[fn[0]]
+            fxy2 = self.nodes[fn[1]]
+
+            if len(pxyList) == 2:
+                if lineInFeatureShadow(pxyList[0], pxyList[1], fxy1, fxy2, txy): return True
+            else:
+                if elementInFeatureShadow(pxyList[0], pxyList[1], pxyList[2], fxy1, fxy2, txy): return True
+
+        return False
 
     def remove_element(self, ix, xx, islist, iolist):
-          
-        if xx[0]['edge'] not in islist: islist[xx[0]['edge']] = 0
-        if xx[1]['edge'] not in islist: islist[xx[1]['edge']] = 0
-        if xx[2]['edge'] not in islist: islist[xx[2]['edge']] = 0
-            
-        islist[xx[0]['edge']] += 1
-        islist[xx[1]['edge']] += 1
-        islist[xx[2]['edge']] += 1
-        
-        iolist[xx[0]['edge']] = xx[0]['orn']
-        iolist[xx[1]['edge']] = xx[1]['orn']
-        iolist[xx[2]['edge']] = xx[2]['orn']
-        
-        pelist = self.edges[xx[0]['edge']]['parent_elements']
-        if ix in pelist: pelist.remove(ix)
-        pelist = self.edges[xx[1]['edge']]['parent_elements']
-        if ix in pelist: pelist.remove(ix)
-        pelist = self.edges[xx[2]['edge']]['parent_elements']
-        if ix in pelist: pelist.remove(ix)
-    
-    def identifyAffectedElements(self, nodes, checkVisibility=False):
-    
-        if len(nodes)<2: 
+
+        for iedge, orn in xx:
+            if iedge not in islist: islist[iedge] = 0
+            islist[iedge] += 1
+            iolist[iedge] = orn
+
+        for iedge, orn in xx:
+            self.edgeTable.removeParent(iedge, ix)
+
+    def isElementPenetrated(self, xyprev, xynew, pxy1, pxy2, pxy3):
+        # Does the new feature [xyprev, xynew] penetrate the element with corners pxy1, pxy2, pxy3 ?
+
+        for pxya, pxyb in ((pxy1, pxy2), (pxy1, pxy3), (pxy2, pxy3)):
+            if segmentsCross(xyprev, xynew, pxya, pxyb): return True
+
+        return False
+
+    def isCavityCandidate(self, ielem, xynew, xyprev=None):
+        # Could element ielem be deleted by the insertion of xynew ? This is the geometric part of
+        # the test in identifyAffectedElements - visibility is not considered here.
+
+        xx = self.elementTable.getSides(ielem)
+
+        if len(xx)==1:
+            n1, n2 = self.getOrderedEdgeNodes(xx)
+            return pointInBoundaryElement(xynew, self.nodes[n1], self.nodes[n2])
+
+        elif len(xx)==3:
+            n1, n2, n3 = self.getOrderedEdgeNodes(xx)
+
+            if self.stats is not None: self.stats.inCircleTests += 1
+            if point_in_ccircle(xynew, self.nodes[n1], self.nodes[n2], self.nodes[n3]): return True
+
+            if xyprev is not None:
+                return self.isElementPenetrated(xyprev, xynew, self.nodes[n1], self.nodes[n2], self.nodes[n3])
+
+        return False
+
+    def neighbourAcross(self, ielem, iedge):
+        # The element on the other side of edge iedge from element ielem (None if there isn't one).
+
+        et = self.edgeTable
+        for ip in range(et.npar[iedge]):
+            if et.parents[iedge, ip] != ielem: return int(et.parents[iedge, ip])
+
+        return None
+
+    def pivotToBoundaryElement(self, ielem, iedge, inode):
+        # Starting from the boundary element ielem, rotate about node inode (one of the
+        # nodes of its edge iedge) until the adjacent boundary element is reached.
+
+        et = self.edgeTable
+
+        for istep in range(len(self.elementTable)):
+            ielem = self.neighbourAcross(ielem, iedge)
+            if ielem is None: return None
+
+            xx = self.elementTable.getSides(ielem)
+            if len(xx) == 1: return ielem
+            if len(xx) != 3: return None
+
+            iedge = next((ie for ie, orn in xx if (ie != iedge) & (inode in et.nodes[ie])), None)
+            if iedge is None: return None
+
+        return None
+
+    def elementNeighbours(self, ielem):
+        # Elements adjacent to ielem. Boundary elements are adjacent to the triangle
+        # across their edge and to the boundary elements either side of them.
+
+        xx = self.elementTable.getSides(ielem)
+        res = [self.neighbourAcross(ielem, ie) for ie, orn in xx]
+
+        if len(xx)==1:
+            for inode in self.getOrderedEdgeNodes(xx):
+                res.append(self.pivotToBoundaryElement(ielem, xx[0][0], inode))
+
+        return [iel for iel in res if iel is not None]
+
+    def locateElement(self, xy, ielem):
+        # Walk from element ielem towards co-ordinate xy. Returns the triangle that contains xy,
+        # or the boundary element beyond which it lies if xy is outside the hull. Returns None
+        # if the walk cannot be completed.
+
+        for istep in range(len(self.elementTable) + 1):
+            xx = self.elementTable.getSides(ielem)
+
+            if len(xx)==1:
+                n1, n2 = self.getOrderedEdgeNodes(xx)
+                if pointOnFeatureLeft(xy, self.nodes[n1], self.nodes[n2]): return ielem
+                inext = self.neighbourAcross(ielem, xx[0][0])
+
+            elif len(xx)==3:
+                nn = self.getOrderedEdgeNodes(xx)
+                inext = ielem
+
+                # Leave through the first side that has xy to its right. The starting side
+                # is rotated on each step so that the walk cannot cycle.
+                for k in range(3):
+                    ik = (istep + k) % 3
+                    if orientation(self.nodes[nn[ik]], self.nodes[nn[(ik+1) % 3]], xy) < 0:
+                        inext = self.neighbourAcross(ielem, xx[ik][0])
+                        break
+
+                if inext == ielem: return ielem
+            else:
+                return None
+
+            if inext is None: return None
+            ielem = inext
+
+        return None
+
+    def findCavityCandidates(self, xynew, xyprev=None):
+        # Locate an element that is affected by the insertion of xynew and grow the cavity from it
+        # breadth-first across element edges. Returns the sorted list of elements that pass the
+        # isCavityCandidate test, or None if no starting element could be found.
+
+        el = self.elementTable
+
+        # Walk from the most recently created element, or failing that the last live one.
+        istart = el.last
+        if istart is None or el.nside[istart] == 0:
+            live = np.flatnonzero(el.nside[:len(el)] > 0)
+            if len(live) == 0: return None
+            istart = live[-1]
+
+        iseed = self.locateElement(xynew, istart)
+        if iseed is None: return None
+        if not self.isCavityCandidate(iseed, xynew, xyprev): return None
+
+        candidates = []
+        visited = {iseed}
+        queue = deque([iseed])
+
+        while queue:
+            ielem = queue.popleft()
+            if not self.isCavityCandidate(ielem, xynew, xyprev): continue
+
+            candidates.append(ielem)
+
+            for iel in self.elementNeighbours(ielem):
+                if iel not in visited:
+                    visited.add(iel)
+                    queue.append(iel)
+
+        return sorted(candidates)
+
+    def filterCavityCandidates(self, xynew, xyprev=None):
+        # Vectorized equivalent of applying isCavityCandidate to every element: the batch
+        # predicates are evaluated for all triangles and boundary elements in one pass.
+        # The penetration test is replaced by a conservative segment contact test.
+
+        el = self.elementTable
+        et = self.edgeTable
+        xy = self.nodes
+
+        itri = el.triangles()
+        nn = self.getElementNodeArray(itri)
+        if self.stats is not None: self.stats.inCircleTests += len(itri)
+        mask = point_in_ccircle_batch(xynew, xy[nn[:,0]], xy[nn[:,1]], xy[nn[:,2]])
+
+        if xyprev is not None:
+            for k in range(3):
+                mask |= segmentsTouchBatch(xyprev, xynew, xy[nn[:,k]], xy[nn[:,(k+1) % 3]])
+
+        ibnd = np.flatnonzero(el.nside[:len(el)] == 1)
+        ie = el.edges[ibnd, 0]
+        orn = el.orn[ibnd, 0]
+        bmask = pointInBoundaryElementBatch(xynew, xy[et.nodes[ie, np.where(orn, 0, 1)]], xy[et.nodes[ie, np.where(orn, 1, 0)]])
+
+        return np.sort(np.concatenate([itri[mask], ibnd[bmask]])).tolist()
+
+    def identifyAffectedElements(self, nodes, checkVisibility=False, search='walk'):
+
+        # search='walk' only examines the elements found by findCavityCandidates, search='vector'
+        # those that pass filterCavityCandidates and search='scan' examines every element in the mesh.
+
+        if len(nodes)<2:
             xynew = nodes[0]
+            xyprev = None
         else:
             xynew = self.nodes[nodes[1]]
-        
+            xyprev = self.nodes[nodes[0]] if checkVisibility else None
+
         # node - co-ordinates of the new node.
-    
+
         islist = {} # holder for the edge connectivity counts
         iolist = {} # holder for the orientations.
-        
+
         affectedElements = [] # List of candidate elements to be deleted, not considering features.
-    
-        for ix, xx in enumerate(self.elements):
-            if len(xx) <1: 
+
+        candidates = None
+        if search == 'walk':
+            candidates = self.findCavityCandidates(xynew, xyprev)
+        elif search == 'vector':
+            candidates = self.filterCavityCandidates(xynew, xyprev)
+        elif search != 'scan':
+            raise ValueError("Unknown search method '{}'.".format(search))
+
+        if candidates is None: candidates = range(len(self.elementTable))
+
+        for ix in candidates:
+            xx = self.elementTable.getSides(ix)
+
+            if len(xx) <1:
                 continue
             elif len(xx)==1:
                 # xx is a boundary element.
-                
+
                 n1, n2 = self.getOrderedEdgeNodes(xx)
-                
-                disc = pointOnFeatureLeft(xynew, self.nodes[n1], self.nodes[n2])
-                             
-                if disc>0.0:
-                    # The new node is to the left of [a, b]
-                    if checkVisibility:                     
-                        if self.isElementObscured(ix, xynew): 
+
+                if pointInBoundaryElement(xynew, self.nodes[n1], self.nodes[n2]):
+                    # The new node is to the left of [a, b], or on it
+                    if checkVisibility:
+                        if self.isElementObscured(ix, xynew):
                             continue
-                 
+
                     affectedElements.append(ix)
-                    
-                    if xx[0]['edge'] not in islist: islist[xx[0]['edge']] = 0
-                    islist[xx[0]['edge']] += 1
-                    iolist[xx[0]['edge']] = xx[0]['orn']
-                    pelist = self.edges[xx[0]['edge']]['parent_elements']
-                    if ix in pelist: pelist.remove(ix)
-                
-            else: 
+
+                    iedge, orn = xx[0]
+                    if iedge not in islist: islist[iedge] = 0
+                    islist[iedge] += 1
+                    iolist[iedge] = orn
+                    self.edgeTable.removeParent(iedge, ix)
+
+            else:
                 n1, n2, n3 = self.getOrderedEdgeNodes(xx)
-               
+
+                if self.stats is not None: self.stats.inCircleTests += 1
                 if point_in_ccircle(xynew, self.nodes[n1], self.nodes[n2], self.nodes[n3]):
-        
-                    if checkVisibility:                    
-                        if self.isElementObscured(ix, xynew): 
+
+                    if checkVisibility:
+                        if self.isElementObscured(ix, xynew):
                             continue
-                    
+
                     affectedElements.append(ix)
                     self.remove_element(ix, xx, islist, iolist)
-                    
+
                     continue
-                    
+
                 # Does the new feature given by 'nodes' penetrate the element ?
-                
-                bBadElement = False
-                
+
                 if checkVisibility:
-                
-                    xyprev = self.nodes[nodes[0]]               
-                    bnorm = xyprev - xynew
-                    bnorm = bnorm / np.linalg.norm(bnorm)  
-                
-                    if not bBadElement:
-                        bint1 = lineInRayPath(xyprev,-bnorm, self.nodes[n1], self.nodes[n2])
-                        bint2 = lineInRayPath(xynew,  bnorm, self.nodes[n1], self.nodes[n2])
-                        if bint1 & bint2: bBadElement  = True                      
-                    
-                    if not bBadElement:
-                        bint1 = lineInRayPath(xyprev,-bnorm, self.nodes[n1], self.nodes[n3])
-                        bint2 = lineInRayPath(xynew,  bnorm, self.nodes[n1], self.nodes[n3])
-                        if bint1 & bint2: bBadElement  = True    
-                    
-                    if not bBadElement:
-                        bint1 = lineInRayPath(xyprev,-bnorm, self.nodes[n2], self.nodes[n3])
-                        bint2 = lineInRayPath(xynew,  bnorm, self.nodes[n2], self.nodes[n3])
-                        if bint1 & bint2: bBadElement  = True 
-  
-                    if bBadElement:   
+                    if self.isElementPenetrated(xyprev, xynew, self.nodes[n1], self.nodes[n2], self.nodes[n3]):
                         affectedElements.append(ix)
                         self.remove_element(ix, xx, islist, iolist)
-                        
+
         return islist, iolist, affectedElements
-    
+
+    def orderCavityEdges(self, ielist, polyline):
+        # The edges ielist that bound a cavity, in order along an open polyline (if the cavity
+        # reaches the hull) or around a closed loop.
+
+        return orderEdgesPolyline(ielist) if polyline else orderEdgesLoop(ielist)
+
+    def releaseCavity(self, TBDList, islist):
+        # Delete the elements of a cavity, together with the edges that lay inside it
+        # (those referenced by two of its elements), so that their slots can be reused
+        # by the elements that fill the cavity. Feature edges are never deleted here.
+
+        et = self.edgeTable
+
+        for ix in TBDList:
+            self.elementTable.release(ix)
+
+        for ie, count in islist.items():
+            if count == 2 and et.npar[ie] == 0 and not et.feature[ie]:
+                et.release(ie)
+
     def createElementsPolyline(self, ielist2, inode):
-        
-        # Generate the new edges.             
-            
-        numEdges       = len(self.edges)
-        numElements    = len(self.elements) 
+        # Fill an open cavity with a fan of triangles about node inode. Returns the new triangles.
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        # Allocate the new edges and elements: one triangle per edge of ielist2,
+        # followed by the two boundary elements.
+
         numNewElements = len(ielist2)
-        
-        # Create indices for the boundary elements.
-        ielBnd0 = numElements + numNewElements
-        ielBnd1 = numElements + numNewElements + 1
-        
+
+        inew = [el.allocate() for ix in range(numNewElements + 2)]
+        ienew = [et.allocate() for ix in range(numNewElements + 1)]
+
+        ielBnd0 = inew[numNewElements]
+        ielBnd1 = inew[numNewElements + 1]
+
         for ix, q in enumerate(ielist2):
-            
-            iel1 = numElements+ix
-            iel2 = numElements+ix-1
-            
-            self.edges[q[0]]['parent_elements'].append(iel1)        
-            
+
+            iel1 = inew[ix]
+            iel2 = inew[ix-1]
+
+            et.addParent(q[0], iel1)
+
             if ix==0:
                 # First element.
-                self.edges.append({'nodes':[q[2], inode], 'parent_elements':[iel1, ielBnd0], 'bnd':True, 'feature':False})
+                et.assign(ienew[0], [q[2], inode], [iel1, ielBnd0], bnd=True)
 
                 if numNewElements == 1:
-                    self.edges.append({'nodes':[q[3], inode], 'parent_elements':[ielBnd1, iel1], 'bnd':True, 'feature':False})
-                    
+                    et.assign(ienew[1], [q[3], inode], [ielBnd1, iel1], bnd=True)
+
             elif ix==numNewElements-1:
                 # Last element.
-                self.edges.append({'nodes':[q[2], inode], 'parent_elements':[iel1, iel2], 'bnd':False, 'feature':False})
-                self.edges.append({'nodes':[q[3], inode], 'parent_elements':[ielBnd1, iel1], 'bnd':True, 'feature':False})
+                et.assign(ienew[ix], [q[2], inode], [iel1, iel2])
+                et.assign(ienew[ix+1], [q[3], inode], [ielBnd1, iel1], bnd=True)
             else:
-                # Intermediate element.                             
-                self.edges.append({'nodes':[q[2], inode], 'parent_elements':[iel1, iel2], 'bnd':False, 'feature':False})
-                               
-            is1 = {'edge': q[0], 'orn':q[1]}
-            is2 = {'edge': numEdges+ix+1, 'orn':True}
-            is3 = {'edge': numEdges+ix, 'orn':False}
-            
-            self.elements.append([is1, is2, is3])
-            
-            iel1 = self.edges[q[0]]['parent_elements'][0]
-            iel2 = self.edges[q[0]]['parent_elements'][1]
-            
-            if(len(self.elements[iel1])==3 & len(self.elements[iel2])==3): self.edges[q[0]]['bnd'] = False
-        
+                # Intermediate element.
+                et.assign(ienew[ix], [q[2], inode], [iel1, iel2])
+
+            is1 = (q[0], q[1])
+            is2 = (ienew[ix+1], True)
+            is3 = (ienew[ix], False)
+
+            el.setSides(iel1, [is1, is2, is3])
+
+            iel1, iel2 = et.getParents(q[0])[:2]
+
+            if el.numSides(iel1)==3 and el.numSides(iel2)==3: et.setBnd(q[0], False)
+
         # Create the boundary elements.
-        is1 = {'edge': numEdges, 'orn':True}
-        self.elements.append([is1])
-        
-        is1 = {'edge': numEdges+numNewElements, 'orn':False}
-        self.elements.append([is1])
-        
+        el.setSides(ielBnd0, [(ienew[0], True)])
+        el.setSides(ielBnd1, [(ienew[numNewElements], False)])
+
+        return inew[:numNewElements]
+
     def createElementsLoop(self, ielist2, inode):
-        # Generate the new edges.             
-            
-        numEdges       = len(self.edges)
-        numElements    = len(self.elements)   
-        numNewElements = len(ielist2) 
-        
+        # Fill a closed cavity with a fan of triangles about node inode. Returns the new triangles.
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        # Allocate the new edges and elements, one of each per edge of ielist2.
+        # Element ix lies between new edges ix and ix+1, wrapping round at the end.
+
+        numNewElements = len(ielist2)
+
+        inew = [el.allocate() for ix in range(numNewElements)]
+        ienew = [et.allocate() for ix in range(numNewElements)]
+
         for ix, q in enumerate(ielist2):
-            
-            ienew = numElements + ix
-            self.edges[q[0]]['parent_elements'].append(ienew)
-            self.edges.append({'nodes':[q[2], inode], 'parent_elements':[ienew, ienew-1], 'bnd':False, 'feature':False})
-                               
-            is1 = {'edge': q[0], 'orn':q[1]}
-            is2 = {'edge': numEdges+ix+1, 'orn':True}
-            is3 = {'edge': numEdges+ix, 'orn':False}
-                               
-            self.elements.append([is1, is2, is3])
-        
-        iel = numElements + numNewElements - 1
-        self.elements[iel][1]['edge'] = numEdges
-        self.edges[numEdges]['parent_elements'][1] = len(self.elements) - 1
-        
-    def removeNonFeatureBoundaryEdges(self):    
-        bCont = True
-        
-        while(bCont):
-
-            bCont = False
-            edgeRemovalList = []
-        
-            for ix, xx in enumerate(self.edges):
-                if len(xx['parent_elements']) > 0:
-                    if (xx['bnd']) & (not xx['feature']):
-                        edgeRemovalList.append(ix)
-                        
-            for ie in edgeRemovalList:
-                for iel in self.edges[ie]['parent_elements']:
-                    xxdel = None
-                    for xx in self.elements[iel]:
-                        if xx['edge'] == ie:
-                            xxdel = xx
-                            break
-                    if xxdel: self.elements[iel].remove(xxdel)
-                    edgeList = [xx['edge'] for xx in self.elements[iel]]
-                    
-                    for iedge in edgeList:
-                        self.edges[iedge]['bnd'] = True
-                    
-                self.edges[ie]['parent_elements'] = []
-            
-            if len(edgeRemovalList) > 0: bCont = True      
-                
+
+            et.addParent(q[0], inew[ix])
+            et.assign(ienew[ix], [q[2], inode], [inew[ix], inew[ix-1]])
+
+            is1 = (q[0], q[1])
+            is2 = (ienew[(ix+1) % numNewElements], True)
+            is3 = (ienew[ix], False)
+
+            el.setSides(inew[ix], [is1, is2, is3])
+
+        return inew
+
+    def removeNonFeatureBoundaryEdges(self):
+        # Remove the elements that lie outside the features. The exterior is flood filled,
+        # breadth-first, from the elements on the non-feature hull edges, crossing any edge
+        # that is not a feature. Each exterior element loses its non-feature sides and is
+        # deleted once it has none left; its feature sides are marked as boundary edges.
+        # Returns the number of elements deleted.
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        numEdges = len(et)
+        seeds = np.flatnonzero((et.npar[:numEdges] > 0) & et.bnd[:numEdges] & ~et.feature[:numEdges])
+
+        visited = set()
+        queue = deque()
+
+        for ie in seeds:
+            for iel in et.getParents(ie):
+                if iel not in visited:
+                    visited.add(iel)
+                    queue.append(iel)
+
+        numRemoved = 0
+
+        while queue:
+            iel = queue.popleft()
+
+            for ie, orn in el.getSides(iel):
+                if et.feature[ie]:
+                    et.setBnd(ie)
+                    continue
+
+                for ielNext in et.getParents(ie):
+                    el.removeSide(ielNext, ie)
+
+                    if ielNext not in visited:
+                        visited.add(ielNext)
+                        queue.append(ielNext)
+
+                et.release(ie)
+
+            if el.numSides(iel) == 0:
+                el.release(iel)
+                numRemoved += 1
+
+        self.logStep()
+
+        return numRemoved
+
+    def addTriangulation(self, nodes, triangles, features=()):
+        # Build the mesh from arrays (the inverse of toArrays): nodes - (N,2) node co-ordinates,
+        # triangles - (T,3) node numbers of each triangle, in either orientation, and features -
+        # (F,2) end nodes of the edges to be marked as features. The mesh must be empty.
+        # Edges with a triangle on one side only are boundary edges with a single parent.
+
+        if len(self.nodeTable) > 0:
+            raise ValueError("addTriangulation requires an empty mesh.")
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        nodes = np.asarray(nodes, dtype=float).reshape(-1, 2)
+        tri = np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+        cw = orientation_batch(nodes[tri[:,0]], nodes[tri[:,1]], nodes[tri[:,2]]) < 0
+        tri[cw] = tri[cw][:, ::-1]
+
+        self.nodeTable.extend(nodes)
+
+        # Side k of each triangle runs from its node k to node k+1.
+        n1 = tri.reshape(-1)
+        n2 = np.roll(tri, -1, axis=1).reshape(-1)
+        keys = np.stack([np.minimum(n1, n2), np.maximum(n1, n2)], axis=1)
+
+        edgeNodes, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+        if len(counts) > 0 and counts.max() > 2:
+            raise ValueError("An edge is shared by more than two triangles.")
+
+        numEdges = len(edgeNodes)
+        numTriangles = len(tri)
+
+        et.reserve(numEdges)
+        et.count = numEdges
+        et.nodes[:numEdges] = edgeNodes
+        et.npar[:numEdges] = counts
+        et.bnd[:numEdges] = counts == 1
+
+        owner = np.argsort(inverse, kind='stable')
+        first = np.cumsum(counts) - counts
+        et.parents[:numEdges, 0] = owner[first] // 3
+        second = np.flatnonzero(counts == 2)
+        et.parents[second, 1] = owner[first[second] + 1] // 3
+
+        el.reserve(numTriangles)
+        el.count = numTriangles
+        el.edges[:numTriangles] = inverse.reshape(-1, 3)
+        el.orn[:numTriangles] = (n1 < n2).reshape(-1, 3)
+        el.nside[:numTriangles] = 3
+
+        et.touchAll()
+        el.touchAll()
+        et.reindex()
+
+        for n1, n2 in np.asarray(features, dtype=np.int64).reshape(-1, 2):
+            ie = et.find(n1, n2)
+            if ie is None:
+                raise ValueError("Feature edge {} - {} is not an edge of the triangulation.".format(n1, n2))
+            et.setFeature(ie)
+
+        self.logStep()
+
+    def toArrays(self):
+        # The mesh as plain arrays: 'nodes' - (N,2) node co-ordinates, 'triangles' - (T,3) node
+        # numbers of each triangle (counter-clockwise) and 'features' - (F,2) end nodes of each
+        # feature edge.
+
+        et = self.edgeTable
+        live = (et.npar[:len(et)] > 0) & et.feature[:len(et)]
+
+        return {'nodes':     self.nodes.copy(),
+                'triangles': self.getElementNodeArray(self.elementTable.triangles()).astype(np.int32),
+                'features':  et.nodes[:len(et)][live].astype(np.int32)}
+
+    def compact(self):
+        # Renumber the edges and elements so that the slots of deleted entities are squeezed
+        # out, remapping every reference to them. Returns the old-to-new maps
+        # (edgeMap, elementMap) as integer arrays, with -1 for the entities that were deleted.
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        edgeMap = et.compact()
+        elementMap = el.compact()
+
+        parents = et.parents[:len(et)]
+        parents[parents >= 0] = elementMap[parents[parents >= 0]]
+
+        sides = np.arange(3) < el.nside[:len(el), None]
+        el.edges[:len(el)][sides] = edgeMap[el.edges[:len(el)][sides]]
+
+        # The feature grid is keyed by edge, so rebuild it from scratch.
+        self.featureGrid = segmentGrid()
+        et.newFeatures = np.flatnonzero(et.feature[:len(et)]).tolist()
+
+        self.logStep()
+
+        return edgeMap, elementMap
+
+    def save(self, path):
+        # Save the mesh to the .npz file 'path' (see storage.py) as the flat arrays of its tables,
+        # deleted slots included, so that mesh.load() gives back the same edge and element numbers.
+        # Returns the path written, with '.npz' appended if it was missing.
+
+        from storage import saveArrays, FORMAT_VERSION
+
+        et = self.edgeTable
+        el = self.elementTable
+        numEdges = len(et)
+        numElements = len(el)
+
+        return saveArrays(path, {'version':      np.array(FORMAT_VERSION),
+                                 'nodes':        self.nodes,
+                                 'edgeNodes':    et.nodes[:numEdges],
+                                 'edgeParents':  et.parents[:numEdges],
+                                 'edgeNpar':     et.npar[:numEdges],
+                                 'edgeBnd':      et.bnd[:numEdges],
+                                 'edgeFeature':  et.feature[:numEdges],
+                                 'edgeFree':     np.array(et.free, dtype=np.int64),
+                                 'elementEdges': el.edges[:numElements],
+                                 'elementOrn':   el.orn[:numElements],
+                                 'elementNside': el.nside[:numElements],
+                                 'elementFree':  np.array(el.free, dtype=np.int64)})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # A mesh read from a file written by save(). With mmap=True the tables are memory-mapped
+        # from the file rather than read: the mesh opens at once and its arrays (nodes, edgeTable.nodes,
+        # etc.) can be used in place. It can still be modified, copy-on-write; the file is unchanged.
+
+        from storage import loadArrays, FORMAT_VERSION
+
+        data = loadArrays(path, mmap=mmap)
+        if int(data.get('version', -1)) != FORMAT_VERSION:
+            raise ValueError("{} is not a mesh file of version {}.".format(path, FORMAT_VERSION))
+
+        m = cls()
+
+        nt = m.nodeTable
+        nt.xy = data['nodes']
+        nt.count = len(nt.xy)
+
+        et = m.edgeTable
+        et.nodes   = data['edgeNodes']
+        et.parents = data['edgeParents']
+        et.npar    = data['edgeNpar']
+        et.bnd     = data['edgeBnd']
+        et.feature = data['edgeFeature']
+        et.count   = len(et.nodes)
+        et.free    = data['edgeFree'].tolist()
+        et.invalidateIndex()
+        et.newFeatures = np.flatnonzero(et.feature).tolist()
+
+        el = m.elementTable
+        el.edges = data['elementEdges']
+        el.orn   = data['elementOrn']
+        el.nside = data['elementNside']
+        el.count = len(el.edges)
+        el.free  = data['elementFree'].tolist()
+
+        return m
+
+    def validate(self, features=None, delaunay=True):
+        # Check the invariants of the mesh on the arrays of its tables (see validation.py): that every
+        # side of an element joins existing nodes ('nodes'), that every triangle is counter-clockwise
+        # ('orientation'), that the parents of the edges agree with the sides of the elements
+        # ('connectivity'), that every feature edge is present ('featureEdges') and that the (F,2) node
+        # pairs in features, if given, are joined by feature edges ('featurePairs') and, if delaunay is
+        # True, that no triangle has the apex of its neighbour across an interior non-feature edge in
+        # its circumcircle ('delaunay'). Returns a dict of check -> offending element numbers (edge
+        # numbers for 'featureEdges', row numbers of features for 'featurePairs'), all of which are
+        # empty if the mesh is valid.
+
+        from validation import validateMesh
+
+        return validateMesh(self, features, delaunay)
+
+    def quality(self, bins=20):
+        # Quality measures of every triangle, computed in one batched pass (see quality.py). Returns a
+        # dict of arrays, one entry per triangle: 'elements' - the element numbers, 'minAngle' and
+        # 'maxAngle' - the smallest and largest angles (degrees), 'radiusEdge' - circumradius divided by
+        # shortest side and 'area' - signed area. Also 'histograms' - (counts, bin edges) of each measure,
+        # with 'bins' bins, and 'summary' - their extreme values and the number of inverted triangles.
+
+        from quality import meshQuality
+
+        return meshQuality(self, bins)
+
+    def export(self, path, format=None, chunksize=None):
+        # Write the nodes, triangles and hull and feature edges to 'path' for use by another program
+        # (see export.py). format is '.vtk' (legacy VTK), '.msh' (Gmsh 4.1) or '.obj' (Wavefront);
+        # by default it is taken from the extension of path.
+
+        from export import writers, CHUNKSIZE
+
+        if format is None: format = Path(path).suffix
+        format = '.' + format.lower().lstrip('.')
+        if format not in writers:
+            raise ValueError("Cannot export to {} files; the formats are {}.".format(format, ', '.join(writers)))
+
+        writers[format](self, path, CHUNKSIZE if chunksize is None else chunksize)
+
     def insertNode(self, node):
-        
-        numNodes = len(self.nodes)
-        self.nodes.append(node)
-        
+
+        numNodes = len(self.nodeTable)
+        self.nodeTable.append(node)
+        node = self.nodes[numNodes]
+
         if numNodes == 0:
+            self.logStep()
             return
         if numNodes == 1:
-            self.edges.append({'nodes':[0,1], 'parent_elements':[], 'bnd':False, 'feature':False})
+            self.edgeTable.append([0,1])
         elif numNodes == 2:
-            
-            self.edges.append({'nodes':[0,2], 'parent_elements':[0,2], 'bnd':True, 'feature':False})
-            self.edges.append({'nodes':[1,2], 'parent_elements':[0,3], 'bnd':True, 'feature':False})
-            self.edges[0]['parent_elements'] = [0,1]
-            self.edges[0]['bnd'] = True
-            
-            v1 = np.array(self.nodes[1]) - np.array(self.nodes[0])
-            v2 = np.array(node) - np.array(self.nodes[0])
-            disc = np.cross(v1, v2)
-            if disc>0.0:
-                self.elements.append([{'edge':0, 'orn':True}, {'edge':2, 'orn':True}, {'edge':1, 'orn':False}])
-                self.elements.append([{'edge':0, 'orn':False}])              
-                self.elements.append([{'edge':1, 'orn':True}])
-                self.elements.append([{'edge':2, 'orn':False}])
+
+            self.edgeTable.append([0,2], [0,2], bnd=True)
+            self.edgeTable.append([1,2], [0,3], bnd=True)
+            self.edgeTable.setParents(0, [0,1])
+            self.edgeTable.setBnd(0)
+
+            disc = orientation(self.nodes[0], self.nodes[1], node)
+            if disc>0:
+                self.elementTable.append([(0, True), (2, True), (1, False)])
+                self.elementTable.append([(0, False)])
+                self.elementTable.append([(1, True)])
+                self.elementTable.append([(2, False)])
             else:
-                self.elements.append([{'edge':0, 'orn':False}, {'edge':1, 'orn':True}, {'edge':2, 'orn':False}])
-                self.elements.append([{'edge':0, 'orn':True}])
-                self.elements.append([{'edge':1, 'orn':False}])
-                self.elements.append([{'edge':2, 'orn':True}])
-                
-            
+                self.elementTable.append([(0, False), (1, True), (2, False)])
+                self.elementTable.append([(0, True)])
+                self.elementTable.append([(1, False)])
+                self.elementTable.append([(2, True)])
+
+
         else:
             # For which elements is the node in the circumcricle ?
-            
+
             TBDList = [] # A list of elements to be deleted.
             islist = {} # holder for the edge connectivity counts
             iolist = {} # holder for the orientations.
-            
+
             bBoundaryElement = False
-            
+
             nodes = [node]
-            
+
             islist, iolist, TBDList = self.identifyAffectedElements(nodes)
-            
+
             for ix in TBDList:
-                if len(self.elements[ix]) == 1: bBoundaryElement = True
-            
+                if self.elementTable.numSides(ix) == 1: bBoundaryElement = True
+
             # Make a list of edges that are referenced by one element only.
-            
-            #ielist = self.findSingleElementEdges(islist, iolist)
-            ielist = findSingleElementEdges(islist, iolist, self.edges)
-                    
-            # Order the edges. 
-            
+
+            ielist = findSingleElementEdges(islist, iolist, self.edgeTable)
+
+            # Order the edges.
+
+            ielist2 = self.orderCavityEdges(ielist, bBoundaryElement)
+
+            # Delete the cavity, then fill it with the new edges and elements.
+
+            self.releaseCavity(TBDList, islist)
+
             if bBoundaryElement:
-                ielist2 = orderEdgesPolyline(ielist)            
-            else: 
-                ielist2 = orderEdgesLoop(ielist)
-                
-            # Generate the new edges.             
-            
-            numEdges       = len(self.edges)
-            numElements    = len(self.elements)         
-            numNewElements = len(ielist2)
-                     
-            if bBoundaryElement:               
-                self.createElementsPolyline(ielist2, numNodes)             
+                self.createElementsPolyline(ielist2, numNodes)
             else:
                 self.createElementsLoop(ielist2, numNodes)
-            
-            # Delete elements.
-            for ix in TBDList:
-                self.elements[ix] = [] 
-        
+
+        self.logStep()
+
+    def orderFirstTriangle(self, xy, perm):
+        # The nodes xy are to be inserted in the order perm. The first three nodes of the mesh make
+        # its first triangle, so they must not be collinear: if they would be, perm is changed, in
+        # place, to insert a node off their line third. Raises ValueError if there is no such node.
+
+        numNodes = len(self.nodeTable)
+        if numNodes > 2 or numNodes + len(perm) < 3: return
+
+        seq = np.concatenate([self.nodes[:numNodes], xy[perm]])
+
+        k = next((k for k in range(2, len(seq)) if orientation(seq[0], seq[1], seq[k]) != 0), None)
+        if k is None: raise ValueError("The nodes are collinear.")
+
+        k0, k = 2 - numNodes, k - numNodes
+        perm[[k0, k]] = perm[[k, k0]]
+
+    def insertNodes(self, points, order='brio', seed=None):
+        # Insert a batch of nodes, e.g. a scattered point cloud, by Bowyer-Watson insertion.
+        # order='brio' inserts them in biased randomized rounds, each sorted along a Hilbert
+        # curve, order='hilbert' sorts the whole batch along the curve and order=None keeps
+        # the order given. seed seeds the random number generator used by 'brio'.
+        # Points repeated within the batch are inserted once.
+        # Returns the node number given to each of the points.
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+
+        uniq, inverse = np.unique(points, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        if order == 'brio':
+            perm = brioOrder(uniq, np.random.default_rng(seed))
+        elif order == 'hilbert':
+            perm = np.argsort(hilbertIndex(uniq), kind='stable')
+        elif order is None:
+            # Keep the order of first occurrence.
+            first = np.full(len(uniq), len(points))
+            np.minimum.at(first, inverse, np.arange(len(points)))
+            perm = np.argsort(first, kind='stable')
+        else:
+            raise ValueError("Unknown insertion order '{}'.".format(order))
+
+        self.orderFirstTriangle(uniq, perm)
+
+        nodeIds = np.empty(len(uniq), dtype=np.int64)
+        nodeIds[perm] = len(self.nodeTable) + np.arange(len(uniq))
+
+        for ix in perm:
+            self.insertNode(uniq[ix])
+
+        return nodeIds[inverse]
+
+    def refine(self, min_angle=20.0, max_area=None, sizing_fn=None, max_nodes=None):
+        # Delaunay refinement of the mesh (Ruppert's algorithm): insert nodes until no triangle
+        # has an angle smaller than min_angle (degrees) or an area larger than max_area. Instead
+        # of max_area, sizing_fn may be given: it is called with an (N,2) array of triangle
+        # centroids and returns the largest area allowed at each. Angles of up to about 30
+        # degrees can be expected to be met, except next to sharp corners of the boundary.
+        # max_nodes limits the number of nodes inserted. Returns the number of nodes inserted.
+
+        return refiner(self, min_angle, max_area, sizing_fn).run(max_nodes)
+
     def flip(self, iedge):
-        
-        if self.edges[iedge]['bnd']: return
-            
-        if len(self.edges[iedge]['parent_elements']) == 2:
+
+        et = self.edgeTable
+
+        if et.bnd[iedge]: return
+
+        if et.numParents(iedge) == 2:
             # Flip requires an edge that is referenced twice.
-            
-            ielem1 = self.edges[iedge]['parent_elements'][0]
-            ielem2 = self.edges[iedge]['parent_elements'][1]
-            
-            isides1 = [ix['edge'] for ix in self.elements[ielem1]]
-            isides2 = [ix['edge'] for ix in self.elements[ielem2]]
-            
+
+            ielem1, ielem2 = et.getParents(iedge)
+
+            sides1 = self.elementTable.getSides(ielem1)
+            sides2 = self.elementTable.getSides(ielem2)
+
+            isides1 = [ix[0] for ix in sides1]
+            isides2 = [ix[0] for ix in sides2]
+
             # Roll the list of edges until the common edge 'iedge' is last in each list.
-            
+
             irr = 2 - isides1.index(iedge) # right roll amount = irr
-            self.elements[ielem1] = self.elements[ielem1][-irr:] + self.elements[ielem1][:-irr]
-            
+            sides1 = sides1[-irr:] + sides1[:-irr]
+
             irr = 2 - isides2.index(iedge) # right roll amount = irr
-            self.elements[ielem2] = self.elements[ielem2][-irr:] + self.elements[ielem2][:-irr]
-            
-            ia1 = self.elements[ielem1][0]
-            ib1 = self.elements[ielem1][1]
-            ia2 = self.elements[ielem2][0]
-            ib2 = self.elements[ielem2][1]
-            
-            ia1_last = self.edges[ia1['edge']]['nodes'][1] if ia1['orn'] else self.edges[ia1['edge']]['nodes'][0]
-            ia2_last = self.edges[ia2['edge']]['nodes'][1] if ia2['orn'] else self.edges[ia2['edge']]['nodes'][0]
-            
+            sides2 = sides2[-irr:] + sides2[:-irr]
+
+            ia1 = sides1[0]
+            ia2 = sides2[0]
+
+            ia1_last = et.nodes[ia1[0], 1] if ia1[1] else et.nodes[ia1[0], 0]
+            ia2_last = et.nodes[ia2[0], 1] if ia2[1] else et.nodes[ia2[0], 0]
+
             # Redefine the edge:
-            
-            self.edges[iedge]['nodes'] = [ia1_last, ia2_last]
-            
-            islist1 = [self.elements[ielem1][1], self.elements[ielem2][0], {'edge':iedge, 'orn':False}]
-            islist2 = [self.elements[ielem2][1], self.elements[ielem1][0], {'edge':iedge, 'orn':True}]
-            
-            self.elements[ielem1] = islist1
-            self.elements[ielem2] = islist2
-            
-            ix = self.edges[ia1['edge']]['parent_elements'].index(ielem1)
-            self.edges[ia1['edge']]['parent_elements'][ix] = ielem2
-            
-            ix = self.edges[ia2['edge']]['parent_elements'].index(ielem2)
-            self.edges[ia2['edge']]['parent_elements'][ix] = ielem1
-
-            
-    def isFlippable(self, iedge):
-        
-        if self.edges[iedge]['bnd']: return False
-        
-        if len(self.edges[iedge]['parent_elements']) == 2:
+
+            et.setNodes(iedge, [ia1_last, ia2_last])
+
+            islist1 = [sides1[1], sides2[0], (iedge, False)]
+            islist2 = [sides2[1], sides1[0], (iedge, True)]
+
+            self.elementTable.setSides(ielem1, islist1)
+            self.elementTable.setSides(ielem2, islist2)
+
+            et.replaceParent(ia1[0], ielem1, ielem2)
+            et.replaceParent(ia2[0], ielem2, ielem1)
+
+            if self.log is not None: self.log.flipped.add(iedge)
+            self.logStep()
+
+
+    def isFlippable(self, iedge, delaunay=True):
+        # With delaunay=True, should edge iedge be flipped to make its two triangles Delaunay ?
+        # With delaunay=False, can it be flipped at all, i.e. do its two triangles form a
+        # strictly convex quadrilateral ?
+
+        et = self.edgeTable
+
+        if et.bnd[iedge]: return False
+
+        if et.numParents(iedge) == 2:
             # Flip requires an edge that is referenced twice.
-            
-            ielem1 = self.edges[iedge]['parent_elements'][0]
-            ielem2 = self.edges[iedge]['parent_elements'][1]
-            
-            iind = [xx['edge'] for xx in self.elements[ielem1]].index(iedge)
-            iind_next = (iind+1) % 3
-            
-            eside = self.elements[ielem1][iind_next]
-            
-            if eside['orn']:
-                iother1 = self.edges[eside['edge']]['nodes'][1]
-            else:
-                iother1 = self.edges[eside['edge']]['nodes'][0]
-                
-            iind = [xx['edge'] for xx in self.elements[ielem2]].index(iedge)
+
+            ielem1, ielem2 = et.getParents(iedge)
+
+            if self.elementTable.numSides(ielem1) != 3 or self.elementTable.numSides(ielem2) != 3: return False
+
+            sides = self.elementTable.getSides(ielem1)
+            iind = [xx[0] for xx in sides].index(iedge)
             iind_next = (iind+1) % 3
-            
-            eside = self.elements[ielem2][iind_next]
-            
-            if eside['orn']:
-                iother2 = self.edges[eside['edge']]['nodes'][1]
+
+            eside = sides[iind_next]
+
+            if eside[1]:
+                iother1 = et.nodes[eside[0], 1]
             else:
-                iother2 = self.edges[eside['edge']]['nodes'][0]
-                
+                iother1 = et.nodes[eside[0], 0]
+
             ptest = self.nodes[iother1]
-            
-            inods = self.edges[iedge]['nodes'].copy()
-            inods.append(iother2)
-            
+
+            if not delaunay:
+                iother2 = next(n for n in self.getElementOrderedNodes(ielem2) if n not in et.nodes[iedge])
+
+                n1, n2 = et.nodes[iedge]
+                pxy = self.nodes[iother2]
+                return orientation(ptest, pxy, self.nodes[n1]) * orientation(ptest, pxy, self.nodes[n2]) < 0
+
             node_list = self.getElementOrderedNodes(ielem2)
             node_list = [self.nodes[xx] for xx in node_list]
-            
+
+            if self.stats is not None: self.stats.inCircleTests += 1
             if point_in_ccircle(ptest, *node_list):
                 return True
-            
+
         return False
 
-    
-    def addBoundaryLoop(self, nodeList, video=False):
-    
-        self.addNodes(nodeList)
-        for ixn in range(len(nodeList)-1):
-            self.insertBoundaryEdge([ixn, ixn+1])
+
+    def addBoundaryLoop(self, nodeList, video=False, engine='insert'):
+
+        # engine='insert' adds the boundary edges one at a time with insertBoundaryEdge.
+        # engine='recover' triangulates all of the boundary nodes first and then recovers
+        # the boundary edges by flipping the edges that cross them.
+
+        if engine == 'insert':
+            self.addNodes(nodeList)
+            for ixn in range(len(nodeList)-1):
+                self.insertBoundaryEdge([ixn, ixn+1])
+                if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
+
+            self.insertBoundaryEdge([len(nodeList)-1, 0])
             if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
-    
-        self.insertBoundaryEdge([len(nodeList)-1, 0])
-        if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
-        
+
+        elif engine == 'recover':
+            self.triangulateNodes(nodeList)
+            if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
+
+            numNodes = len(nodeList)
+            for ixn in range(numNodes):
+                self.recoverBoundaryEdge([ixn, (ixn+1) % numNodes], self.findEdge([ixn-1 if ixn > 0 else numNodes-1, ixn]))
+                if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
+
+        else:
+            raise ValueError("Unknown meshing engine '{}'.".format(engine))
+
         self.removeNonFeatureBoundaryEdges()
         if video: self.vplot(self.writer, self.fig, self.axs, labels=False, arrows=False)
-        
-    def addBoundaryLoopWithVideo(self, nodeList):
-        with self.writer.saving(self.fig, self.fpath, 200):
-            self.addBoundaryLoop(nodeList, video=True)
-            
+
+    def addBoundaryLoopWithVideo(self, nodeList, engine='insert', workers=None):
+
+        # The frames are recorded while the mesh is built, and rendered afterwards by 'workers'
+        # processes (by default, one per CPU) before being encoded in order.
+
+        self.recorder = frameRecorder(labels=False, arrows=False)
+        try:
+            self.addBoundaryLoop(nodeList, video=True, engine=engine)
+        finally:
+            recorder, self.recorder = self.recorder, None
+
+        writeVideo(recorder, self.writer, self.fig, self.fpath, 200, workers=workers)
+
+    def triangulateNodes(self, nodeList):
+        # Delaunay triangulation of the nodes in nodeList, which become the first nodes of an
+        # empty mesh and keep their positions in nodeList as their node numbers. The nodes are
+        # inserted in BRIO order.
+
+        if len(self.nodeTable) > 0:
+            raise ValueError("triangulateNodes requires an empty mesh.")
+
+        xy = np.asarray(nodeList, dtype=float).reshape(-1, 2)
+        perm = brioOrder(xy, np.random.default_rng(0))
+
+        self.orderFirstTriangle(xy, perm)
+
+        for ix in perm:
+            self.insertNode(xy[ix])
+
+        # Node k of the triangulation is node perm[k] of nodeList.
+        et = self.edgeTable
+        et.nodes[:len(et)] = perm[et.nodes[:len(et)]]
+        et.reindex()
+        self.nodeTable.xy[:len(xy)] = xy
+
+        et.touchAll()
+        self.nodeTable.touchAll()
+        self.logStep()
+
+    def edgesCrossing(self, nodes, iedge=None):
+        # The edges crossed by the line segment between the two nodes, in order from nodes[0].
+        # iedge, if given, is an edge with an end at nodes[0], used to find a triangle to start
+        # from; otherwise the triangles are scanned for one.
+
+        et = self.edgeTable
+        el = self.elementTable
+
+        na, nb = nodes
+        xa, xb = self.nodes[na], self.nodes[nb]
+
+        if iedge is not None:
+            ielem = next((iel for iel in et.getParents(iedge) if el.numSides(iel) == 3), None)
+        else:
+            ielem = None
+        if ielem is None:
+            tris = el.triangles()
+            ielem = int(tris[np.flatnonzero((self.getElementNodeArray(tris) == na).any(axis=1))[0]])
+
+        def corners(iel):
+            # The other two corners of iel, counter-clockwise from node na.
+            nn = self.getElementOrderedNodes(iel)
+            k = nn.index(na)
+            return nn[(k+1) % 3], nn[(k+2) % 3]
+
+        def facesSegment(iel):
+            # Does the corner of triangle iel at node na contain the direction towards nb ?
+            u, v = corners(iel)
+            for n in (u, v):
+                if orientation(xa, xb, self.nodes[n]) == 0 and np.dot(self.nodes[n] - xa, xb - xa) > 0:
+                    raise ValueError("The segment from node {} to node {} passes through node {}.".format(na, nb, n))
+
+            return orientation(xa, self.nodes[u], xb) > 0 and orientation(xa, self.nodes[v], xb) < 0
+
+        # Rotate about node na to the triangle whose corner at na contains the segment, first
+        # counter-clockwise and then, if the hull is reached, clockwise.
+
+        istart = ielem
+        found = None
+
+        for direction in (0, 1):
+            ielem = istart
+            for istep in range(len(el)):
+                if facesSegment(ielem):
+                    found = ielem
+                    break
+
+                u, v = corners(ielem)
+                ielem = self.neighbourAcross(ielem, et.find(na, v if direction == 0 else u))
+                if ielem is None or el.numSides(ielem) != 3 or ielem == istart: break
+
+            if found is not None: break
+
+        if found is None:
+            raise ValueError("No triangle at node {} faces node {}.".format(na, nb))
+
+        ielem = found
+        u, v = corners(ielem)
+
+        # March across the triangles, keeping track of the ends of the crossed edge to the
+        # left (p) and the right (q) of the segment.
+
+        p, q = v, u
+        crossing = []
+
+        while True:
+            ie = et.find(p, q)
+            if et.feature[ie]:
+                raise ValueError("The segment from node {} to node {} crosses a boundary edge.".format(na, nb))
+            crossing.append(ie)
+
+            ielem = self.neighbourAcross(ielem, ie)
+            w = next(n for n in self.getElementOrderedNodes(ielem) if n != p and n != q)
+            if w == nb: break
+
+            o = orientation(xa, xb, self.nodes[w])
+            if o == 0:
+                raise ValueError("The segment from node {} to node {} passes through node {}.".format(na, nb, w))
+
+            if o > 0: p = w
+            else: q = w
+
+        return crossing
+
+    def recoverBoundaryEdge(self, nodes, iedge=None):
+        # Make the edge between the two nodes part of the mesh by flipping the edges that cross
+        # it, then mark it as a feature and restore the Delaunay property around it with Lawson
+        # flips. iedge is passed to edgesCrossing.
+
+        et = self.edgeTable
+
+        ie = self.findEdge(nodes)
+        if ie is None:
+            xa, xb = self.nodes[nodes[0]], self.nodes[nodes[1]]
+
+            queue = deque(self.edgesCrossing(nodes, iedge))
+            newEdges = []
+
+            while queue:
+                ie = queue.popleft()
+
+                # An edge that cannot be flipped yet is put back at the end of the queue;
+                # one of the other flips will make it flippable.
+                if not self.isFlippable(ie, delaunay=False):
+                    queue.append(ie)
+                    continue
+
+                self.flip(ie)
+
+                n1, n2 = et.nodes[ie]
+                if segmentsCross(xa, xb, self.nodes[n1], self.nodes[n2]):
+                    queue.append(ie)
+                else:
+                    newEdges.append(ie)
+
+            ie = self.findEdge(nodes)
+            et.setFeature(ie)
+            self.logStep()
+            self.restoreDelaunay(newEdges)
+        else:
+            et.setFeature(ie)
+            self.logStep()
+
+    def restoreDelaunay(self, edges):
+        # Lawson flips: flip non-Delaunay edges, starting from those in 'edges', until none remain.
+        # Feature edges are never flipped.
+
+        et = self.edgeTable
+        queue = deque(edges)
+
+        while queue:
+            ie = queue.popleft()
+            if et.feature[ie] or not self.isFlippable(ie): continue
+
+            self.flip(ie)
+
+            for iel in et.getParents(ie):
+                for iside, orn in self.elementTable.getSides(iel):
+                    if iside != ie: queue.append(iside)
+
+    def startLog(self, path):
+        # Record every change to the topology of the mesh, from here on, in the binary operation
+        # log 'path' (see oplog.py), which can be read back with oplog.opLog(path).
+
+        from oplog import opLogWriter
+
+        self.stopLog()
+        self.log = opLogWriter(path, self)
+
+    def stopLog(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def logStep(self):
+        # Mark the end of a step of the operation log, if one is being recorded, and of the
+        # profile, if one is being collected.
+        if self.log is not None: self.log.step()
+        if self.stats is not None: self.stats.step(self)
+
+    def startProfile(self, callback=None):
+        # Collect the time spent in each phase of the meshing, the numbers of predicates evaluated,
+        # the sizes of the cavities and the peak sizes of the tables, from here on (see profiling.py).
+        # callback, if given, is called with the statistics at the end of every step.
+        # Returns the meshStats object that holds them.
+
+        from profiling import meshStats
+
+        self.stopProfile()
+        self.stats = meshStats(callback)
+        self.stats.attach(self)
+        return self.stats
+
+    def stopProfile(self):
+        # Stop profiling. Returns the statistics collected, or None.
+
+        stats, self.stats = self.stats, None
+        if stats is not None: stats.detach(self)
+        return stats
+
     def plot(self, figsize=(6,6), labels=True, arrows=True, internal=True):
-    
+
         fig, axs = plt.subplots(1,1, figsize=figsize)
         axs.set_aspect(aspect = 1.0)
-        
+
         self.draw_mesh(axs, labels = labels, arrows = arrows, internal=internal)
-        
+
         axs.autoscale()
         plt.axis('off')
-        
+
         plt.show()
-    
+
     def draw_mesh(self, axs, labels=True, arrows=True, internal=True):
-        draw_mesh_external(axs, self.nodes, self.edges, self.elements, labels=labels, arrows=arrows, internal=internal)
-        
+        draw_mesh_external(axs, self.nodes, self.edgeTable, self.elementTable, labels=labels, arrows=arrows, internal=internal)
+
     def vplot_init(self, fpath, figsize=(6,6)):
-    
+
         fle = Path(fpath)
         fle.touch(exist_ok=True)
         self.fpath = fpath
-        
+
         self.fig, self.axs = plt.subplots(1,1, figsize=figsize)
-        self.writer = FFMpegWriter(fps=2)
-            
+        self.writer = canvasWriter(fps=2)
+        self.artist = None
+
     def vplot(self, writer, fig, axs, labels=True, arrows=True):
-        
-        axs.set_aspect(aspect = 1.0)
-        axs.cla()
-        
-        self.draw_mesh(axs, labels = labels, arrows = arrows)
-                                   
-        axs.autoscale()
-        plt.axis('off')
-    
+
+        # The artists persist from one frame to the next, and only the parts of the mesh that
+        # have changed since the previous frame are redrawn. While a frameRecorder is in use,
+        # the frame is recorded instead.
+
+        if self.recorder is not None:
+            self.recorder.record(self.nodes, self.edgeTable, self.elementTable)
+            return
+
+        if self.artist is None or self.artist.axs is not axs or (self.artist.labels, self.artist.arrows) != (labels, arrows):
+            axs.cla()
+            self.artist = meshArtist(axs, labels=labels, arrows=arrows)
+
+        self.artist.update(self.nodes, self.edgeTable, self.elementTable)
+
         writer.grab_frame()
-        
+
     def insertBoundaryEdge(self, nodes):
-        
+
         # assumes that the outer loop edges are inserted in correct order.
-        numEdges = len(self.edges)
-        
+        numEdges = len(self.edgeTable)
+
+        et = self.edgeTable
+        el = self.elementTable
+
         xynew = self.nodes[nodes[1]]
-  
+
         if numEdges == 0:
-            self.edges.append({'nodes':nodes, 'parent_elements':[], 'bnd':True, 'feature':True})
-        elif numEdges == 1:       
-            v1 = self.nodes[1] - self.nodes[0]
-            v2 = xynew - self.nodes[0]
-            disc = np.cross(v1, v2)
-                    
-            if abs(disc) < 1.0e-9:
-                self.edges.append({'nodes':nodes, 'parent_elements':[], 'bnd':True, 'feature':True})
+            et.append(nodes, bnd=True, feature=True)
+        elif numEdges == 1:
+            disc = orientation(self.nodes[0], self.nodes[1], xynew)
+
+            if disc == 0:
+                et.append(nodes, bnd=True, feature=True)
             else:
-                self.edges.append({'nodes':[0,2], 'parent_elements':[0,2], 'bnd':True, 'feature':False})
-                self.edges.append({'nodes':[1,2], 'parent_elements':[0,3], 'bnd':True, 'feature':True})
-                self.edges[0]['parent_elements'] = [0,1]
-                self.edges[0]['bnd'] = True
-                            
-                if disc>0.0:
-                    self.elements.append([{'edge':0, 'orn':True}, {'edge':2, 'orn':True}, {'edge':1, 'orn':False}])
-                    self.elements.append([{'edge':0, 'orn':False}])              
-                    self.elements.append([{'edge':1, 'orn':True}])
-                    self.elements.append([{'edge':2, 'orn':False}])
+                et.append([0,2], [0,2], bnd=True)
+                et.append([1,2], [0,3], bnd=True, feature=True)
+                et.setParents(0, [0,1])
+                et.setBnd(0)
+
+                if disc>0:
+                    el.append([(0, True), (2, True), (1, False)])
+                    el.append([(0, False)])
+                    el.append([(1, True)])
+                    el.append([(2, False)])
                 else:
-                    self.elements.append([{'edge':0, 'orn':False}, {'edge':1, 'orn':True}, {'edge':2, 'orn':False}])
-                    self.elements.append([{'edge':0, 'orn':True}])
-                    self.elements.append([{'edge':1, 'orn':False}])
-                    self.elements.append([{'edge':2, 'orn':True}])
-        elif len(self.elements) == 0:
- 
-            v1 = self.nodes[1] - self.nodes[0]
-            v2 = xynew - self.nodes[0]
-            disc = np.cross(v1, v2) 
-            #v1 = np.array(self.nodes[1]) - np.array(self.nodes[0])
-            #v2 = np.array(node) - np.array(self.nodes[0])
-            #disc = np.cross(v1, v2)
-            
-            if (abs(disc) < 1.0e-9):
-                self.edges.append({'nodes':nodes, 'parent_elements':[], 'bnd':True, 'feature':True})
+                    el.append([(0, False), (1, True), (2, False)])
+                    el.append([(0, True)])
+                    el.append([(1, False)])
+                    el.append([(2, True)])
+        elif len(el) == 0:
+
+            disc = orientation(self.nodes[0], self.nodes[1], xynew)
+
+            if disc == 0:
+                et.append(nodes, bnd=True, feature=True)
             else:
                 # Create an element for each edge.
-                
+
                 inod = nodes[1] # This will be the new node number.
-                
-                self.edges.append({'nodes':nodes, 'parent_elements':[2*inod-1,inod-1], 'bnd':True, 'feature':True})
-                self.edges.append({'nodes':[0,inod], 'parent_elements':[inod,inod+1], 'bnd':True, 'feature':False})
-                             
-                for ii in range(1, inod-1):              
-                    self.edges.append({'nodes':[ii,inod], 'parent_elements':[inod+ii,inod+ii+1], 'bnd':False, 'feature':False})
-            
-                if disc>0.0:
-                    
-                    for ii in range(inod-1): self.elements.append([{'edge':ii, 'orn':False}])
-                        
-                    self.elements.append([{'edge':inod-1, 'orn':False}])
-                    self.elements.append([{'edge':inod, 'orn':True}])
-                
+
+                et.append(nodes, [2*inod-1,inod-1], bnd=True, feature=True)
+                et.append([0,inod], [inod,inod+1], bnd=True)
+
+                for ii in range(1, inod-1):
+                    et.append([ii,inod], [inod+ii,inod+ii+1])
+
+                if disc>0:
+
+                    for ii in range(inod-1): el.append([(ii, False)])
+
+                    el.append([(inod-1, False)])
+                    el.append([(inod, True)])
+
                     for ii in range(inod-1):
-                        self.elements.append([{'edge':ii, 'orn':True}, {'edge':inod+ii+1, 'orn':True}, {'edge':inod+ii, 'orn':False}])
-                
-                    self.elements[2*inod - 1][1]['edge'] = inod-1        
+                        el.append([(ii, True), (inod+ii+1, True), (inod+ii, False)])
+
+                    el.setSideEdge(2*inod - 1, 1, inod-1)
                 else:
-                    
-                    for ii in range(inod-1): self.elements.append([{'edge':ii, 'orn':True}])
-                        
-                    self.elements.append([{'edge':inod-1, 'orn':True}])
-                    self.elements.append([{'edge':inod, 'orn':False}])
-                
+
+                    for ii in range(inod-1): el.append([(ii, True)])
+
+                    el.append([(inod-1, True)])
+                    el.append([(inod, False)])
+
                     for ii in range(inod-1):
-                        self.elements.append([{'edge':ii, 'orn':False}, {'edge':inod+ii, 'orn':True}, {'edge':inod+ii+1, 'orn':False}])
-                
-                    self.elements[2*inod - 1][2]['edge'] = inod-1     
-                    
+                        el.append([(ii, False), (inod+ii, True), (inod+ii+1, False)])
+
+                    el.setSideEdge(2*inod - 1, 2, inod-1)
+
                 for ii in range(inod-1):
-                    self.edges[ii]['parent_elements'] = [inod+ii, ii]
-                
+                    et.setParents(ii, [inod+ii+1, ii])
+
         else:
-            
+
             # Need to check that the edge doesn't already exist ... if it does then change the 'feature' designation.
-            
+
             ie = self.findEdge(nodes)
-            if ie:
-                self.edges[ie]['feature'] = True
+            if ie is not None:
+                et.setFeature(ie)
+                self.logStep()
                 return
-            
+
             bBoundaryElement = False
-            
+
             islist, iolist, TBDList = self.identifyAffectedElements(nodes, checkVisibility=True)
-                
+
             for ix in TBDList:
-                if len(self.elements[ix]) == 1: bBoundaryElement = True
-                                      
-            if len(TBDList) == 0: 
-                
-                numElements = len(self.elements)
-                numEdges = len(self.edges)
-                
-                ie = self.findEdge(nodes)
-                if ie:
-                    self.edges[ie]['feature'] = True
-                else:
-                    self.edges.append({'nodes':nodes, 'parent_elements':[numElements,numElements+1], 'bnd':True, 'feature':True})
-                    
-                self.elements.append([{'edge':numEdges, 'orn':True}])
-                self.elements.append([{'edge':numEdges, 'orn':False}])
-                    
+                if el.numSides(ix) == 1: bBoundaryElement = True
+
+            if len(TBDList) == 0:
+
+                # The edge is not yet connected to the mesh: give it a boundary element on either side.
+
+                iel1 = el.allocate()
+                iel2 = el.allocate()
+
+                ie = et.append(nodes, [iel1, iel2], bnd=True, feature=True)
+
+                el.setSides(iel1, [(ie, True)])
+                el.setSides(iel2, [(ie, False)])
+
+                self.logStep()
                 return
-        
+
             # Make a list of edges that are referenced by one element only.
-            
-            #ielist = self.findSingleElementEdges(islist, iolist)
-            ielist = findSingleElementEdges(islist, iolist, self.edges)
-            
-            conn_dict = {}
-            for q in ielist:
-                if not q[2] in conn_dict: conn_dict[q[2]]=0 
-                if not q[3] in conn_dict: conn_dict[q[3]]=0
-                
-                conn_dict[q[2]] += 1
-                conn_dict[q[3]] += 1
-            
-            bBoundaryElement = False
-            for q in conn_dict:
-                if conn_dict[q] == 1:
-                    bBoundaryElement = True
-                    break
-            
-            # Need a test here to determine whether it's a polyline or a loop.
-                    
-            # Order the edges.           
+
+            ielist = findSingleElementEdges(islist, iolist, et)
+
+            # The boundary is a polyline if one of its edges ends at a node that no edge starts from.
+
+            bBoundaryElement = any(q[3] not in ielist for q in ielist.values())
+
+            # Order the edges.
+
+            ielist2 = self.orderCavityEdges(ielist, bBoundaryElement)
+
+            # Delete the cavity, then fill it with the new edges and elements.
+
+            self.releaseCavity(TBDList, islist)
 
             if bBoundaryElement:
-                ielist2 = orderEdgesPolyline(ielist)            
-            else: 
-                ielist2 = orderEdgesLoop(ielist) 
-                
-            # Create elements.
-            
-            if bBoundaryElement:                  
                 self.createElementsPolyline(ielist2, nodes[1])
             else:
                 self.createElementsLoop(ielist2, nodes[1])
-                
-            # Delete elements.
-            for ix in TBDList:
-                self.elements[ix] = []  
-                
-            ie = self.findEdge(nodes)
-            if ie:
-                self.edges[ie]['feature'] = True
-        
-
-
 
+            ie = self.findEdge(nodes)
+            if ie is not None:
+                et.setFeature(ie)
 
+        self.logStep()
@@ -1,43 +1,65 @@
 from matplotlib import patches
+from matplotlib.artist import Artist
+from matplotlib.text import Text
+from matplotlib.collections import LineCollection, PolyCollection, EllipseCollection
 import matplotlib.pyplot as plt
+from matplotlib.animation import FFMpegWriter
 
 import numpy as np
 
-def draw_nodelist_external(axs, nodeList):
+# Level of detail: above these sizes the labels and the arrows are left out, and the nodes
+# are drawn as single pixels rather than circles, so that large meshes can be drawn quickly.
+
+MAX_LABELS = 2000        # nodes, edges or elements that are labelled.
+MAX_ARROWS = 5000        # edges that are drawn with an arrow.
+MAX_NODE_CIRCLES = 20000 # nodes that are drawn as circles.
+
+# The outline of patches.Arrow, for an arrow of unit length and width along the x-axis.
+
+_arrowShape = np.array([[0.0, 0.1], [0.0, -0.1], [0.8, -0.1], [0.8, -0.3], [1.0, 0.0], [0.8, 0.3], [0.8, 0.1]])
+
+
+def nodeRadius(xy):
+    # The radius of the circles that mark the nodes: 1% of the extent of the nodes.
+
+    if len(xy) == 0: return 0.0
+    return 0.01 * max(xy.max(axis=0) - xy.min(axis=0))
+
+
+def polyline(segments):
+    # The (k,2,2) array of line segments as one line broken by NaNs, so that a collection of any
+    # number of them holds a single path.
+
+    res = np.full((len(segments), 3, 2), np.nan)
+    res[:, :2] = segments
+    return [res.reshape(-1, 2)]
+
+
+def draw_nodes(axs, xy, radius, labels=True):
+
+# Draw the nodes with co-ordinates xy (an (N,2) array) as red circles, numbered in blue.
+
+    if len(xy) <= MAX_NODE_CIRCLES:
+        axs.add_collection(EllipseCollection(2*radius, 2*radius, 0.0, units='xy', offsets=xy,
+                                             offset_transform=axs.transData, color='red'))
+    else:
+        axs.plot(xy[:, 0], xy[:, 1], ',', color='red')
+
+    if labels and len(xy) <= MAX_LABELS:
+        for ix, nn in enumerate(xy):
+            axs.text(nn[0] + radius, nn[1] - 4.0*radius, str(ix), color = 'blue')
+
+
+def draw_nodelist_external(axs, nodeList, labels=True):
+
+    xy = np.asarray(nodeList, dtype=float).reshape(-1, 2)
+    radius = nodeRadius(xy)
+
+    draw_nodes(axs, xy, radius, labels=labels)
+
+    # The boundary loop.
+    axs.add_collection(LineCollection([np.concatenate([xy, xy[:1]])], linewidths=1, colors='black', zorder=1))
 
-    labels = True
-    
-    xmin = min([xx[0] for xx in nodeList])
-    xmax = max([xx[0] for xx in nodeList])
-    ymin = min([xx[1] for xx in nodeList])
-    ymax = max([xx[1] for xx in nodeList])
-    
-    dx = xmax-xmin
-    dy = ymax-ymin
-    
-    radius = 0.01 * max(dx, dy)
-
-    for ix, nn in enumerate(nodeList):
-        e2 = patches.Circle(nn, radius=radius, color = 'red')
-        
-        xy = [nn[0] + radius, nn[1] - 4.0*radius]
-        
-        if labels:
-            axs.text(*xy, str(ix), color = 'blue')
-        axs.add_patch(e2)
-        
-    for ix in range(len(nodeList)-1):
-   
-        pntList = [nodeList[ix], nodeList[ix+1]]
-    
-        e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=1)
-        axs.add_patch(e1)
-        
-    pntList = [nodeList[-1], nodeList[0]]
-    
-    e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=1)
-    axs.add_patch(e1)
-    
 def plot_nodelist(nodeList, figsize=(6,6)):
     
     fig, axs = plt.subplots(1,1, figsize=figsize)
@@ -55,89 +77,333 @@ def plot_nodelist(nodeList, figsize=(6,6)):
 
 def draw_mesh_external(axs, nodes, edges, elements, labels=True, arrows=True, internal=True):
 
-# internal=False prevents the internal edges from being drawn.
-         
-    for ee in edges:    
-        if len(ee['parent_elements']) == 0:
-            continue
-        
-        n1 = ee['nodes'][0]
-        n2 = ee['nodes'][1]
-        
-        pntList = [nodes[n1], nodes[n2]]
-        
-        if ee['feature']:
-            if internal:
-                e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=3, color='yellow')
-            else:
-                e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=1)
-        elif ee['bnd'] & internal:
-            e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=2, color='blue')
-        elif internal:
-            e1 = patches.Polygon(pntList, closed=False, fill=False, linewidth=1)                    
-        axs.add_patch(e1)
-   
-    xmin = min([xx[0] for xx in nodes])
-    xmax = max([xx[0] for xx in nodes])
-    ymin = min([xx[1] for xx in nodes])
-    ymax = max([xx[1] for xx in nodes])
-    
-    dx = xmax-xmin
-    dy = ymax-ymin
-    
-    radius = 0.01 * max(dx, dy)
-    
-    # Label the edges.
-    
+# nodes is an (N,2) array of co-ordinates, edges an edgeTable and elements an elementTable.
+# internal=False prevents the internal edges from being drawn. Each kind of edge is drawn
+# as a single collection; see MAX_LABELS etc. for the sizes above which detail is left out.
+
+    nodes = np.asarray(nodes, dtype=float).reshape(-1, 2)
+
+    numEdges = len(edges)
+    liveEdges = np.flatnonzero(edges.npar[:numEdges] > 0)
+
+    feature = edges.feature[liveEdges]
+    bnd = edges.bnd[liveEdges] & ~feature
+    segments = nodes[edges.nodes[liveEdges]]
+
     if internal:
-        for ie, ee in enumerate(edges):    
-            if len(ee['parent_elements']) == 0:
-                continue
-            
-            n1 = ee['nodes'][0]
-            n2 = ee['nodes'][1]
-            
-            p1 = np.array(nodes[n1])
-            p2 = np.array(nodes[n2])
-            
-            dp = p2-p1
-            dp = dp / np.linalg.norm(dp)
-            
-            xy = 0.5 * (p1 + p2)  -2.5*radius * dp 
-            dxy = 5*radius * dp
-            
-            if arrows:
-                e1 = patches.Arrow(*xy, *dxy, width=2*radius, color = 'black')
-                axs.add_patch(e1)
-            
-            xy += 2*radius*np.array([-dp[1], dp[0]])
-            
-            if labels:
-                axs.text(*xy, str(ie), color = 'orange')
-        
-    
+        axs.add_collection(LineCollection(polyline(segments[~feature & ~bnd]), linewidths=1, colors='black', zorder=1))
+        axs.add_collection(LineCollection(polyline(segments[bnd]), linewidths=2, colors='blue', zorder=1))
+        axs.add_collection(LineCollection(polyline(segments[feature]), linewidths=3, colors='yellow', zorder=1))
+    else:
+        axs.add_collection(LineCollection(polyline(segments[feature]), linewidths=1, colors='black', zorder=1))
+
+    radius = nodeRadius(nodes)
+
+    # Arrows along the edges, and the edge labels.
+
+    if internal and len(liveEdges) > 0:
+        p1 = segments[:, 0]
+        dp = segments[:, 1] - p1
+        dp = dp / np.linalg.norm(dp, axis=1)[:, None]
+
+        xy = p1 + 0.5 * (segments[:, 1] - p1) - 2.5*radius * dp
+
+        if arrows and len(liveEdges) <= MAX_ARROWS:
+            # Scale the outline to an arrow 5 radii long and 2 radii wide, then rotate it along each edge.
+            shape = _arrowShape * np.array([5*radius, 2*radius])
+            verts = xy[:, None, :] + shape[None, :, 0, None] * dp[:, None, :] + shape[None, :, 1, None] * np.stack([-dp[:, 1], dp[:, 0]], axis=1)[:, None, :]
+            axs.add_collection(PolyCollection(verts, facecolors='black', edgecolors='black', linewidths=1))
+
+        if labels and len(liveEdges) <= MAX_LABELS:
+            xy += 2*radius * np.stack([-dp[:, 1], dp[:, 0]], axis=1)
+            for ie, q in zip(liveEdges, xy):
+                axs.text(*q, str(ie), color = 'orange')
+
     # Plot and label the nodes.
-    
-    for ix, nn in enumerate(nodes):
-        e2 = patches.Circle(nn, radius=radius, color = 'red')
-        
-        xy = [nn[0] + radius, nn[1] - 4.0*radius]
-        
-        if labels:
-            axs.text(*xy, str(ix), color = 'blue')
-        axs.add_patch(e2)
-        
-    for ix, xx in enumerate(elements):
-        if len(xx) == 3:
-            # This is not a null or a boundary element.
-            
-            nodeList = []
-            nodeList = nodeList + edges[xx[0]['edge']]['nodes'] \
-            + edges[xx[1]['edge']]['nodes']  \
-            + edges[xx[2]['edge']]['nodes'] 
-            
-           
-            cent = sum([np.array(nodes[qq]) for qq in nodeList]) / 6.0
-            
-            if labels:
-                axs.text(*cent, str(ix), color = 'red')
\ No newline at end of file
+
+    draw_nodes(axs, nodes, radius, labels=labels)
+
+    if labels:
+        tris = elements.triangles()
+
+        if len(tris) <= MAX_LABELS:
+            cent = nodes[edges.nodes[elements.edges[tris]].reshape(-1, 6)].sum(axis=1) / 6.0
+
+            for ix, q in zip(tris, cent):
+                axs.text(*q, str(ix), color = 'red')
+
+
+def meshState(edges, elements, internal=True):
+
+# The state of a mesh as it is drawn: the style of each edge slot (0 - internal edge, 1 - hull
+# edge, 2 - feature edge, -1 - not drawn), the end nodes of each edge slot and the edges of
+# each element slot (-1 unless the element is a triangle). internal=False draws only the features.
+
+    num = len(edges)
+    style = np.where(edges.feature[:num], 2, np.where(edges.bnd[:num], 1, 0)).astype(np.int8)
+    style[edges.npar[:num] == 0] = -1
+    if not internal: style[style < 2] = -1
+
+    enodes = edges.nodes[:num].copy()
+
+    num = len(elements)
+    eedges = np.where((elements.nside[:num] == 3)[:, None], elements.edges[:num], -1)
+
+    return style, enodes, eedges
+
+
+def padded(arr, num, fill):
+    # arr cut or extended with rows of fill to num rows.
+
+    res = np.full((num,) + arr.shape[1:], fill, dtype=arr.dtype)
+    res[:min(num, len(arr))] = arr[:num]
+    return res
+
+
+def changedRows(new, old, fill):
+    # Rows that differ between the arrays new and old, the shorter of which is taken to be
+    # extended with rows of fill.
+
+    num = max(len(new), len(old))
+    diff = padded(new, num, fill) != padded(old, num, fill)
+    if diff.ndim > 1: diff = diff.any(axis=1)
+    return np.flatnonzero(diff)
+
+
+class _drawOrder(Artist):
+
+# Artists of an Axis drawn in the order of their keys, rather than in the order they were added.
+# The members stay in the Axis, so that they count towards its data limits, but are marked as
+# animated so that the Axis leaves the drawing of them to the group.
+
+    def __init__(self, zorder):
+        super().__init__()
+        self.set_zorder(zorder)
+        self.members = {}   # artist -> its key.
+        self.order = []     # the members sorted by key, or None once members have changed.
+
+    def add(self, artist, key):
+        # Add artist, which is in the Axis already, to the group. Returns the pair (group, artist).
+        artist.set_animated(True)
+        self.members[artist] = key
+        self.order = None
+        return self, artist
+
+    def drop(self, artist):
+        # Remove artist from the group and from its Axis.
+        del self.members[artist]
+        self.order = None
+        artist.remove()
+
+    def draw(self, renderer):
+        if not self.get_visible(): return
+
+        if self.order is None: self.order = sorted(self.members, key=self.members.get)
+        for a in self.order: a.draw(renderer)
+
+
+class meshArtist:
+
+# Persistent artists for a mesh that is drawn repeatedly, as in the frames of a video. Each
+# call to update() compares the mesh with the state drawn by the previous call, so that only
+# the artists of the edges, elements and nodes that have been created, deleted or changed since
+# then are replaced. The frames are those of a full redraw, pixel for pixel: the same patches
+# and labels, one per edge and node, drawn in the same order, within the same autoscaled limits.
+# A full redraw adds the patches, and then the labels, by kind and then by number: the lines of the
+# edges, their arrows and the circles of the nodes; the labels of the edges, nodes and elements. The
+# groups patchOrder and textOrder keep them in that order, keyed by (kind, number).
+
+    def __init__(self, axs, labels=True, arrows=True, internal=True):
+        self.axs = axs
+        self.labels = labels
+        self.arrows = arrows
+        self.internal = internal
+
+        axs.set_aspect(aspect = 1.0)
+        axs.set_axis_off()
+
+        # Line styles of the internal edges (style 0), the hull edges (1) and the feature edges (2).
+
+        if internal:
+            self.styles = [dict(linewidth=1), dict(linewidth=2, color='blue'), dict(linewidth=3, color='yellow')]
+        else:
+            self.styles = [None, None, dict(linewidth=1)]
+
+        self.radius = None
+
+        self.patchOrder = axs.add_artist(_drawOrder(patches.Patch.zorder))
+        self.textOrder = axs.add_artist(_drawOrder(Text.zorder))
+
+        # The (group, artist) pairs of each edge (its line, arrow and label), element (its label)
+        # and node (its circle and label).
+        self.edgeArtists = {}
+        self.elementArtists = {}
+        self.nodeArtists = []
+
+        self.reset()
+
+    def reset(self):
+        # Forget everything that has been drawn, so that the next update draws the whole mesh.
+
+        for group in [self.patchOrder, self.textOrder]:
+            for a in list(group.members): group.drop(a)
+
+        self.edgeArtists = {}
+        self.elementArtists = {}
+        self.nodeArtists = []
+
+        self.nodeXY = np.zeros((0, 2))
+        self.edgeStyle = np.zeros(0, dtype=np.int8)
+        self.edgeNodes = np.zeros((0, 2), dtype=np.int64)
+        self.elementEdges = np.zeros((0, 3), dtype=np.int64)
+
+        # The data limits must be recomputed before the next frame is autoscaled. Adding a patch
+        # extends them, but removing one does not shrink them.
+        self.staleLimits = True
+
+    def update(self, nodes, edges, elements):
+
+        # nodes is an (N,2) array of co-ordinates, edges an edgeTable and elements an elementTable.
+
+        self.draw(nodes, *meshState(edges, elements, self.internal))
+
+    def draw(self, nodes, style, enodes, eedges):
+
+        # Draw the mesh state returned by meshState().
+
+        nodes = np.asarray(nodes, dtype=float).reshape(-1, 2)
+        if len(nodes) == 0: return
+
+        radius = 0.01 * max(nodes.max(axis=0) - nodes.min(axis=0))
+
+        if radius != self.radius:
+            # The node circles, arrows and labels are sized by the radius: redraw everything.
+            self.radius = radius
+            self.reset()
+
+        # Nodes that have been moved, e.g. renumbered.
+        moved = changedRows(nodes[:len(self.nodeXY)], self.nodeXY[:len(nodes)], np.nan)
+        self.nodeXY = nodes.copy()
+
+        changed = self.drawEdges(nodes, style, enodes, moved)
+        self.drawNodes(nodes, moved)
+
+        if self.labels: self.drawElements(nodes, enodes, eedges, changed)
+
+        # The lines of the edges lie within the circles of their nodes, so only the removal of
+        # a circle or an arrow can shrink the limits.
+        if self.staleLimits:
+            self.axs.relim()
+            self.staleLimits = False
+
+        self.axs.autoscale()
+
+    def drawEdges(self, nodes, style, enodes, moved):
+        # Redraw the edges that have changed since the last update, or whose nodes have moved,
+        # and return them.
+
+        changed = np.union1d(changedRows(style, self.edgeStyle, -1), changedRows(enodes, self.edgeNodes, -1))
+        if len(moved) > 0: changed = np.union1d(changed, np.flatnonzero(np.isin(enodes, moved).any(axis=1)))
+
+        m = max(len(style), len(self.edgeStyle))
+        style = padded(style, m, -1)
+        enodes = padded(enodes, m, -1)
+
+        self.edgeStyle = style
+        self.edgeNodes = enodes
+
+        radius = self.radius
+
+        for ie in changed:
+            artists = self.edgeArtists.pop(ie, ())
+            if len(artists) > 1: self.staleLimits = True
+            for group, a in artists: group.drop(a)
+
+            if style[ie] < 0: continue
+
+            p1 = nodes[enodes[ie, 0]]
+            p2 = nodes[enodes[ie, 1]]
+
+            artists = [self.patchOrder.add(self.axs.add_patch(patches.Polygon([p1, p2], closed=False, fill=False, **self.styles[style[ie]])), (0, ie))]
+
+            # The arrows and labels of the edges.
+
+            if self.internal and (self.arrows or self.labels):
+                dp = p2-p1
+                dp = dp / np.linalg.norm(dp)
+
+                xy = 0.5 * (p1 + p2)  -2.5*radius * dp
+                dxy = 5*radius * dp
+
+                if self.arrows:
+                    artists.append(self.patchOrder.add(self.axs.add_patch(patches.Arrow(*xy, *dxy, width=2*radius, color = 'black')), (1, ie)))
+
+                xy += 2*radius*np.array([-dp[1], dp[0]])
+
+                if self.labels:
+                    artists.append(self.textOrder.add(self.axs.text(*xy, str(ie), color = 'orange'), (0, ie)))
+
+            self.edgeArtists[ie] = artists
+
+        return changed
+
+    def drawNodes(self, nodes, moved):
+        # Redraw the nodes that have moved since the last update, and draw the new ones.
+
+        radius = self.radius
+
+        redraw = moved[moved < len(self.nodeArtists)].tolist() + list(range(len(self.nodeArtists), len(nodes)))
+
+        for ix in range(len(nodes), len(self.nodeArtists)):
+            for group, a in self.nodeArtists[ix]: group.drop(a)
+        del self.nodeArtists[len(nodes):]
+
+        for ix in redraw:
+            if ix < len(self.nodeArtists):
+                for group, a in self.nodeArtists[ix]: group.drop(a)
+                self.staleLimits = True
+            else:
+                self.nodeArtists.append(())
+
+            nn = nodes[ix]
+            artists = [self.patchOrder.add(self.axs.add_patch(patches.Circle(nn, radius=radius, color = 'red')), (2, ix))]
+
+            if self.labels:
+                artists.append(self.textOrder.add(self.axs.text(nn[0] + radius, nn[1] - 4.0*radius, str(ix), color = 'blue'), (1, ix)))
+
+            self.nodeArtists[ix] = artists
+
+    def drawElements(self, nodes, enodes, eedges, changedEdges):
+        # Relabel the triangles that have changed since the last update.
+
+        m = max(len(eedges), len(self.elementEdges))
+        eedges = padded(eedges, m, -1)
+
+        changed = (eedges != padded(self.elementEdges, m, -1)).any(axis=1) | np.isin(eedges, changedEdges).any(axis=1)
+        self.elementEdges = eedges
+
+        for ix in np.flatnonzero(changed):
+            for group, a in self.elementArtists.pop(ix, ()): group.drop(a)
+            if eedges[ix, 0] < 0: continue
+
+            cent = nodes[enodes[eedges[ix]].ravel()].sum(axis=0) / 6.0
+            self.elementArtists[ix] = [self.textOrder.add(self.axs.text(*cent, str(ix), color = 'red'), (2, ix))]
+
+
+class canvasWriter(FFMpegWriter):
+
+# An FFMpegWriter that takes each frame directly from the canvas buffer of the figure, as raw
+# RGBA pixels, rather than saving the figure into the ffmpeg pipe once more for every frame.
+
+    def setup(self, fig, outfile, dpi=None):
+        super().setup(fig, outfile, dpi=dpi)
+        fig.set_dpi(self.dpi)  # draw the canvas at the resolution of the video.
+
+    def grab_frame(self, **savefig_kwargs):
+        self.fig.set_size_inches(self._w, self._h)
+        self.fig.canvas.draw()
+        self.writeFrame(self.fig.canvas.buffer_rgba())
+
+    def writeFrame(self, rgba):
+        # Write a frame that has already been rendered, as RGBA pixels the size of the video.
+        self._proc.stdin.write(rgba)
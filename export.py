@@ -0,0 +1,217 @@
+import numpy as np
+
+# Exporters that write a mesh to the file formats of other programs: legacy VTK (binary),
+# Gmsh 4.1 .msh (binary) and Wavefront .obj.
+#
+# The tables of the mesh are read in chunks of 'chunksize' slots, and each chunk is written
+# out before the next is read, so that the memory taken by an export does not grow with the
+# size of the mesh. Every node is written, numbered as in the mesh (from 1 where the format
+# counts from 1), along with the triangles and the hull and feature edges. The edges are
+# tagged with the physical groups below; a feature edge on the hull is tagged as a feature.
+
+PHYSICAL_DOMAIN   = 1  # the triangles.
+PHYSICAL_BOUNDARY = 2  # hull edges that are not features.
+PHYSICAL_FEATURE  = 3  # feature edges.
+
+physicalNames = {PHYSICAL_DOMAIN: 'domain', PHYSICAL_BOUNDARY: 'boundary', PHYSICAL_FEATURE: 'feature'}
+
+CHUNKSIZE = 1 << 16
+
+
+def _chunks(num, chunksize):
+    for start in range(0, num, chunksize):
+        yield start, min(start + chunksize, num)
+
+
+def _triangleChunks(m, chunksize):
+    # The (k,3) counter-clockwise node numbers of the triangles in each chunk of element slots.
+
+    el = m.elementTable
+    for start, stop in _chunks(len(el), chunksize):
+        tris = start + np.flatnonzero(el.nside[start:stop] == 3)
+        if len(tris) > 0: yield m.getElementNodeArray(tris)
+
+
+def _edgeChunks(m, group, chunksize):
+    # The (k,2) end nodes of the edges of physical group 'group' (PHYSICAL_BOUNDARY or
+    # PHYSICAL_FEATURE) in each chunk of edge slots. An edge with a triangle on one side is
+    # oriented with that triangle on its left.
+
+    et = m.edgeTable
+    el = m.elementTable
+
+    for start, stop in _chunks(len(et), chunksize):
+        live = et.npar[start:stop] > 0
+        feature = et.feature[start:stop]
+        mask = live & (feature if group == PHYSICAL_FEATURE else et.bnd[start:stop] & ~feature)
+
+        ies = start + np.flatnonzero(mask)
+        if len(ies) == 0: continue
+
+        nodes = et.nodes[ies]
+
+        parent = et.parents[ies, 0]
+        second = et.parents[ies, 1]
+        useSecond = (el.nside[parent] != 3) & (second >= 0)
+        parent = np.where(useSecond, second, parent)
+
+        pos = np.argmax(el.edges[parent] == ies[:, None], axis=1)
+        reverse = (el.nside[parent] == 3) & ~el.orn[parent, pos]
+        nodes[reverse] = nodes[reverse][:, ::-1]
+
+        yield nodes
+
+
+def _counts(m, chunksize):
+    # The numbers of triangles, boundary edges and feature edges.
+
+    et = m.edgeTable
+    el = m.elementTable
+
+    numTriangles = sum(int(np.count_nonzero(el.nside[a:b] == 3)) for a, b in _chunks(len(el), chunksize))
+
+    numBoundary = 0
+    numFeature = 0
+    for a, b in _chunks(len(et), chunksize):
+        live = et.npar[a:b] > 0
+        feature = et.feature[a:b]
+        numFeature += int(np.count_nonzero(live & feature))
+        numBoundary += int(np.count_nonzero(live & et.bnd[a:b] & ~feature))
+
+    return numTriangles, numBoundary, numFeature
+
+
+def _xyz(xy, dtype):
+    res = np.zeros((len(xy), 3), dtype=dtype)
+    res[:, :2] = xy
+    return res
+
+
+def write_vtk(m, path, chunksize=CHUNKSIZE):
+
+# Write the mesh m to 'path' as a binary legacy VTK unstructured grid: the triangles followed by
+# the boundary and feature edges as line cells, with the physical group of each cell in the
+# cell data array 'physical'.
+
+    nodes = m.nodes
+    numTriangles, numBoundary, numFeature = _counts(m, chunksize)
+    numLines = numBoundary + numFeature
+    numCells = numTriangles + numLines
+
+    groups = (PHYSICAL_BOUNDARY, PHYSICAL_FEATURE)
+
+    with open(path, 'wb') as f:
+        f.write(b'# vtk DataFile Version 3.0\nDelaunay mesh\nBINARY\nDATASET UNSTRUCTURED_GRID\n')
+
+        f.write('POINTS {} double\n'.format(len(nodes)).encode())
+        for a, b in _chunks(len(nodes), chunksize):
+            f.write(_xyz(nodes[a:b], '>f8').tobytes())
+
+        f.write('\nCELLS {} {}\n'.format(numCells, 4*numTriangles + 3*numLines).encode())
+        for tri in _triangleChunks(m, chunksize):
+            f.write(np.concatenate([np.full((len(tri), 1), 3), tri], axis=1).astype('>i4').tobytes())
+        for group in groups:
+            for seg in _edgeChunks(m, group, chunksize):
+                f.write(np.concatenate([np.full((len(seg), 1), 2), seg], axis=1).astype('>i4').tobytes())
+
+        # Cell types 5 (triangle) and 3 (line).
+        f.write('\nCELL_TYPES {}\n'.format(numCells).encode())
+        for num, cellType in ((numTriangles, 5), (numLines, 3)):
+            for a, b in _chunks(num, chunksize):
+                f.write(np.full(b - a, cellType, dtype='>i4').tobytes())
+
+        f.write('\nCELL_DATA {}\nSCALARS physical int 1\nLOOKUP_TABLE default\n'.format(numCells).encode())
+        for num, group in ((numTriangles, PHYSICAL_DOMAIN), (numBoundary, PHYSICAL_BOUNDARY), (numFeature, PHYSICAL_FEATURE)):
+            for a, b in _chunks(num, chunksize):
+                f.write(np.full(b - a, group, dtype='>i4').tobytes())
+        f.write(b'\n')
+
+
+def write_msh(m, path, chunksize=CHUNKSIZE):
+
+# Write the mesh m to 'path' in the binary Gmsh 4.1 format. The triangles make up surface 1,
+# in physical group PHYSICAL_DOMAIN, and the boundary and feature edges curves 1 and 2, in
+# groups PHYSICAL_BOUNDARY and PHYSICAL_FEATURE. All of the nodes belong to surface 1.
+
+    nodes = m.nodes
+    numNodes = len(nodes)
+    numTriangles, numBoundary, numFeature = _counts(m, chunksize)
+
+    # The bounding box given for each entity: that of all of the nodes.
+    box = np.zeros((2, 3), dtype='<f8')
+    if numNodes > 0: box[:, :2] = [nodes.min(axis=0), nodes.max(axis=0)]
+    box = box.tobytes()
+
+    def sizes(*values): return np.array(values, dtype='<u8').tobytes()
+    def ints(*values): return np.array(values, dtype='<i4').tobytes()
+
+    with open(path, 'wb') as f:
+        f.write(b'$MeshFormat\n4.1 1 8\n' + ints(1) + b'\n$EndMeshFormat\n')
+
+        f.write('$PhysicalNames\n{}\n'.format(len(physicalNames)).encode())
+        for tag, name in physicalNames.items():
+            f.write('{} {} "{}"\n'.format(2 if tag == PHYSICAL_DOMAIN else 1, tag, name).encode())
+        f.write(b'$EndPhysicalNames\n')
+
+        # Entities: no points, two curves and one surface.
+        f.write(b'$Entities\n' + sizes(0, 2, 1, 0))
+        for tag, group in ((1, PHYSICAL_BOUNDARY), (2, PHYSICAL_FEATURE)):
+            f.write(ints(tag) + box + sizes(1) + ints(group) + sizes(0))
+        f.write(ints(1) + box + sizes(1) + ints(PHYSICAL_DOMAIN) + sizes(0))
+        f.write(b'\n$EndEntities\n')
+
+        f.write(b'$Nodes\n' + sizes(1 if numNodes > 0 else 0, numNodes, min(numNodes, 1), numNodes))
+        if numNodes > 0:
+            f.write(ints(2, 1, 0) + sizes(numNodes))
+            for a, b in _chunks(numNodes, chunksize):
+                f.write(np.arange(a + 1, b + 1, dtype='<u8').tobytes())
+            for a, b in _chunks(numNodes, chunksize):
+                f.write(_xyz(nodes[a:b], '<f8').tobytes())
+        f.write(b'\n$EndNodes\n')
+
+        # Element types 2 (3-node triangle) and 1 (2-node line), numbered from 1 in turn.
+        blocks = [(2, 1, 2, numTriangles, _triangleChunks(m, chunksize)),
+                  (1, 1, 1, numBoundary, _edgeChunks(m, PHYSICAL_BOUNDARY, chunksize)),
+                  (1, 2, 1, numFeature, _edgeChunks(m, PHYSICAL_FEATURE, chunksize))]
+        blocks = [xx for xx in blocks if xx[3] > 0]
+        numElements = numTriangles + numBoundary + numFeature
+
+        f.write(b'$Elements\n' + sizes(len(blocks), numElements, min(numElements, 1), numElements))
+        tag = 1
+        for dim, entity, elementType, num, chunks in blocks:
+            f.write(ints(dim, entity, elementType) + sizes(num))
+            for cells in chunks:
+                tags = np.arange(tag, tag + len(cells))[:, None]
+                f.write(np.concatenate([tags, cells + 1], axis=1).astype('<u8').tobytes())
+                tag += len(cells)
+        f.write(b'\n$EndElements\n')
+
+
+def _formatted(fmt, rows):
+    # The rows of a 2-D array as text, one line per row, each formatted with fmt.
+
+    return ((fmt + '\n') * len(rows) % tuple(rows.ravel().tolist())).encode()
+
+
+def write_obj(m, path, chunksize=CHUNKSIZE):
+
+# Write the mesh m to 'path' as a Wavefront .obj file: the nodes as vertices, the triangles as
+# faces and the boundary and feature edges as lines, in the groups named in physicalNames.
+
+    nodes = m.nodes
+
+    with open(path, 'wb') as f:
+        for a, b in _chunks(len(nodes), chunksize):
+            f.write(_formatted('v %r %r 0', nodes[a:b]))
+
+        f.write('g {}\n'.format(physicalNames[PHYSICAL_DOMAIN]).encode())
+        for tri in _triangleChunks(m, chunksize):
+            f.write(_formatted('f %d %d %d', tri + 1))
+
+        for group in (PHYSICAL_BOUNDARY, PHYSICAL_FEATURE):
+            f.write('g {}\n'.format(physicalNames[group]).encode())
+            for seg in _edgeChunks(m, group, chunksize):
+                f.write(_formatted('l %d %d', seg + 1))
+
+
+writers = {'.vtk': write_vtk, '.msh': write_msh, '.obj': write_obj}
@@ -1,18 +1,101 @@
 import numpy as np
 
-TOL = 1.0e-9
+from fractions import Fraction
+
+# The orientation and in-circle determinants are first evaluated in floating point
+# and compared against an a priori bound on their round-off error (the "stage A"
+# bounds from Shewchuk, "Adaptive Precision Floating-Point Arithmetic and Fast Robust
+# Geometric Predicates"). Only when the float result is too close to zero for its sign
+# to be trusted is the determinant re-evaluated exactly in rational arithmetic, so
+# every predicate below returns the exact answer for the given co-ordinates.
+
+EPS = 2.0**-53
+
+CCW_ERRBOUND = (3.0 + 16.0*EPS) * EPS
+ICC_ERRBOUND = (10.0 + 96.0*EPS) * EPS
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+def _orientationExact(a, b, c):
+    ax, ay, bx, by, cx, cy = [Fraction(float(v)) for v in (a[0], a[1], b[0], b[1], c[0], c[1])]
+    return _sign((ax-cx)*(by-cy) - (ay-cy)*(bx-cx))
+
+def _incircleExact(a, b, c, d):
+    ax, ay, bx, by, cx, cy, dx, dy = [Fraction(float(v)) for v in (a[0], a[1], b[0], b[1], c[0], c[1], d[0], d[1])]
+
+    adx, ady = ax-dx, ay-dy
+    bdx, bdy = bx-dx, by-dy
+    cdx, cdy = cx-dx, cy-dy
+
+    det = (adx*adx + ady*ady) * (bdx*cdy - cdx*bdy) \
+        + (bdx*bdx + bdy*bdy) * (cdx*ady - adx*cdy) \
+        + (cdx*cdx + cdy*cdy) * (adx*bdy - bdx*ady)
+
+    return _sign(det)
+
+def orientation(a, b, c):
+    # +1 if c lies to the left of the directed line a->b (a, b, c counter-clockwise),
+    # -1 if it lies to the right and 0 if the three points are collinear.
+
+    ax, ay, bx, by, cx, cy = float(a[0]), float(a[1]), float(b[0]), float(b[1]), float(c[0]), float(c[1])
+
+    detleft  = (ax-cx)*(by-cy)
+    detright = (ay-cy)*(bx-cx)
+    det = detleft - detright
+
+    # The signs of the two products are exact, so the sign of det is too whenever they
+    # do not have the same sign.
+    if detleft > 0.0:
+        if detright <= 0.0: return _sign(det)
+        detsum = detleft + detright
+    elif detleft < 0.0:
+        if detright >= 0.0: return _sign(det)
+        detsum = -detleft - detright
+    else:
+        return _sign(det)
+
+    errbound = CCW_ERRBOUND * detsum
+    if (det > errbound) | (-det > errbound): return _sign(det)
+
+    if (ax == bx) & (ay == by): return 0
+
+    return _orientationExact(a, b, c)
+
+def incircle(a, b, c, d):
+    # +1 if d lies inside the circumcircle of the counter-clockwise triangle (a, b, c),
+    # -1 if it lies outside and 0 if the four points are cocircular.
+
+    dx, dy = float(d[0]), float(d[1])
+
+    adx, ady = float(a[0])-dx, float(a[1])-dy
+    bdx, bdy = float(b[0])-dx, float(b[1])-dy
+    cdx, cdy = float(c[0])-dx, float(c[1])-dy
+
+    bdxcdy, cdxbdy = bdx*cdy, cdx*bdy
+    cdxady, adxcdy = cdx*ady, adx*cdy
+    adxbdy, bdxady = adx*bdy, bdx*ady
+
+    alift = adx*adx + ady*ady
+    blift = bdx*bdx + bdy*bdy
+    clift = cdx*cdx + cdy*cdy
+
+    det = alift*(bdxcdy - cdxbdy) + blift*(cdxady - adxcdy) + clift*(adxbdy - bdxady)
+
+    permanent = (abs(bdxcdy) + abs(cdxbdy))*alift \
+              + (abs(cdxady) + abs(adxcdy))*blift \
+              + (abs(adxbdy) + abs(bdxady))*clift
+
+    errbound = ICC_ERRBOUND * permanent
+    if (det > errbound) | (-det > errbound): return _sign(det)
+
+    return _incircleExact(a, b, c, d)
 
 def point_in_ccircle(ptest, a, b, c):
-    
-    # Must be a counter-clockwise boundary.
 
-    dxy2 = ptest[0]**2 + ptest[1]**2
+    # Must be a counter-clockwise boundary.
 
-    M = [[a[0]-ptest[0], a[1]-ptest[1], a[0]**2 + a[1]**2 - dxy2],\
-         [b[0]-ptest[0], b[1]-ptest[1], b[0]**2 + b[1]**2 - dxy2], \
-         [c[0]-ptest[0], c[1]-ptest[1], c[0]**2 + c[1]**2 - dxy2]]
-    
-    return np.linalg.det(M) > 0.0
+    return incircle(a, b, c, ptest) > 0
 
 
 def pointOnFeatureLeft(pxy, fxy1, fxy2):
@@ -20,96 +103,297 @@ def pointOnFeatureLeft(pxy, fxy1, fxy2):
     # pxy coords of the point to be tested.
     # fxy1 coords of the feature point 1.
     # fxy2 coords of the feature point 2.
-    
-    return (np.cross(fxy2-fxy1, pxy-fxy1) > 0.0)
-
-def lineCrossingParameter(pxy, bnorm, fxy1, fxy2):
-    
-    bperp = np.array([-bnorm[1], bnorm[0]])
-    
-    dfxy = fxy2 - fxy1
-    disc = np.dot(dfxy, bperp)
-    
-    if abs(disc) < np.linalg.norm(dfxy) * 1.0e-9:
-        return None
-    
-    rlam = np.dot((pxy-fxy1), bperp) / disc
-    
-    return rlam
-    
+
+    return orientation(fxy1, fxy2, pxy) > 0
+
+def pointInBoundaryElement(pxy, fxy1, fxy2):
+    # Is pxy inside the boundary element to the left of the hull edge [fxy1, fxy2] ? Its region is
+    # the open half-plane to the left of the edge together with the open edge itself, so that a
+    # node inserted on a hull edge splits it (the usual rule for ghost triangles).
+
+    disc = orientation(fxy1, fxy2, pxy)
+    if disc != 0: return disc > 0
+
+    k = 0 if fxy1[0] != fxy2[0] else 1
+    return min(fxy1[k], fxy2[k]) < pxy[k] < max(fxy1[k], fxy2[k])
+
+# Batch versions of the predicates. The triangle corners and feature end points are
+# given as (N,2) arrays (or a single (2,) point, which is broadcast) and the result
+# is an (N,) array. Entries whose sign the float filter cannot decide are passed to
+# the scalar predicates, so the results always agree with them.
+
+def orientation_batch(a, b, c):
+
+    a, b, c = np.broadcast_arrays(*[np.asarray(xy, dtype=float) for xy in (a, b, c)])
+
+    detleft  = (a[...,0]-c[...,0])*(b[...,1]-c[...,1])
+    detright = (a[...,1]-c[...,1])*(b[...,0]-c[...,0])
+    det = detleft - detright
+
+    res = np.sign(det).astype(int)
+
+    sameSign = ((detleft > 0.0) & (detright > 0.0)) | ((detleft < 0.0) & (detright < 0.0))
+    unsure = sameSign & (np.abs(det) <= CCW_ERRBOUND * (np.abs(detleft) + np.abs(detright)))
+    for ix in zip(*np.nonzero(unsure)):
+        res[ix] = _orientationExact(a[ix], b[ix], c[ix])
+
+    return res
+
+def incircle_batch(a, b, c, d):
+
+    a, b, c, d = np.broadcast_arrays(*[np.asarray(xy, dtype=float) for xy in (a, b, c, d)])
+
+    adx, ady = a[...,0]-d[...,0], a[...,1]-d[...,1]
+    bdx, bdy = b[...,0]-d[...,0], b[...,1]-d[...,1]
+    cdx, cdy = c[...,0]-d[...,0], c[...,1]-d[...,1]
+
+    bdxcdy, cdxbdy = bdx*cdy, cdx*bdy
+    cdxady, adxcdy = cdx*ady, adx*cdy
+    adxbdy, bdxady = adx*bdy, bdx*ady
+
+    alift = adx*adx + ady*ady
+    blift = bdx*bdx + bdy*bdy
+    clift = cdx*cdx + cdy*cdy
+
+    det = alift*(bdxcdy - cdxbdy) + blift*(cdxady - adxcdy) + clift*(adxbdy - bdxady)
+
+    permanent = (np.abs(bdxcdy) + np.abs(cdxbdy))*alift \
+              + (np.abs(cdxady) + np.abs(adxcdy))*blift \
+              + (np.abs(adxbdy) + np.abs(bdxady))*clift
+
+    res = np.sign(det).astype(int)
+
+    unsure = np.abs(det) <= ICC_ERRBOUND * permanent
+    for ix in zip(*np.nonzero(unsure)):
+        res[ix] = _incircleExact(a[ix], b[ix], c[ix], d[ix])
+
+    return res
+
+def point_in_ccircle_batch(ptest, a, b, c):
+    # Same test as point_in_ccircle, for N counter-clockwise triangles at once.
+
+    return incircle_batch(a, b, c, ptest) > 0
+
+def pointOnFeatureLeftBatch(pxy, fxy1, fxy2):
+    # Same test as pointOnFeatureLeft, for N features at once.
+
+    return orientation_batch(fxy1, fxy2, pxy) > 0
+
+def pointInBoundaryElementBatch(pxy, fxy1, fxy2):
+    # Same test as pointInBoundaryElement, for N hull edges at once.
+
+    pxy, fxy1, fxy2 = np.broadcast_arrays(*[np.asarray(xy, dtype=float) for xy in (pxy, fxy1, fxy2)])
+
+    disc = orientation_batch(fxy1, fxy2, pxy)
+
+    k = np.where(fxy1[...,0] != fxy2[...,0], 0, 1)[..., None]
+    p, f1, f2 = [np.take_along_axis(xy, k, axis=-1)[..., 0] for xy in (pxy, fxy1, fxy2)]
+    between = (np.minimum(f1, f2) < p) & (p < np.maximum(f1, f2))
+
+    return (disc > 0) | ((disc == 0) & between)
+
+def segmentsTouchBatch(pxy1, pxy2, fxy1, fxy2):
+    # Which of the N segments [fxy1, fxy2] touch or cross the segment [pxy1, pxy2] ?
+    # Collinear and end-point contacts count as touching, so the result is a superset
+    # of the segments that segmentsCross would report.
+
+    d1 = orientation_batch(pxy1, pxy2, fxy1)
+    d2 = orientation_batch(pxy1, pxy2, fxy2)
+    d3 = orientation_batch(fxy1, fxy2, pxy1)
+    d4 = orientation_batch(fxy1, fxy2, pxy2)
+
+    return (d1*d2 <= 0) & (d3*d4 <= 0)
+
+def segmentsCross(pxy1, pxy2, fxy1, fxy2):
+    # Do the segments [pxy1, pxy2] and [fxy1, fxy2] cross at a point interior to both ?
+
+    if orientation(pxy1, pxy2, fxy1) * orientation(pxy1, pxy2, fxy2) >= 0: return False
+    return orientation(fxy1, fxy2, pxy1) * orientation(fxy1, fxy2, pxy2) < 0
+
+def pointInTriangle(pxy, axy, bxy, cxy):
+    # Does pxy lie strictly inside the triangle (axy, bxy, cxy) ? Either orientation of
+    # the triangle is allowed.
+
+    o1 = orientation(axy, bxy, pxy)
+    if o1 == 0: return False
+
+    return (orientation(bxy, cxy, pxy) == o1) & (orientation(cxy, axy, pxy) == o1)
+
 def pointInFeatureShadow(pxy, fxy1, fxy2, txy):
     # All coords specified as 2D numpy arrays.
     # pxy coords of the point to be tested.
     # fxy1 coords of the feature point 1.
     # fxy2 coords of the feature point 2.
     # txy coords of the origin.
-    
-    if not pointOnFeatureLeft(txy, fxy1, fxy2): fxy1, fxy2 = fxy2, fxy1
-    
-    bnorm = pxy - txy 
-    bnorm = bnorm / np.linalg.norm(bnorm)
-    
-    rlam = lineCrossingParameter(txy, bnorm, fxy1, fxy2)
-
-    if not rlam: return False
-    if (rlam< TOL) | (rlam >1.0 - TOL): return False
-    
-    pint = fxy1 + rlam*(fxy2-fxy1)
-    return (np.dot(pxy-pint, pint-txy) >= 0.0)
-
-def lineInRayPath(txy, bnorm, fxy1, fxy2):
-    # Determine if a ray path defined by point txy and the 
-    # unit direction bnorm crosses the line segment [fxy1, fxy2]
-    
-    rlam = lineCrossingParameter(txy, bnorm, fxy1, fxy2)
-
-    if not rlam: return False
-    if (rlam<TOL) | (rlam >1.0-TOL): return False
-    
-    pint = fxy1 + rlam*(fxy2-fxy1)  # The intersection point.
-    
-    return np.dot(bnorm, pint-txy) >= TOL
+
+    # The ray from txy towards pxy must pass through the interior of the feature ...
+
+    if orientation(txy, pxy, fxy1) * orientation(txy, pxy, fxy2) >= 0: return False
+
+    # ... and pxy must not lie in front of it.
+
+    return orientation(fxy1, fxy2, txy) * orientation(fxy1, fxy2, pxy) <= 0
+
+def rayBeyondCrosses(txy, fxy, pxy1, pxy2):
+    # Does the ray from txy through fxy cross the segment [pxy1, pxy2] at an interior
+    # point that lies beyond fxy ? That is the case exactly when fxy lies strictly
+    # inside the triangle (txy, pxy1, pxy2).
+
+    return pointInTriangle(fxy, txy, pxy1, pxy2)
 
 def lineInFeatureShadow(pxy1, pxy2, fxy1, fxy2, txy):
     # Returns True if all or part of a line is obscured from
     # a given point by a feature line segment.
-    
+
     # All coords specified as 2D numpy arrays.
     # pxy1 coords of the point 1 of the line to be tested.
     # pxy2 coords of the point 2 of the line to be tested.
     # fxy1 coords of the feature point 1.
     # fxy2 coords of the feature point 2.
     # txy coords of the origin.
-    
+
     if pointInFeatureShadow(pxy1, fxy1, fxy2, txy): return True
     if pointInFeatureShadow(pxy2, fxy1, fxy2, txy): return True
-    
-    bnorm1 = fxy1 - txy
-    bnorm1 = bnorm1 / np.linalg.norm(bnorm1)   
-    if lineInRayPath(fxy1, bnorm1, pxy1, pxy2): return True
-    
-    bnorm2 = fxy2 - txy
-    bnorm2 = bnorm2 / np.linalg.norm(bnorm2)
-    if lineInRayPath(fxy2, bnorm2, pxy1, pxy2): return True
-    
+
+    if rayBeyondCrosses(txy, fxy1, pxy1, pxy2): return True
+    if rayBeyondCrosses(txy, fxy2, pxy1, pxy2): return True
+
     return False
 
 def elementInFeatureShadow(pxy1, pxy2, pxy3, fxy1, fxy2, txy):
     if pointInFeatureShadow(pxy1, fxy1, fxy2, txy): return True
     if pointInFeatureShadow(pxy2, fxy1, fxy2, txy): return True
     if pointInFeatureShadow(pxy3, fxy1, fxy2, txy): return True
-    
-    bnorm1 = fxy1 - txy
-    bnorm1 = bnorm1 / np.linalg.norm(bnorm1)
-    if lineInRayPath(fxy1, bnorm1, pxy1, pxy2): return True
-    if lineInRayPath(fxy1, bnorm1, pxy1, pxy3): return True    
-    if lineInRayPath(fxy1, bnorm1, pxy2, pxy3): return True
-    
-    bnorm2 = fxy2 - txy
-    bnorm2 = bnorm2 / np.linalg.norm(bnorm2)
-    if lineInRayPath(fxy2, bnorm2, pxy1, pxy2): return True
-    if lineInRayPath(fxy2, bnorm2, pxy1, pxy3): return True    
-    if lineInRayPath(fxy2, bnorm2, pxy2, pxy3): return True
-    
+
+    if rayBeyondCrosses(txy, fxy1, pxy1, pxy2): return True
+    if rayBeyondCrosses(txy, fxy1, pxy1, pxy3): return True
+    if rayBeyondCrosses(txy, fxy1, pxy2, pxy3): return True
+
+    if rayBeyondCrosses(txy, fxy2, pxy1, pxy2): return True
+    if rayBeyondCrosses(txy, fxy2, pxy1, pxy3): return True
+    if rayBeyondCrosses(txy, fxy2, pxy2, pxy3): return True
+
     return False
-    
\ No newline at end of file
+
+def _shadowTemplate(num):
+    # The orientation triples needed by elementInFeatureShadowBatch for a line (num=2) or an
+    # element (num=3), as indices into [txy, corners..., feature ends]. Index -1 stands for
+    # the first end of each feature and -2 for the second.
+
+    pairs = [(0, 1)] if num == 2 else [(0, 1), (0, 2), (1, 2)]
+
+    triples = []
+    for k in range(num):
+        for f in (-1, -2): triples.append((0, 1+k, f))        # the ray from txy through each corner.
+    triples.append((-1, -2, 0))                               # the side of each feature txy is on ...
+    for k in range(num): triples.append((-1, -2, 1+k))        # ... and the side each corner is on.
+    for i, j in pairs:
+        for f in (-1, -2): triples.append((1+i, 1+j, f))      # feature ends against the element sides.
+
+    return pairs, np.array(triples)
+
+_SHADOW_TEMPLATES = {2: _shadowTemplate(2), 3: _shadowTemplate(3)}
+
+def elementInFeatureShadowBatch(pxyList, fxy, txy):
+    # Vectorized lineInFeatureShadow (two points in pxyList) or elementInFeatureShadow
+    # (three points) against all the features in the (F,2,2) array fxy at once.
+    # Returns an (F,) boolean mask that matches the scalar functions exactly.
+
+    fxy = np.asarray(fxy, dtype=float).reshape(-1, 2, 2)
+    numFeatures = len(fxy)
+    num = len(pxyList)
+
+    pairs, triples = _SHADOW_TEMPLATES[num]
+
+    # Evaluate every orientation needed by the scalar tests in a single batch.
+
+    pts = np.concatenate([np.asarray(txy, dtype=float).reshape(1, 2), np.asarray(pxyList, dtype=float).reshape(-1, 2), fxy[:,0], fxy[:,1]])
+
+    fidx = (num+1) + (-triples[...,None]-1)*numFeatures + np.arange(numFeatures)
+    idx = np.where(triples[...,None] >= 0, triples[...,None], fidx)
+
+    signs = orientation_batch(pts[idx[:,0]], pts[idx[:,1]], pts[idx[:,2]])
+
+    otp = signs[:2*num].reshape(num, 2, numFeatures)
+    oft = signs[2*num]
+    ofp = signs[2*num+1:3*num+1]
+    opp = signs[3*num+1:].reshape(len(pairs), 2, numFeatures)
+
+    res = np.zeros(numFeatures, dtype=bool)
+
+    # pointInFeatureShadow for each corner.
+    for k in range(num):
+        res |= (otp[k,0]*otp[k,1] < 0) & (oft*ofp[k] <= 0)
+
+    # rayBeyondCrosses for each feature end and each side, i.e. the feature end lies
+    # strictly inside the triangle (txy, corner i, corner j).
+    for ip, (i, j) in enumerate(pairs):
+        for e in range(2):
+            o1 = otp[i,e]
+            res |= (o1 != 0) & (opp[ip,e] == o1) & (-otp[j,e] == o1)
+
+    return res
+
+# Triangle measures used by mesh refinement. Unlike the predicates above, these are
+# ordinary floating point quantities.
+
+def circumcenter(a, b, c):
+    # Centre of the circle through a, b and c, or None if they are collinear.
+
+    bx, by = b[0]-a[0], b[1]-a[1]
+    cx, cy = c[0]-a[0], c[1]-a[1]
+
+    d = 2.0*(bx*cy - by*cx)
+    if d == 0.0: return None
+
+    b2 = bx*bx + by*by
+    c2 = cx*cx + cy*cy
+
+    return np.array([a[0] + (cy*b2 - by*c2)/d, a[1] + (bx*c2 - cx*b2)/d])
+
+def triangleMeasures_batch(a, b, c):
+    # Signed area and sine of the smallest angle of each of the counter-clockwise
+    # triangles (a, b, c), given as (N,2) arrays.
+
+    a, b, c = [np.asarray(xy, dtype=float).reshape(-1, 2) for xy in (a, b, c)]
+
+    la = np.hypot(*(c - b).T)
+    lb = np.hypot(*(a - c).T)
+    lc = np.hypot(*(b - a).T)
+
+    area = 0.5*((b[:,0]-a[:,0])*(c[:,1]-a[:,1]) - (b[:,1]-a[:,1])*(c[:,0]-a[:,0]))
+
+    # The smallest angle is opposite the shortest side, and its sine is twice the area
+    # divided by the product of the other two sides.
+    lengths = np.sort(np.stack([la, lb, lc], axis=1), axis=1)
+    denom = lengths[:,1]*lengths[:,2]
+
+    sinMin = np.zeros(len(area))
+    np.divide(2.0*area, denom, out=sinMin, where=denom > 0.0)
+
+    return area, sinMin
+
+def triangleQuality_batch(a, b, c):
+    # Quality measures of the triangles (a, b, c), given as (N,2) arrays: the smallest and
+    # largest angles (degrees), the ratio of the circumradius to the shortest side (1/sqrt(3)
+    # for an equilateral triangle, inf for a degenerate one) and the signed area (negative for
+    # a clockwise triangle).
+
+    a, b, c = [np.asarray(xy, dtype=float).reshape(-1, 2) for xy in (a, b, c)]
+
+    ab, bc, ca = b - a, c - b, a - c
+    cross = ab[:,0]*(-ca[:,1]) - ab[:,1]*(-ca[:,0])
+    area = 0.5*cross
+
+    # The angle at each corner from the cross and dot products of the sides that meet there.
+    dots = np.stack([-(ab*ca).sum(axis=1), -(bc*ab).sum(axis=1), -(ca*bc).sum(axis=1)], axis=1)
+    angles = np.degrees(np.arctan2(np.abs(cross)[:,None], dots))
+
+    lengths = np.stack([np.hypot(*ab.T), np.hypot(*bc.T), np.hypot(*ca.T)], axis=1)
+    shortest = lengths.min(axis=1)
+    denom = 4.0*np.abs(area)*shortest
+
+    radiusEdge = np.full(len(area), np.inf)
+    np.divide(lengths.prod(axis=1), denom, out=radiusEdge, where=denom > 0.0)
+
+    return angles.min(axis=1), angles.max(axis=1), radiusEdge, area
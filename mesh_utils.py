@@ -1,63 +1,72 @@
+# The boundary of a cavity is held as a dict mapping the start node of each boundary
+# edge to the tuple (edge, orientation, start node, end node), so that the edge that
+# follows any other is found in O(1) by looking up the end node of its predecessor.
+
+
 def orderEdgesPolyline(ielist):
-    
-    ielist2 = [ielist[0]]
-    n1 = ielist[0][2]
-    n2 = ielist[0][3]
-    n2found = True
-    
-    while n2found:
-        n2found = False
-        for ix, q in enumerate(ielist):
-            if q[2] == n2:
-                ielist2.append(q)
-                n2 = q[3]
-                n2found = True
-                break
-                
-    n1found = True
-    ielist3 = []
-                
-    while n1found:
-        n1found = False
-        for ix, q in enumerate(ielist):
-            if q[3] == n1:                       
-                ielist3.append(q)
-                n1 = q[2]
-                n1found = True
-                break
-    ielist3 = ielist3[-1::-1] # Reverse the order of ielist3            
-    ielist3.extend(ielist2)
-    ielist2 = ielist3
-    
+    # Order the edges of an open cavity boundary from its first edge to its last.
+
+    endNodes = {q[3] for q in ielist.values()}
+    heads = [q for q in ielist.values() if q[2] not in endNodes]
+
+    if len(heads) != 1:
+        raise ValueError("Cavity boundary is not a single polyline ({} open ends).".format(len(heads)))
+
+    ielist2 = [heads[0]]
+    n2 = heads[0][3]
+
+    while n2 in ielist:
+        q = ielist[n2]
+        ielist2.append(q)
+        n2 = q[3]
+
+        if len(ielist2) > len(ielist):
+            raise ValueError("Cavity boundary polyline runs into a loop at node {}.".format(n2))
+
+    if len(ielist2) != len(ielist):
+        raise ValueError("Cavity boundary is broken: {} of {} edges are connected.".format(len(ielist2), len(ielist)))
+
     return ielist2
-    
-  
+
 
 def orderEdgesLoop(ielist):
-    n2 = ielist[0][3]
-    n_orig = ielist[0][2]
-    istart = 1
-    
-    ielist2 = [ielist[0]]
-    
+    # Order the edges of a closed cavity boundary, starting from the first edge in ielist.
+
+    first = next(iter(ielist.values()))
+    n_orig = first[2]
+    n2 = first[3]
+
+    ielist2 = [first]
+
     while n2 != n_orig:
-        for ix, q in enumerate(ielist):
-            if q[2] == n2:
-                ielist2.append(q)
-                n2 = q[3]
-                break
-                
+        if n2 not in ielist:
+            raise ValueError("Cavity boundary loop is broken at node {}.".format(n2))
+
+        q = ielist[n2]
+        ielist2.append(q)
+        n2 = q[3]
+
+        if len(ielist2) > len(ielist):
+            raise ValueError("Cavity boundary loop does not close on node {}.".format(n_orig))
+
+    if len(ielist2) != len(ielist):
+        raise ValueError("Cavity boundary is not a single loop: {} of {} edges are connected.".format(len(ielist2), len(ielist)))
+
     return ielist2
-    
-    
+
+
 def findSingleElementEdges(islist, iolist, edges):
-    # Make a list of edges that are referenced by one element only.
-    ielist = [] 
-    
+    # Make a dict of the edges that are referenced by one element only, keyed by start node.
+    ielist = {}
+
     for q in islist:
         if islist[q] == 1:
-            n1, n2 = edges[q]['nodes']
+            n1, n2 = edges.getNodes(q)
             if not iolist[q]: n1, n2 = n2, n1
-            ielist.append((q, iolist[q], n1, n2)) # edge + orientation + nodes in order
-            
-    return ielist
\ No newline at end of file
+
+            if n1 in ielist:
+                raise ValueError("Cavity boundary branches at node {}.".format(n1))
+
+            ielist[n1] = (q, iolist[q], n1, n2) # edge + orientation + nodes in order
+
+    return ielist
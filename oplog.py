@@ -0,0 +1,363 @@
+import os
+
+import numpy as np
+
+from delaunay_mesh import mesh
+from draw import padded
+from video import frameRecorder
+
+# A compact binary log of the changes made to the topology of a mesh, from which the
+# state of the mesh after any step can be rebuilt, inspected or rendered again.
+#
+# The file holds a 16 byte header followed by records of 24 bytes. Each record holds an
+# operation code, a byte of flags, the number of the node, edge or element that it
+# concerns and the full new state of that entity, so the state of the mesh after a step
+# is given by the last record for each entity up to the end of that step. A step ends
+# with a STEP record that holds the sizes of the node, edge and element tables.
+#
+# The mesh marks the end of a step after each of its operations (see mesh.logStep).
+# The entities changed by the step are found from the 'touched' sets of the tables
+# and compared with their state when last logged, so that only real changes are written.
+
+NODE, EDGE_ADD, EDGE_DELETE, FLIP, EDGE_FLAGS, ELEMENT_ADD, ELEMENT_DELETE, ELEMENT_SET, STEP = range(1, 10)
+
+EDGE_OPS = [EDGE_ADD, EDGE_DELETE, FLIP, EDGE_FLAGS]
+ELEMENT_OPS = [ELEMENT_ADD, ELEMENT_DELETE, ELEMENT_SET]
+
+# Edge records:    data - the end nodes; flags - bit 0 hull edge, bit 1 feature, bits 2-3 number of parents.
+# Element records: data - the edges of the sides (-1 if unused); flags - bits 0-2 orientations, bits 3-4 number of sides.
+# Node records:    xy - the co-ordinates.
+# STEP records:    id - the step number; data - the numbers of nodes, edges and elements.
+
+recordType = np.dtype([('op', 'u1'), ('flags', 'u1'), ('spare', '<u2'), ('id', '<i4'), ('data', '<i4', (4,))])
+nodeRecordType = np.dtype([('op', 'u1'), ('flags', 'u1'), ('spare', '<u2'), ('id', '<i4'), ('xy', '<f8', (2,))])
+
+MAGIC = b'DMOPLOG1'
+HEADER = 16
+
+
+def _drain(table):
+    # The slots touched since the last call, in order.
+
+    ids = np.fromiter(table.touched, dtype=np.int64, count=len(table.touched))
+    table.touched.clear()
+    return np.sort(ids)
+
+
+def _latest(records, ops):
+    # The last of the records with one of the operation codes ops for each entity.
+
+    sel = records[np.isin(records['op'], ops)]
+    ids, first = np.unique(sel['id'][::-1], return_index=True)
+    return sel[len(sel) - 1 - first]
+
+
+def _edgeStyle(flags, internal):
+    # The style of each edge, as for draw.meshState(), from its logged flags.
+
+    flags = np.asarray(flags, dtype=np.int16)
+    style = np.where(flags & 2 > 0, 2, np.where(flags & 1 > 0, 1, 0)).astype(np.int8)
+    style[(flags < 0) | (flags >> 2 == 0)] = -1
+    if not internal: style[style < 2] = -1
+    return style
+
+
+def _triangleEdges(flags, edges):
+    # The edges of each element, as for draw.meshState(), from its logged flags and edges.
+
+    flags = np.asarray(flags, dtype=np.int16)
+    return np.where((flags >> 3 == 3)[:, None] & (flags >= 0)[:, None], edges, -1).astype(np.int64)
+
+
+def _edgeFlags(bnd, feature, npar):
+    return bnd.astype(np.int16) | (feature.astype(np.int16) << 1) | (npar.astype(np.int16) << 2)
+
+
+def _elementFlags(orn, nside):
+    return orn[:, 0].astype(np.int16) | (orn[:, 1] << 1) | (orn[:, 2] << 2) | (nside.astype(np.int16) << 3)
+
+
+class opLogWriter:
+
+# Records the changes made to mesh m in the file 'path'. Created by mesh.startLog().
+
+    def __init__(self, path, m):
+        self.m = m
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + np.array([recordType.itemsize, 0], dtype='<u4').tobytes())
+
+        self.numSteps = 0
+        self.flipped = set()  # edges flipped during the current step.
+
+        # The state of each edge and element when it was last logged; flags of -1 mark a deleted one.
+
+        self.edgeNodes = np.zeros((0, 2), dtype=np.int64)
+        self.edgeFlags = np.zeros(0, dtype=np.int16)
+        self.elementEdges = np.zeros((0, 3), dtype=np.int64)
+        self.elementFlags = np.zeros(0, dtype=np.int16)
+
+        # Whatever is already in the mesh is logged by the first step.
+
+        for table in (m.nodeTable, m.edgeTable, m.elementTable):
+            table.touched = set(range(len(table)))
+
+    def step(self):
+        # Write the changes made since the previous step, followed by a STEP record.
+
+        m = self.m
+        end = np.zeros(1, dtype=recordType)
+        end['op'] = STEP
+        end['id'] = self.numSteps
+        end['data'][0, :3] = len(m.nodeTable), len(m.edgeTable), len(m.elementTable)
+
+        records = [self.nodeRecords(), self.edgeRecords(), self.elementRecords(), end]
+        self.file.write(b''.join(r.tobytes() for r in records))
+
+        self.numSteps += 1
+        self.flipped.clear()
+
+    def close(self):
+        m = self.m
+        if any(table.touched for table in (m.nodeTable, m.edgeTable, m.elementTable)): self.step()
+
+        for table in (m.nodeTable, m.edgeTable, m.elementTable):
+            table.touched = None
+
+        self.file.close()
+
+    def nodeRecords(self):
+        nt = self.m.nodeTable
+        ids = _drain(nt)
+        ids = ids[ids < len(nt)]
+
+        res = np.zeros(len(ids), dtype=nodeRecordType)
+        res['op'] = NODE
+        res['id'] = ids
+        res['xy'] = nt.xy[ids]
+        return res.view(recordType)
+
+    def edgeRecords(self):
+        et = self.m.edgeTable
+        ids = _drain(et)
+
+        if len(ids) > 0 and ids[-1] >= len(self.edgeFlags):
+            self.edgeNodes = padded(self.edgeNodes, max(ids[-1] + 1, 2*len(self.edgeFlags)), -1)
+            self.edgeFlags = padded(self.edgeFlags, len(self.edgeNodes), -1)
+
+        live = (ids < len(et)) & ~np.isin(ids, et.free)
+        nodes = et.nodes[ids]
+        flags = np.where(live, _edgeFlags(et.bnd[ids], et.feature[ids], et.npar[ids]), -1)
+
+        was = self.edgeFlags[ids] >= 0
+        moved = (nodes != self.edgeNodes[ids]).any(axis=1)
+        flipped = np.isin(ids, list(self.flipped))
+
+        op = np.zeros(len(ids), dtype=np.uint8)
+        op[live & ~was] = EDGE_ADD
+        op[live & was & moved] = EDGE_ADD
+        op[live & was & moved & flipped] = FLIP
+        op[live & was & ~moved & (flags != self.edgeFlags[ids])] = EDGE_FLAGS
+        op[~live & was] = EDGE_DELETE
+
+        self.edgeNodes[ids[live]] = nodes[live]
+        self.edgeFlags[ids] = flags
+
+        keep = op > 0
+        res = np.zeros(int(keep.sum()), dtype=recordType)
+        res['op'] = op[keep]
+        res['flags'] = np.maximum(flags[keep], 0)
+        res['id'] = ids[keep]
+        res['data'][:, :2] = nodes[keep]
+        return res
+
+    def elementRecords(self):
+        el = self.m.elementTable
+        ids = _drain(el)
+
+        if len(ids) > 0 and ids[-1] >= len(self.elementFlags):
+            self.elementEdges = padded(self.elementEdges, max(ids[-1] + 1, 2*len(self.elementFlags)), -1)
+            self.elementFlags = padded(self.elementFlags, len(self.elementEdges), -1)
+
+        nside = np.where(ids < len(el), el.nside[ids], 0)
+        live = nside > 0
+        edges = np.where(np.arange(3) < nside[:, None], el.edges[ids], -1)
+        flags = np.where(live, _elementFlags(el.orn[ids] & (np.arange(3) < nside[:, None]), nside), -1)
+
+        was = self.elementFlags[ids] >= 0
+        differs = (flags != self.elementFlags[ids]) | (edges != self.elementEdges[ids]).any(axis=1)
+
+        op = np.zeros(len(ids), dtype=np.uint8)
+        op[live & ~was] = ELEMENT_ADD
+        op[live & was & differs] = ELEMENT_SET
+        op[~live & was] = ELEMENT_DELETE
+
+        self.elementEdges[ids] = edges
+        self.elementFlags[ids] = flags
+
+        keep = op > 0
+        res = np.zeros(int(keep.sum()), dtype=recordType)
+        res['op'] = op[keep]
+        res['flags'] = np.maximum(flags[keep], 0)
+        res['id'] = ids[keep]
+        res['data'][:, :3] = edges[keep]
+        return res
+
+
+class opLog:
+
+# An operation log written by opLogWriter, memory-mapped for reading. len(log) is the
+# number of steps, which are numbered from 0.
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER)
+
+        if len(header) < HEADER or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a mesh operation log.".format(path))
+
+        numRecords = (os.path.getsize(path) - HEADER) // recordType.itemsize
+
+        if numRecords > 0:
+            self.records = np.memmap(path, dtype=recordType, mode='r', offset=HEADER, shape=(numRecords,))
+        else:
+            self.records = np.zeros(0, dtype=recordType)
+
+        self.steps = np.flatnonzero(self.records['op'] == STEP)  # the STEP record that ends each step.
+
+    def __len__(self):
+        return len(self.steps)
+
+    def stepRecords(self, step):
+        # The records written by a step, without its STEP record.
+
+        start = self.steps[step-1] + 1 if step > 0 else 0
+        return self.records[start:self.steps[step]]
+
+    def sizes(self, step):
+        # The numbers of nodes, edges and elements after a step.
+        return [int(x) for x in self.records[self.steps[step]]['data'][:3]]
+
+    def nodeCoords(self, records, numNodes, nodes=None):
+        # Node co-ordinates after the records, starting from 'nodes'.
+
+        nodes = padded(np.zeros((0, 2)) if nodes is None else nodes, numNodes, np.nan)
+
+        sel = _latest(records, [NODE])
+        sel = sel[sel['id'] < numNodes]
+        nodes[sel['id']] = sel.view(nodeRecordType)['xy']
+        return nodes
+
+    def state(self, step):
+        # The mesh tables after a step, as a dict of arrays: 'nodes' (N,2) co-ordinates,
+        # 'edgeNodes' (E,2) and 'edgeFlags' (E,), 'elementEdges' (T,3) and 'elementFlags' (T,),
+        # with flags as in the records and -1 for the slots of deleted edges and elements.
+
+        if not 0 <= step < len(self):
+            raise IndexError("Step {} is not in the log ({} steps).".format(step, len(self)))
+
+        records = self.records[:self.steps[step]]
+        numNodes, numEdges, numElements = self.sizes(step)
+
+        res = {'nodes':        self.nodeCoords(records, numNodes),
+               'edgeNodes':    np.full((numEdges, 2), -1, dtype=np.int64),
+               'edgeFlags':    np.full(numEdges, -1, dtype=np.int16),
+               'elementEdges': np.full((numElements, 3), -1, dtype=np.int64),
+               'elementFlags': np.full(numElements, -1, dtype=np.int16)}
+
+        for ops, dead, nodes, flags, width in [(EDGE_OPS, EDGE_DELETE, 'edgeNodes', 'edgeFlags', 2),
+                                               (ELEMENT_OPS, ELEMENT_DELETE, 'elementEdges', 'elementFlags', 3)]:
+            sel = _latest(records, ops)
+            sel = sel[sel['id'] < len(res[flags])]
+            sel = sel[sel['op'] != dead]
+            res[nodes][sel['id']] = sel['data'][:, :width]
+            res[flags][sel['id']] = sel['flags']
+
+        return res
+
+    def mesh(self, step):
+        # A mesh object in the state after a step.
+
+        state = self.state(step)
+        m = mesh()
+        m.addNodes(state['nodes'])
+
+        et = m.edgeTable
+        el = m.elementTable
+
+        numEdges = len(state['edgeFlags'])
+        numElements = len(state['elementFlags'])
+
+        eflags = state['edgeFlags']
+        et.reserve(numEdges)
+        et.count = numEdges
+        et.nodes[:numEdges] = np.maximum(state['edgeNodes'], 0)
+        et.bnd[:numEdges] = (eflags >= 0) & (eflags & 1 > 0)
+        et.feature[:numEdges] = (eflags >= 0) & (eflags & 2 > 0)
+        et.free = np.flatnonzero(eflags < 0).tolist()
+
+        lflags = state['elementFlags']
+        el.reserve(numElements)
+        el.count = numElements
+        el.nside[:numElements] = np.where(lflags >= 0, lflags >> 3, 0)
+        el.orn[:numElements] = (np.maximum(lflags, 0)[:, None] >> np.arange(3)) & 1 > 0
+        el.edges[:numElements] = np.maximum(state['elementEdges'], 0)
+        el.free = np.flatnonzero(lflags < 0).tolist()
+
+        # The parents of each edge are the elements that have it as a side.
+
+        iel, iside = np.nonzero(state['elementEdges'] >= 0)
+        ie = state['elementEdges'][iel, iside]
+        order = np.argsort(ie, kind='stable')
+        ie, iel = ie[order], iel[order]
+
+        counts = np.bincount(ie, minlength=numEdges)
+        if len(counts) > 0 and counts.max() > 2:
+            raise ValueError("An edge has more than two parent elements at step {}.".format(step))
+
+        first = np.cumsum(counts) - counts
+        pos = np.arange(len(ie)) - first[ie]
+        et.parents[ie, pos] = iel
+        et.npar[:numEdges] = counts
+
+        et.reindex()
+        et.newFeatures = np.flatnonzero(et.feature[:numEdges]).tolist()
+
+        return m
+
+    def frames(self, start=0, stop=None, labels=False, arrows=False, internal=True):
+        # A frameRecorder with a frame for each of the steps from start up to (but not including)
+        # stop, for rendering again with video.writeVideo().
+
+        if stop is None: stop = len(self)
+
+        recorder = frameRecorder(labels=labels, arrows=arrows, internal=internal)
+        if start >= stop: return recorder
+
+        state = self.state(start)
+        nodes = state['nodes']
+        style = _edgeStyle(state['edgeFlags'], internal)
+        enodes = state['edgeNodes']
+        eedges = _triangleEdges(state['elementFlags'], state['elementEdges'])
+        recorder.add((nodes, style, enodes, eedges))
+
+        for step in range(start + 1, stop):
+            records = self.stepRecords(step)
+            numNodes, numEdges, numElements = self.sizes(step)
+
+            nodes = self.nodeCoords(records, numNodes, nodes)
+            style = padded(style, numEdges, -1)
+            enodes = padded(enodes, numEdges, -1)
+            eedges = padded(eedges, numElements, -1)
+
+            sel = _latest(records, EDGE_OPS)
+            sel = sel[sel['id'] < numEdges]
+            style[sel['id']] = _edgeStyle(np.where(sel['op'] == EDGE_DELETE, -1, sel['flags'].astype(np.int16)), internal)
+            enodes[sel['id']] = sel['data'][:, :2]
+
+            sel = _latest(records, ELEMENT_OPS)
+            sel = sel[sel['id'] < numElements]
+            eedges[sel['id']] = _triangleEdges(np.where(sel['op'] == ELEMENT_DELETE, -1, sel['flags'].astype(np.int16)), sel['data'][:, :3])
+
+            recorder.add((nodes, style, enodes, eedges))
+
+        return recorder
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from delaunay_mesh import mesh
+from partition import partitionPolygon
+
+# Meshing of many independent boundaries across a pool of worker processes.
+#
+# Each worker builds its meshes with the ordinary mesh class and sends back only the
+# arrays returned by mesh.toArrays() ('nodes', 'triangles' and 'features'), which are
+# far cheaper to pickle than the mesh objects themselves.
+#
+# A single large boundary can also be meshed in parallel by cutting it into pieces of
+# about the same number of nodes (see partition.py), meshing the pieces as independent
+# boundaries and stitching the results back together.
+
+
+def _meshBoundaries(chunk, engine, refine):
+    # Mesh each boundary in chunk. Runs in a worker process.
+
+    res = []
+    for nodeList in chunk:
+        m = mesh()
+        m.addBoundaryLoop(nodeList, engine=engine)
+        if refine is not None: m.refine(**refine)
+        res.append(m.toArrays())
+
+    return res
+
+
+def mesh_many(boundaries, workers=None, chunksize=1, ordered=True, engine='insert', refine=None):
+    # Mesh each of the boundary loops in 'boundaries' with addBoundaryLoop, spread over
+    # 'workers' processes (by default, one per CPU) in chunks of 'chunksize' boundaries.
+    # refine, if given, is a dict of arguments for mesh.refine().
+    #
+    # This is a generator. With ordered=True it yields the mesh.toArrays() dict of each
+    # boundary in input order; with ordered=False it yields (index, arrays) pairs as the
+    # meshes are completed. With workers=1 the boundaries are meshed in this process.
+
+    boundaries = list(boundaries)
+    chunks = [boundaries[ix:ix+chunksize] for ix in range(0, len(boundaries), chunksize)]
+
+    if workers == 1:
+        for ichunk, chunk in enumerate(chunks):
+            for ix, arrays in enumerate(_meshBoundaries(chunk, engine, refine)):
+                yield arrays if ordered else (ichunk*chunksize + ix, arrays)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_meshBoundaries, chunk, engine, refine): ichunk for ichunk, chunk in enumerate(chunks)}
+
+        if ordered:
+            for future in sorted(futures, key=futures.get):
+                for arrays in future.result():
+                    yield arrays
+        else:
+            for future in as_completed(futures):
+                start = futures[future] * chunksize
+                for ix, arrays in enumerate(future.result()):
+                    yield start + ix, arrays
+
+
+def mesh_decomposed(nodeList, workers=None, pieces=None, spacing=None, engine='recover'):
+    # Mesh the boundary loop nodeList by cutting it into 'pieces' pieces (by default, one per
+    # worker), meshing the pieces with mesh_many and stitching them together. The nodes along
+    # the cuts are shared by the pieces either side; they remain in the stitched mesh, as do
+    # the nodes where the cuts cross the boundary. The edges along the cuts are then flipped
+    # as needed to make the stitched mesh Delaunay. spacing is passed to partitionPolygon.
+    # Returns the stitched mesh. Nodes 0 to len(nodeList)-1 are those of nodeList.
+
+    if pieces is None: pieces = workers if workers is not None else os.cpu_count()
+
+    pieceNodes, points = partitionPolygon(nodeList, pieces, spacing)
+
+    triangles = []
+    edges = []
+    for ids, arrays in zip(pieceNodes, mesh_many([points[ids] for ids in pieceNodes], workers=workers, engine=engine)):
+        triangles.append(ids[arrays['triangles']])
+        edges.append(np.sort(ids[arrays['features']], axis=1))
+
+    # The boundary edges of a piece lie on the boundary loop if no other piece shares them,
+    # otherwise they lie along a cut.
+    edges, counts = np.unique(np.concatenate(edges), axis=0, return_counts=True)
+
+    m = mesh()
+    m.addTriangulation(points, np.concatenate(triangles), edges[counts == 1])
+    m.restoreDelaunay([m.findEdge(nodes) for nodes in edges[counts == 2]])
+
+    return m
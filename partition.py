@@ -0,0 +1,317 @@
+import numpy as np
+
+# Decomposition of a boundary loop (a simple, counter-clockwise polygon) into pieces
+# that can be meshed independently.
+#
+# The polygon is divided by recursive bisection: each group of pieces is cut in two by a
+# line across its longer extent, placed so that the two sides hold numbers of nodes in
+# proportion to the numbers of pieces they are to be divided into, and each side is then
+# divided in turn. Where a cut passes through the interior of the polygon, nodes are placed
+# along it; the pieces either side of the cut share those nodes, and the edges between
+# them, so that their meshes join up. Each cut also adds a node to every boundary edge
+# that it crosses.
+#
+# A cut (axis, c) is the line on which co-ordinate 'axis' equals c. It never passes through
+# a node: where the nodes around the ideal position share a co-ordinate, the cut moves to the
+# nearest position between two co-ordinates, which leaves all of those nodes on one side.
+#
+# A later cut can cross an edge along an earlier cut, which is shared by pieces that are
+# then divided separately, so the crossing is known only to the pieces on one side. The
+# nodes placed on such edges are recorded (see cutNodes) and added to the pieces on the
+# other side once the division is complete.
+#
+# The nodes along the cuts cost as much to mesh as the boundary nodes, so they are spaced
+# well apart: at SEAM_SPACING times the mean length of the boundary edges, even 32 pieces
+# add only a few percent to the nodes of a loop. Much further apart, the long edges along
+# the cuts set off cascades of flips when the pieces are stitched back together.
+
+SEAM_SPACING = 32
+
+# Every node is identified by a global node number: the boundary nodes keep their
+# positions in the loop and the nodes created by the cuts are numbered after them.
+
+
+class cutNodes:
+
+# The nodes of a partition: those of the polygon, followed by the nodes created by the cuts.
+# Every node placed on an edge is recorded against the original edge [n1, n2] (n1 < n2)
+# that the edge is part of, with its position along it, from 0 at n1 to 1 at n2.
+
+    def __init__(self, xy):
+        self.xy = [xy]
+        self.count = len(xy)
+
+        self.original = {}   # (n1, n2) -> the original edge that the edge is part of.
+        self.position = {}   # (original edge, node) -> the position of node along it.
+        self.placed = {}     # original edge -> list of (position, node) placed on it.
+
+    def add(self, pxy):
+        # Add nodes at pxy and return their node numbers.
+
+        ids = np.arange(self.count, self.count + len(pxy))
+        self.xy.append(pxy)
+        self.count += len(pxy)
+        return ids
+
+    def cross(self, n1, n2, frac, pxy):
+        # Nodes at the points pxy, where a cut crosses the edges [n1, n2] at the fractions frac of
+        # their lengths. A cut on the other side of an edge may have crossed it at the same point
+        # already, in which case that node is used again. Returns their node numbers.
+
+        ids = []
+        new = []
+        for a, b, s, p in zip(n1.tolist(), n2.tolist(), frac.tolist(), pxy):
+            key = (min(a, b), max(a, b))
+            orig = self.original.setdefault(key, key)
+
+            ta = self.position.get((orig, a), float(a != orig[0]))
+            tb = self.position.get((orig, b), float(b != orig[0]))
+            t = ta + s * (tb - ta)
+
+            x = next((x for tx, x in self.placed.get(orig, ()) if abs(tx - t) < 1e-9), None)
+            if x is None:
+                x = self.count + len(new)
+                new.append(p)
+                self.position[(orig, x)] = t
+                self.placed.setdefault(orig, []).append((t, x))
+
+            self.original[(min(a, x), max(a, x))] = orig
+            self.original[(min(x, b), max(x, b))] = orig
+            ids.append(x)
+
+        self.add(np.array(new).reshape(-1, 2))
+        return np.array(ids, dtype=np.int64)
+
+    def complete(self, ids):
+        # The node numbers ids of a piece with the nodes that have been placed on its edges by
+        # the cuts of other pieces inserted.
+
+        if len(self.original) == 0: return ids
+
+        keys = np.array(list(self.original), dtype=np.int64)
+        ids2 = np.roll(ids, -1)
+        lo, hi = np.minimum(ids, ids2), np.maximum(ids, ids2)
+        hits = np.flatnonzero(np.isin(lo * self.count + hi, keys[:, 0] * self.count + keys[:, 1]))
+
+        at = []
+        extra = []
+        for k in hits.tolist():
+            a, b = int(ids[k]), int(ids2[k])
+            orig = self.original[(min(a, b), max(a, b))]
+
+            ta = self.position.get((orig, a), float(a != orig[0]))
+            tb = self.position.get((orig, b), float(b != orig[0]))
+
+            between = sorted((t, x) for t, x in self.placed[orig] if min(ta, tb) < t < max(ta, tb))
+            if tb < ta: between.reverse()
+
+            at.extend([k + 1] * len(between))
+            extra.extend(x for t, x in between)
+
+        return np.insert(ids, at, extra) if at else ids
+
+    def points(self):
+        # The co-ordinates of all of the nodes.
+        return np.concatenate(self.xy)
+
+
+def crossings(xy, cut):
+    # The edges [i, i+1] of the polygon xy that the cut crosses, the fractions of their lengths
+    # at which it crosses them, and the crossing points.
+
+    axis, c = cut
+    f = xy[:, axis] - c
+    i1 = np.flatnonzero((f > 0) != (np.roll(f, -1) > 0))
+    i2 = (i1 + 1) % len(xy)
+
+    frac = f[i1] / (f[i1] - f[i2])
+    cxy = xy[i1] + (xy[i2] - xy[i1]) * frac[:, None]
+    cxy[:, axis] = c
+
+    return i1, frac, cxy
+
+
+def seamNodes(cxy, cut, spacing):
+    # The parts of the cut that lie inside a polygon, between the crossing points cxy: sorted
+    # along the cut, consecutive pairs of crossings bound them. Returns the pairs (a, b) of
+    # crossings, the number of nodes placed along the seam between each pair, at about the
+    # given spacing, and the co-ordinates of those nodes, seam by seam from a to b.
+
+    order = np.argsort(cxy[:, 1 - cut[0]], kind='stable')
+    a, b = order[0::2], order[1::2]
+
+    length = np.hypot(*(cxy[b] - cxy[a]).T)
+    num = np.maximum(np.ceil(length / spacing).astype(np.int64) - 1, 0)
+
+    pair = np.repeat(np.arange(len(a)), num)
+    k = np.arange(len(pair)) - np.repeat(np.cumsum(num) - num, num) + 1
+    sxy = cxy[a[pair]] + (cxy[b[pair]] - cxy[a[pair]]) * (k / (num[pair] + 1))[:, None]
+    sxy[:, cut[0]] = cut[1]
+
+    return a, b, num, sxy
+
+
+def splitPolygon(xy, ids, cut, spacing, nodes):
+    # Split the polygon with co-ordinates xy and node numbers ids along the cut, which must not
+    # pass through any of its nodes. The new nodes are added to nodes, a cutNodes. Returns the
+    # lists of (xy, ids) pieces on the low and high sides.
+
+    above = xy[:, cut[0]] > cut[1]
+    if above.all(): return [], [(xy, ids)]
+    if not above.any(): return [(xy, ids)], []
+
+    # The ring of nodes with the crossing points of the cut inserted in order, crossing j at
+    # position pos[j].
+
+    i1, frac, cxy = crossings(xy, cut)
+    cids = nodes.cross(ids[i1], ids[(i1 + 1) % len(xy)], frac, cxy)
+
+    ringXY = np.insert(xy, i1 + 1, cxy, axis=0)
+    ringIds = np.insert(ids, i1 + 1, cids)
+    pos = i1 + 1 + np.arange(len(i1))
+
+    a, b, num, sxy = seamNodes(cxy, cut, spacing)
+    sids = nodes.add(sxy)
+    start = np.cumsum(num) - num
+
+    partner = np.empty(len(i1), dtype=np.int64)
+    partner[a], partner[b] = b, a
+
+    seam = {}
+    for p in range(len(a)):
+        s = slice(start[p], start[p] + num[p])
+        seam[a[p]] = (sxy[s], sids[s])
+        seam[b[p]] = (sxy[s][::-1], sids[s][::-1])
+
+    # Trace the pieces. The ring between crossing j and the next is arc j, which lies on the
+    # side of its second node: follow an arc to its end, then the seam from the crossing there
+    # to its partner, and carry on with the arc that starts at the partner.
+
+    ringXY = np.roll(ringXY, -pos[0], axis=0)
+    ringIds = np.roll(ringIds, -pos[0])
+    ends = np.append(pos - pos[0], len(ringXY))
+
+    low, high = [], []
+    visited = np.zeros(len(pos), dtype=bool)
+    for first in range(len(pos)):
+        if visited[first]: continue
+
+        pxy = []
+        pids = []
+        j = first
+
+        while not visited[j]:
+            visited[j] = True
+            e = (j + 1) % len(pos)
+            exy, eids = seam[e]
+
+            pxy.extend([ringXY[ends[j]:ends[j + 1]], ringXY[ends[e]][None], exy])
+            pids.extend([ringIds[ends[j]:ends[j + 1]], ringIds[ends[e]][None], eids])
+
+            j = partner[e]
+
+        if j != first:
+            raise ValueError("Failed to trace a piece of the polygon; is it simple and counter-clockwise ?")
+
+        piece = (np.concatenate(pxy), np.concatenate(pids).astype(np.int64))
+        (high if above[(i1[first] + 1) % len(xy)] else low).append(piece)
+
+    return low, high
+
+
+def seamCount(pieces, cut, spacing):
+    # The number of nodes that the cut would add to the pieces, a list of (xy, ids) polygons.
+
+    res = 0
+    for pxy, pids in pieces:
+        i1, frac, cxy = crossings(pxy, cut)
+        if len(i1) > 0: res += len(i1) + int(seamNodes(cxy, cut, spacing)[2].sum())
+
+    return res
+
+
+def chooseCut(xy, numLow, window):
+    # A cut that leaves about numLow of the points xy on its low side, or None if there is none.
+    # So that the cut does not pass close to a point, it is placed midway across the widest gap
+    # between consecutive co-ordinates within 'window' ranks of numLow, across the longer extent
+    # of xy, or else the shorter. If there is no such gap, because the co-ordinates there are
+    # tied, the cut is placed in the gap nearest to numLow, in whichever direction that is nearer.
+
+    size = xy.max(axis=0) - xy.min(axis=0)
+    best = None
+
+    for axis in np.argsort(-size, kind='stable').tolist():
+        us = np.sort(xy[:, axis])
+
+        # A cut in gap j leaves j points on its low side. Co-ordinates that differ by a tiny
+        # fraction of the size of xy are taken as tied.
+        gaps = np.flatnonzero(np.diff(us) > 1e-9 * size.max()) + 1
+        if len(gaps) == 0: continue
+
+        dist = np.abs(gaps - numLow)
+        near = gaps[dist <= window]
+        if len(near) > 0:
+            j = near[np.argmax(us[near] - us[near - 1])]
+            return (axis, 0.5 * (us[j - 1] + us[j]))
+
+        j = gaps[np.argmin(dist)]
+        if best is None or abs(j - numLow) < best[0]:
+            best = (abs(j - numLow), (axis, 0.5 * (us[j - 1] + us[j])))
+
+    return best[1] if best is not None else None
+
+
+def bisectPieces(pieces, numPieces, spacing, nodes):
+    # Divide the pieces, a list of (xy, ids) polygons, into numPieces groups of about the same
+    # number of nodes by recursive bisection. Returns the list of the resulting polygons.
+
+    if numPieces <= 1: return pieces
+
+    xy = np.concatenate([pxy for pxy, pids in pieces])
+    if len(xy) < 2 * numPieces: return pieces
+
+    numLow = numPieces // 2
+
+    # The nodes added along the cut belong to both sides, so the share of the existing nodes
+    # on the low side is adjusted for them (this matters only if numPieces is odd).
+
+    n = len(xy)
+    window = max(n // (32 * numPieces), 1)
+
+    cut = chooseCut(xy, round(n * numLow / numPieces), window)
+    if cut is None: return pieces
+
+    if 2 * numLow != numPieces:
+        s = seamCount(pieces, cut, spacing)
+        cut = chooseCut(xy, round((n + 2 * s) * numLow / numPieces - s), window)
+        if cut is None: return pieces
+
+    low, high = [], []
+    for pxy, pids in pieces:
+        lo, hi = splitPolygon(pxy, pids, cut, spacing, nodes)
+        low.extend(lo)
+        high.extend(hi)
+
+    if len(low) == 0 or len(high) == 0: return low + high
+
+    return (bisectPieces(low, numLow, spacing, nodes) +
+            bisectPieces(high, numPieces - numLow, spacing, nodes))
+
+
+def partitionPolygon(nodeList, numPieces, spacing=None):
+    # Cut the polygon nodeList into numPieces parts of about the same number of nodes (a part
+    # may consist of more than one piece, where a cut crosses the polygon more than twice).
+    # spacing is the distance between the nodes placed along the cuts, by default SEAM_SPACING
+    # times the mean length of the boundary edges.
+    # Returns (pieces, points): the node numbers of each piece, counter-clockwise, and the
+    # co-ordinates of all of the nodes, starting with those of nodeList.
+
+    xy = np.asarray(nodeList, dtype=float).reshape(-1, 2)
+
+    if spacing is None:
+        spacing = SEAM_SPACING * np.hypot(*(np.roll(xy, -1, axis=0) - xy).T).mean()
+
+    nodes = cutNodes(xy)
+    pieces = bisectPieces([(xy, np.arange(len(xy)))], numPieces, spacing, nodes)
+
+    return [nodes.complete(ids) for pxy, ids in pieces], nodes.points()
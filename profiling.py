@@ -0,0 +1,114 @@
+import time
+
+# Profiling of a mesh, switched on by mesh.startProfile() and off by mesh.stopProfile().
+#
+# While a mesh is being profiled, the methods listed in 'phases' are replaced, on that mesh
+# only, by wrappers that add up the wall time spent in them, so that a mesh that is not being
+# profiled runs exactly the code it would otherwise. The time of a phase includes that of any
+# phase called from it; e.g. isElementObscured is called by identifyAffectedElements.
+#
+# The predicates are counted where they are called, and the sizes of the tables are sampled
+# at the end of each step (see mesh.logStep), when the callback, if any, is called.
+
+# Mesh method -> the phase that its time is added to.
+phases = {'insertNodes':                    'insertNodes',
+          'triangulateNodes':               'triangulateNodes',
+          'refine':                         'refine',
+          'insertNode':                     'insertNode',
+          'insertBoundaryEdge':             'insertBoundaryEdge',
+          'recoverBoundaryEdge':            'recoverBoundaryEdge',
+          'removeNonFeatureBoundaryEdges':  'removeNonFeatureBoundaryEdges',
+          'flip':                           'flip',
+          'identifyAffectedElements':       'identifyAffectedElements',
+          'isElementObscured':              'isElementObscured',
+          'findEdge':                       'findEdge',
+          'orderCavityEdges':               'orderCavityEdges',
+          'releaseCavity':                  'releaseCavity',
+          'createElementsLoop':             'createElements',
+          'createElementsPolyline':         'createElements'}
+
+
+class meshStats:
+
+# The timings and counts collected while a mesh is profiled. callback, if given, is called
+# with this object at the end of every step.
+
+    def __init__(self, callback=None):
+        self.times = {}  # phase -> wall time (s).
+        self.calls = {}  # phase -> number of calls.
+
+        self.inCircleTests = 0  # in-circle predicates evaluated.
+        self.shadowTests   = 0  # feature shadow tests evaluated, by isElementObscured.
+
+        self.cavitySizes = []  # the number of elements removed by each insertion.
+
+        self.steps        = 0  # steps completed.
+        self.peakElements = 0  # the most live elements (triangles and boundary elements) at the end of a step.
+        self.peakEdges    = 0  # the most live edges at the end of a step.
+
+        self.callback = callback
+        self.saved = {}  # method -> the instance attribute it replaced, if any.
+
+    def timed(self, phase, fn):
+        # fn wrapped so that the time spent in it is added to 'phase'. For releaseCavity, the
+        # size of the cavity is recorded too.
+
+        times = self.times
+        calls = self.calls
+        perf_counter = time.perf_counter
+        cavitySizes = self.cavitySizes if phase == 'releaseCavity' else None
+
+        def wrapper(*args, **kwargs):
+            if cavitySizes is not None: cavitySizes.append(len(args[0]))
+
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                times[phase] = times.get(phase, 0.0) + perf_counter() - t0
+                calls[phase] = calls.get(phase, 0) + 1
+
+        return wrapper
+
+    def attach(self, m):
+        for name, phase in phases.items():
+            if name in m.__dict__: self.saved[name] = m.__dict__[name]
+            setattr(m, name, self.timed(phase, getattr(m, name)))
+
+    def detach(self, m):
+        for name in phases:
+            if name in self.saved:
+                setattr(m, name, self.saved[name])
+            else:
+                delattr(m, name)
+        self.saved = {}
+
+    def step(self, m):
+        # Called at the end of each step of mesh m.
+
+        self.steps += 1
+        self.peakElements = max(self.peakElements, len(m.elementTable) - len(m.elementTable.free))
+        self.peakEdges = max(self.peakEdges, len(m.edgeTable) - len(m.edgeTable.free))
+
+        if self.callback is not None: self.callback(self)
+
+    def summary(self):
+        # The statistics as a dict of plain values, e.g. for saving as JSON.
+
+        sizes = self.cavitySizes
+        return {'times': dict(self.times), 'calls': dict(self.calls),
+                'inCircleTests': self.inCircleTests, 'shadowTests': self.shadowTests,
+                'insertions': len(sizes),
+                'meanCavitySize': sum(sizes) / len(sizes) if sizes else 0.0,
+                'maxCavitySize': max(sizes) if sizes else 0,
+                'steps': self.steps, 'peakElements': self.peakElements, 'peakEdges': self.peakEdges}
+
+    def __str__(self):
+        lines = ['{:32s} {:>10s} {:>10s}'.format('phase', 'seconds', 'calls')]
+        for phase, t in sorted(self.times.items(), key=lambda xx: -xx[1]):
+            lines.append('{:32s} {:10.4f} {:10d}'.format(phase, t, self.calls[phase]))
+
+        for key, value in self.summary().items():
+            if key not in ('times', 'calls'): lines.append('{:32s} {:>10}'.format(key, round(value, 2)))
+
+        return '\n'.join(lines)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from geometry import triangleQuality_batch
+
+# Quality measures of the triangles of a mesh (see mesh.quality), computed in one batched
+# pass over the nodes of the triangles, with histograms that summarize their distributions.
+
+# The ranges of the histograms of the angles (degrees) and of the radius-edge ratio. A triangle's
+# smallest angle is at most 60 degrees and its largest at least 60; the radius-edge ratio is at
+# least 1/sqrt(3), and larger values are counted in the last bin.
+
+angleRanges = {'minAngle': (0.0, 60.0), 'maxAngle': (60.0, 180.0)}
+radiusEdgeRange = (1.0 / np.sqrt(3.0), 4.0)
+
+
+def _histogram(values, lo, hi, bins):
+    # (counts, bin edges) of values over [lo, hi], with values beyond hi in the last bin.
+
+    edges = np.linspace(lo, hi, bins + 1)
+    return np.histogram(np.clip(values, lo, hi), bins=edges)[0], edges
+
+
+def meshQuality(m, bins=20):
+    # See mesh.quality().
+
+    tris = m.elementTable.triangles()
+    nn = m.getElementNodeArray(tris)
+    xy = m.nodes
+
+    minAngle, maxAngle, radiusEdge, area = triangleQuality_batch(xy[nn[:,0]], xy[nn[:,1]], xy[nn[:,2]])
+
+    histograms = {key: _histogram(values, *angleRanges[key], bins) for key, values in (('minAngle', minAngle), ('maxAngle', maxAngle))}
+    histograms['radiusEdge'] = _histogram(radiusEdge, *radiusEdgeRange, bins)
+
+    # The areas are binned on a log scale, between the smallest and largest positive areas.
+    positive = area[area > 0.0]
+    if len(positive) > 0:
+        lo, hi = np.log10(positive.min()), np.log10(positive.max())
+        counts, edges = _histogram(np.log10(positive), lo, max(hi, lo + 1e-9), bins)
+        histograms['area'] = (counts, 10.0**edges)
+    else:
+        histograms['area'] = (np.zeros(bins, dtype=np.int64), np.zeros(bins + 1))
+
+    empty = len(tris) == 0
+    summary = {'triangles':     len(tris),
+               'minAngle':      np.nan if empty else float(minAngle.min()),
+               'maxAngle':      np.nan if empty else float(maxAngle.max()),
+               'maxRadiusEdge': np.nan if empty else float(radiusEdge.max()),
+               'minArea':       np.nan if empty else float(area.min()),
+               'maxArea':       np.nan if empty else float(area.max()),
+               'totalArea':     float(area.sum()),
+               'inverted':      int(np.count_nonzero(area <= 0.0))}
+
+    return {'elements': tris, 'minAngle': minAngle, 'maxAngle': maxAngle, 'radiusEdge': radiusEdge,
+            'area': area, 'histograms': histograms, 'summary': summary}
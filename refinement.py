@@ -0,0 +1,392 @@
+import heapq
+import math
+from collections import deque
+
+import numpy as np
+
+from geometry import orientation, incircle, circumcenter, triangleMeasures_batch
+from mesh_utils import findSingleElementEdges
+
+# Delaunay refinement (Ruppert's algorithm) of a triangulated mesh.
+#
+# Triangles whose smallest angle is below the target, or whose area exceeds the target,
+# are held in a heap keyed by the sine of their smallest angle, so the worst triangle is
+# always treated first. A bad triangle is removed by inserting its circumcentre, unless
+# the circumcentre encroaches upon a segment (lies inside the segment's diametral circle)
+# or lies beyond one, in which case the segment is split instead. If the circumcentre cannot
+# be inserted, e.g. rounding has put it on a node, the longest edge of the triangle is split
+# at its midpoint instead, so that no bad triangle is dropped. Segments are the feature
+# edges and any edge on the edge of the triangulation. Each insertion only re-examines the
+# triangles it creates, so the work per insertion is proportional to the size of its cavity.
+#
+# Segments meeting at the input vertices are split on concentric circles about those
+# vertices (at a power-of-two distance), and triangles whose shortest edge joins two
+# segments that meet at an input angle of less than 60 degrees are not split for the sake
+# of their angles, since no amount of refinement can improve them.
+
+
+def _edgeKey(n1, n2):
+    n1, n2 = int(n1), int(n2)
+    return (n1, n2) if n1 < n2 else (n2, n1)
+
+
+class refiner:
+    def __init__(self, m, min_angle=20.0, max_area=None, sizing_fn=None):
+        self.m = m
+        self.sinMinAngle = math.sin(math.radians(min_angle))
+        self.max_area = max_area
+        self.sizing_fn = sizing_fn
+
+        self.heap = []             # (sine of smallest angle, element, nodes, too big) of the bad triangles.
+        self.encroached = deque()  # (segment nodes, forced) of the segments waiting to be split.
+
+        self.origin = {}        # segment nodes -> nodes of the input segment it is part of.
+        self.nodeSegments = {}  # node -> input segments through it.
+        self.inputNodes = set() # end nodes of the input segments.
+
+        self.numInserted = 0
+
+        self.findSegments()
+
+    def isSegment(self, ie):
+        # Segments are the feature edges and the edges without a triangle on both sides.
+
+        et = self.m.edgeTable
+        if et.feature[ie]: return True
+
+        ntri = 0
+        for iel in et.getParents(ie):
+            if self.m.elementTable.nside[iel] == 3: ntri += 1
+
+        return ntri < 2
+
+    def findSegments(self):
+        et = self.m.edgeTable
+        el = self.m.elementTable
+
+        num = len(et)
+        parents = et.parents[:num]
+        ntri = ((parents >= 0) & (el.nside[np.maximum(parents, 0)] == 3)).sum(axis=1)
+        segments = np.flatnonzero((ntri > 0) & (et.feature[:num] | (ntri < 2)))
+
+        for ie in segments:
+            key = _edgeKey(*et.nodes[ie])
+            self.origin[key] = key
+            for n in key:
+                self.nodeSegments.setdefault(n, set()).add(key)
+                self.inputNodes.add(n)
+
+    def triangleNodes(self, iel):
+        return tuple(int(n) for n in self.m.getElementNodeArray([iel])[0])
+
+    def apex(self, iel, ie):
+        # The node of triangle iel opposite its edge ie.
+
+        en = self.m.edgeTable.nodes[ie]
+        for n in self.triangleNodes(iel):
+            if n != en[0] and n != en[1]: return n
+
+    def encroaches(self, xy, ie):
+        # Does xy lie strictly inside the diametral circle of edge ie ?
+
+        en = self.m.edgeTable.nodes[ie]
+        a = self.m.nodes[en[0]] - xy
+        b = self.m.nodes[en[1]] - xy
+        return a[0]*b[0] + a[1]*b[1] < 0.0
+
+    def isEncroached(self, ie):
+        # Does the apex of a triangle beside segment ie encroach upon it ?
+
+        for iel in self.m.edgeTable.getParents(ie):
+            if self.m.elementTable.nside[iel] != 3: continue
+            if self.encroaches(self.m.nodes[self.apex(iel, ie)], ie): return True
+
+        return False
+
+    def queueSegment(self, ie, forced=False):
+        # Queue segment ie for splitting. Unless forced, it is only split if it is still
+        # encroached upon when its turn comes.
+        self.encroached.append((_edgeKey(*self.m.edgeTable.nodes[ie]), forced))
+
+    def queueTriangles(self, tris):
+        tris = np.asarray(tris, dtype=np.int64)
+        if len(tris) == 0: return
+
+        nn = self.m.getElementNodeArray(tris)
+        xy = self.m.nodes[nn]
+        area, sinMin = triangleMeasures_batch(xy[:,0], xy[:,1], xy[:,2])
+
+        big = np.zeros(len(tris), dtype=bool)
+        if self.max_area is not None:
+            big |= area > self.max_area
+        if self.sizing_fn is not None:
+            big |= area > np.asarray(self.sizing_fn(xy.mean(axis=1)), dtype=float).reshape(-1)
+
+        for k in np.flatnonzero(((sinMin < self.sinMinAngle) | big) & (area > 0.0)):
+            heapq.heappush(self.heap, (float(sinMin[k]), int(tris[k]), tuple(nn[k].tolist()), bool(big[k])))
+
+    def isSmallAngleCorner(self, nodes):
+        # Is the shortest edge of the triangle 'nodes' a link between two input segments
+        # that meet at an angle of less than 60 degrees ?
+
+        xy = self.m.nodes[list(nodes)]
+        lengths = [np.hypot(*(xy[(k+1) % 3] - xy[k])) for k in range(3)]
+        k = int(np.argmin(lengths))
+        u, v = nodes[k], nodes[(k+1) % 3]
+
+        for su in self.nodeSegments.get(u, ()):
+            for sv in self.nodeSegments.get(v, ()):
+                if su == sv: continue
+
+                common = set(su) & set(sv)
+                if len(common) != 1: continue
+                w = common.pop()
+                if w == u or w == v: continue
+
+                pw = self.m.nodes[w]
+                d1 = self.m.nodes[su[0] if su[1] == w else su[1]] - pw
+                d2 = self.m.nodes[sv[0] if sv[1] == w else sv[1]] - pw
+                cosw = (d1 @ d2) / (np.hypot(*d1) * np.hypot(*d2))
+                if cosw > 0.5: return True
+
+        return False
+
+    def locate(self, iel, xy):
+        # Walk along the straight line from the centroid of triangle iel to xy. Returns
+        # ('triangle', iel) for the triangle containing xy, ('segment', ie) for the first
+        # segment crossed on the way, or None if the walk fails.
+
+        m = self.m
+        g = m.nodes[list(self.triangleNodes(iel))].mean(axis=0)
+        iprev = None
+
+        for istep in range(len(m.elementTable) + 1):
+            nn = self.triangleNodes(iel)
+            sides = m.elementTable.getSides(iel)
+
+            iexit = None
+            for k in range(3):
+                if sides[k][0] == iprev: continue
+
+                u, v = m.nodes[nn[k]], m.nodes[nn[(k+1) % 3]]
+                if orientation(u, v, xy) >= 0: continue
+
+                ou, ov = orientation(g, xy, u), orientation(g, xy, v)
+                if ou <= 0 and ov >= 0 and (ou, ov) != (0, 0):
+                    iexit = sides[k][0]
+                    break
+
+            if iexit is None: return ('triangle', iel)
+            if self.isSegment(iexit): return ('segment', iexit)
+
+            iprev = iexit
+            iel = m.neighbourAcross(iel, iexit)
+
+        return None
+
+    def cavity(self, seeds, xy, iskip=None):
+        # The triangles, grown from seeds without crossing a segment, whose circumcircles
+        # contain xy, and the segments (other than iskip) on the boundary of that region.
+
+        m = self.m
+        cav = list(seeds)
+        inCav = set(cav)
+        segments = []
+
+        queue = deque(cav)
+        while queue:
+            iel = queue.popleft()
+
+            for ie, orn in m.elementTable.getSides(iel):
+                if ie == iskip: continue
+                if self.isSegment(ie):
+                    segments.append(ie)
+                    continue
+
+                iother = m.neighbourAcross(iel, ie)
+                if iother in inCav: continue
+
+                a, b, c = m.nodes[list(self.triangleNodes(iother))]
+                if m.stats is not None: m.stats.inCircleTests += 1
+                if incircle(a, b, c, xy) > 0:
+                    cav.append(iother)
+                    inCav.add(iother)
+                    queue.append(iother)
+
+        return cav, segments
+
+    def insert(self, xy, cav, isplit=None):
+        # Insert a node at xy, replacing the triangles cav. If isplit is given, xy lies on
+        # segment isplit, which is replaced by the two halves.
+
+        m = self.m
+        et = m.edgeTable
+        el = m.elementTable
+
+        inode = m.nodeTable.append(xy)
+
+        islist = {}
+        iolist = {}
+        for iel in cav:
+            m.remove_element(iel, el.getSides(iel), islist, iolist)
+
+        if isplit is not None:
+            n1, n2 = [int(n) for n in et.nodes[isplit]]
+            origin = self.origin.pop(_edgeKey(n1, n2), _edgeKey(n1, n2))
+            feature = bool(et.feature[isplit])
+            bOpen = islist.pop(isplit) == 1
+            iolist.pop(isplit)
+
+            # Detach the segment from anything left on its far side, then delete it.
+            for iel in et.getParents(isplit):
+                el.removeSide(iel, isplit)
+                if el.numSides(iel) == 0: el.release(iel)
+            et.release(isplit)
+        else:
+            bOpen = False
+
+        ielist = findSingleElementEdges(islist, iolist, et)
+        m.releaseCavity(cav, islist)
+
+        if bOpen:
+            inew = m.createElementsPolyline(m.orderCavityEdges(ielist, True), inode)
+        else:
+            inew = m.createElementsLoop(m.orderCavityEdges(ielist, False), inode)
+
+        if isplit is not None:
+            for n in (n1, n2):
+                ie = et.find(n, inode)
+                if feature: et.setFeature(ie)
+                self.origin[_edgeKey(n, inode)] = origin
+            self.nodeSegments[inode] = {origin}
+
+        self.numInserted += 1
+        m.logStep()
+
+        for iel in inew:
+            for ie, orn in el.getSides(iel):
+                if self.isSegment(ie) and self.isEncroached(ie): self.queueSegment(ie)
+
+        self.queueTriangles(inew)
+
+    def splitPoint(self, ie):
+        # Where to split segment ie: at its midpoint, or if just one end is an input node,
+        # at the power-of-two distance from that end that is nearest the midpoint.
+
+        n1, n2 = self.m.edgeTable.nodes[ie]
+        xy1, xy2 = self.m.nodes[n1], self.m.nodes[n2]
+
+        in1, in2 = n1 in self.inputNodes, n2 in self.inputNodes
+        if in1 == in2: return 0.5*(xy1 + xy2)
+
+        if in2: xy1, xy2 = xy2, xy1
+
+        length = np.hypot(*(xy2 - xy1))
+        d = 2.0**round(math.log2(0.5*length))
+        return xy1 + (xy2 - xy1)*(d/length)
+
+    def splitSegment(self, ie):
+        el = self.m.elementTable
+        xy = self.splitPoint(ie)
+
+        seeds = [iel for iel in self.m.edgeTable.getParents(ie) if el.nside[iel] == 3]
+        if len(seeds) == 0: return
+        cav, segments = self.cavity(seeds, xy, iskip=ie)
+        self.insert(xy, cav, isplit=ie)
+
+    def insertOrDefer(self, item, xy, cav, segments):
+        # Insert a node at xy, replacing the triangles cav, unless xy encroaches upon one of the
+        # segments around them: those are split first and the bad triangle 'item' is queued again.
+
+        enc = [ie for ie in set(segments) if self.encroaches(xy, ie) or segments.count(ie) > 1]
+        if len(enc) > 0:
+            for ie in enc: self.queueSegment(ie, forced=True)
+            heapq.heappush(self.heap, item)
+            return
+
+        self.insert(xy, cav)
+
+    def splitLongestEdge(self, item):
+        # Split the bad triangle 'item' at the midpoint of its longest edge, for when its
+        # circumcentre cannot be inserted. A segment is split as a segment.
+
+        m = self.m
+        sinMin, iel, nodes, big = item
+
+        sides = [ie for ie, orn in m.elementTable.getSides(iel)]
+        lengths = [np.hypot(*(m.nodes[m.edgeTable.nodes[ie, 0]] - m.nodes[m.edgeTable.nodes[ie, 1]])) for ie in sides]
+        ie = sides[int(np.argmax(lengths))]
+
+        if self.isSegment(ie):
+            self.queueSegment(ie, forced=True)
+            heapq.heappush(self.heap, item)
+            return
+
+        xy = m.nodes[m.edgeTable.nodes[ie]].mean(axis=0)
+        cav, segments = self.cavity([iel, m.neighbourAcross(iel, ie)], xy)
+        self.insertOrDefer(item, xy, cav, segments)
+
+    def splitTriangle(self, item):
+        m = self.m
+        sinMin, iel, nodes, big = item
+
+        a, b, c = m.nodes[list(nodes)]
+        xy = circumcenter(a, b, c)
+
+        loc = None
+        if xy is not None and np.all(np.isfinite(xy)): loc = self.locate(iel, xy)
+
+        if loc is not None and loc[0] == 'segment':
+            # The circumcentre lies beyond a segment: split the segment and try again.
+            self.queueSegment(loc[1], forced=True)
+            heapq.heappush(self.heap, item)
+            return
+
+        if loc is not None:
+            a, b, c = m.nodes[list(self.triangleNodes(loc[1]))]
+            if incircle(a, b, c, xy) <= 0: loc = None
+
+        # The circumcentre could not be found, or rounding has put it on a node or outside the
+        # circumcircle of the triangle found: split the longest edge instead.
+        if loc is None:
+            self.splitLongestEdge(item)
+            return
+
+        cav, segments = self.cavity([loc[1]], xy)
+        self.insertOrDefer(item, xy, cav, segments)
+
+    def isCurrent(self, iel, nodes):
+        # Is element iel still the triangle 'nodes' ?
+
+        if self.m.elementTable.nside[iel] != 3: return False
+        return sorted(self.triangleNodes(iel)) == sorted(nodes)
+
+    def run(self, max_nodes=None):
+        et = self.m.edgeTable
+
+        for ie in np.flatnonzero(et.npar[:len(et)] > 0):
+            if _edgeKey(*et.nodes[ie]) in self.origin and self.isEncroached(ie): self.queueSegment(ie)
+
+        self.queueTriangles(self.m.elementTable.triangles())
+
+        while max_nodes is None or self.numInserted < max_nodes:
+
+            if len(self.encroached) > 0:
+                key, forced = self.encroached.popleft()
+                ie = et.find(*key)
+                if ie is None or not self.isSegment(ie): continue
+
+                if forced or self.isEncroached(ie): self.splitSegment(ie)
+                continue
+
+            if len(self.heap) == 0: break
+
+            item = heapq.heappop(self.heap)
+            sinMin, iel, nodes, big = item
+
+            if not self.isCurrent(iel, nodes): continue
+            if not big and self.isSmallAngleCorner(nodes): continue
+
+            self.splitTriangle(item)
+
+        return self.numInserted
@@ -0,0 +1,175 @@
+import math
+import numpy as np
+
+# A uniform hash grid over line segments, used to find the feature edges that can
+# possibly obscure an element without looking at every feature in the mesh.
+#
+# Segments are filed under every grid cell that their bounding box overlaps. The
+# grid is unbounded (cells are keys in a dict), so it copes with a domain that grows
+# as the boundary is inserted. The cell size follows the mean segment length: it is
+# re-derived, and the grid rebuilt, each time the number of segments doubles.
+
+class segmentGrid:
+    def __init__(self, cellSize=None):
+        self.cellSize = cellSize
+        self.cells    = {}    # (i, j) -> set of segment ids.
+        self.boxes    = {}    # segment id -> (xmin, ymin, xmax, ymax).
+        self.lengths  = {}    # segment id -> segment length.
+
+        self.sumLength = 0.0
+        self.nextRebuild = 16
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, iseg):
+        return iseg in self.boxes
+
+    def _cellRange(self, box):
+        h = self.cellSize
+        return math.floor(box[0]/h), math.floor(box[1]/h), math.floor(box[2]/h), math.floor(box[3]/h)
+
+    def _file(self, iseg):
+        i0, j0, i1, j1 = self._cellRange(self.boxes[iseg])
+
+        for i in range(i0, i1+1):
+            for j in range(j0, j1+1):
+                self.cells.setdefault((i, j), set()).add(iseg)
+
+    def _unfile(self, iseg):
+        i0, j0, i1, j1 = self._cellRange(self.boxes[iseg])
+
+        for i in range(i0, i1+1):
+            for j in range(j0, j1+1):
+                cell = self.cells[(i, j)]
+                cell.discard(iseg)
+                if len(cell) == 0: del self.cells[(i, j)]
+
+    def rebuild(self):
+        # Re-derive the cell size from the mean segment length and re-file every segment.
+
+        if len(self.boxes) > 0 and self.sumLength > 0.0:
+            self.cellSize = self.sumLength / len(self.boxes)
+
+        self.cells = {}
+        for iseg in self.boxes:
+            self._file(iseg)
+
+        self.nextRebuild = 2 * max(len(self.boxes), 8)
+
+    def insert(self, iseg, xy1, xy2):
+        # Add (or move) segment iseg with end points xy1, xy2.
+
+        if iseg in self.boxes: self.remove(iseg)
+
+        x1, y1, x2, y2 = float(xy1[0]), float(xy1[1]), float(xy2[0]), float(xy2[1])
+        length = math.hypot(x2-x1, y2-y1)
+
+        if self.cellSize is None:
+            self.cellSize = length if length > 0.0 else 1.0
+
+        self.boxes[iseg]   = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.lengths[iseg] = length
+        self.sumLength += length
+
+        if len(self.boxes) >= self.nextRebuild:
+            self.rebuild()
+        else:
+            self._file(iseg)
+
+    def remove(self, iseg):
+        if iseg not in self.boxes: return
+
+        self._unfile(iseg)
+        self.sumLength -= self.lengths.pop(iseg)
+        del self.boxes[iseg]
+
+    def query(self, box):
+        # Sorted ids of the segments whose bounding boxes overlap box = (xmin, ymin, xmax, ymax).
+
+        if len(self.boxes) == 0: return []
+
+        i0, j0, i1, j1 = self._cellRange(box)
+
+        if (i1-i0+1)*(j1-j0+1) > len(self.cells):
+            # The query covers more cells than are occupied: it is cheaper to test every segment.
+            candidates = self.boxes.keys()
+        else:
+            candidates = set()
+            for i in range(i0, i1+1):
+                for j in range(j0, j1+1):
+                    candidates.update(self.cells.get((i, j), ()))
+
+        res = []
+        for iseg in candidates:
+            sbox = self.boxes[iseg]
+            if (sbox[0] <= box[2]) & (sbox[2] >= box[0]) & (sbox[1] <= box[3]) & (sbox[3] >= box[1]):
+                res.append(iseg)
+
+        return sorted(res)
+
+
+# Space-filling curve orderings, used to insert a batch of nodes in an order in which
+# consecutive nodes are close together (so that the walk to each new node is short)
+# while keeping enough randomness to avoid pathologically large cavities.
+
+def hilbertIndex(xy, order=16):
+    # Position of each of the (N,2) points xy along a Hilbert curve through a
+    # 2**order x 2**order grid laid over their bounding box.
+
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if len(xy) == 0: return np.zeros(0, dtype=np.int64)
+
+    n = 1 << order
+    lo = xy.min(axis=0)
+    span = (xy.max(axis=0) - lo).max()
+    if span == 0.0: span = 1.0
+
+    q = np.minimum(((xy - lo) / span * n).astype(np.int64), n - 1)
+    x, y = q[:, 0], q[:, 1]
+
+    d = np.zeros(len(xy), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+
+        # Rotate the quadrant so that the curve inside it has the standard orientation.
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+
+        s >>= 1
+
+    return d
+
+
+def brioOrder(xy, rng=None, minRound=64):
+    # Biased randomized insertion order: the points are split at random into rounds that
+    # roughly double in size (the last round holds about half of them) and each round is
+    # sorted along a Hilbert curve. Returns the permutation of range(len(xy)).
+
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if rng is None: rng = np.random.default_rng()
+
+    perm = rng.permutation(len(xy))
+
+    bounds = []
+    end = len(xy)
+    while end > minRound:
+        bounds.append(end)
+        end //= 2
+    bounds.append(end)
+    bounds.append(0)
+    bounds = bounds[::-1]
+
+    keys = hilbertIndex(xy)
+
+    res = []
+    for ix in range(len(bounds) - 1):
+        rnd = perm[bounds[ix]:bounds[ix+1]]
+        res.append(rnd[np.argsort(keys[rnd], kind='stable')])
+
+    return np.concatenate(res) if len(res) > 0 else perm
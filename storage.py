@@ -0,0 +1,79 @@
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+# Saving and loading of meshes as .npz files.
+#
+# A mesh is stored as the flat arrays of its tables (see topology.py), slot for slot, so that
+# the edge and element numbers of the loaded mesh are those of the saved one. The file is an
+# ordinary, uncompressed .npz archive that np.load() can read. Because its members are stored
+# uncompressed, each of them can also be memory-mapped where it lies in the archive, so that a
+# large mesh opens without its arrays being read or copied.
+
+FORMAT_VERSION = 1
+
+# Struct of a zip local file header, up to the lengths of the name and the extra field.
+_localHeader = struct.Struct('<4s5H3L2H')
+
+
+def saveArrays(path, arrays):
+    # Write the dict of arrays to the .npz file 'path'. The archive is written alongside and
+    # renamed over 'path', so that a file that is memory-mapped elsewhere is not overwritten.
+
+    path = os.fspath(path)
+    if not path.endswith('.npz'): path += '.npz'
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+    return path
+
+
+def _mappedMember(path, f, info):
+    # Memory-map the .npy member 'info' of the open archive f, copy-on-write.
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("{} is compressed in {} and cannot be memory-mapped.".format(info.filename, path))
+
+    f.seek(info.header_offset)
+    fields = _localHeader.unpack(f.read(_localHeader.size))
+    if fields[0] != b'PK\x03\x04':
+        raise ValueError("Bad zip header for {} in {}.".format(info.filename, path))
+    f.seek(fields[-2] + fields[-1], 1)
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+
+    if dtype.hasobject:
+        raise ValueError("{} in {} holds Python objects.".format(info.filename, path))
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='c', offset=f.tell(), shape=shape,
+                     order='F' if fortran else 'C')
+
+
+def loadArrays(path, mmap=True):
+    # The dict of arrays in the .npz file 'path'. With mmap=True each array is memory-mapped
+    # copy-on-write: it can be modified, but the changes are never written back to the file.
+
+    path = os.fspath(path)
+
+    if not mmap:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    res = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if not info.filename.endswith('.npy'): continue
+            res[info.filename[:-4]] = _mappedMember(path, f, info)
+
+    return res
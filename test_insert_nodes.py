@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from delaunay_mesh import mesh
+
+# Bulk insertion of gridded point clouds, whose nodes fall on the hull edges of the mesh built so
+# far and whose first nodes are collinear in row order.
+
+
+def grid(n):
+    return np.stack(np.meshgrid(np.arange(n, dtype=float), np.arange(n, dtype=float)), -1).reshape(-1, 2)
+
+
+def assertValid(m):
+    problems = m.validate()
+    assert not any(len(ids) for ids in problems.values()), problems
+
+
+@pytest.mark.parametrize('order, seed', [('brio', 0), ('brio', 1), ('brio', 2), ('hilbert', None), (None, None)])
+def test_grid(order, seed):
+    m = mesh()
+    m.insertNodes(grid(12), order=order, seed=seed)
+
+    assertValid(m)
+    assert len(m.elementTable.triangles()) == 2 * 11 * 11
+
+
+def test_node_on_hull_edge():
+    # The last node splits the hull edge [0, 1].
+
+    m = mesh()
+    m.insertNodes([[0, 0], [2, 0], [0, 1], [1, 0]], order=None)
+
+    assertValid(m)
+    assert len(m.elementTable.triangles()) == 2
+
+
+def test_collinear():
+    with pytest.raises(ValueError):
+        mesh().insertNodes([[0, 0], [1, 0], [2, 0], [3, 0]], order=None)
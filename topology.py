@@ -0,0 +1,477 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+# Struct-of-arrays storage for the mesh topology.
+#
+# Each table keeps its data in contiguous numpy arrays that are over-allocated
+# and doubled in size when they fill up, so that appending is amortized O(1).
+# Only the first len(table) rows of each array are meaningful.
+#
+# Edges and elements that are deleted are put on a free list and their slots are
+# handed out again by allocate(), so the tables do not fill up with dead entries.
+# compact() squeezes out whatever free slots remain.
+#
+# While an operation log is being recorded (see oplog.py), each table collects the
+# slots that change in its 'touched' set; otherwise 'touched' is None. Code that
+# writes to the arrays directly must call touch() or touchAll() itself.
+
+
+def _grown(arr, capacity, fill):
+    # Return a copy of arr with its first axis enlarged to 'capacity' rows.
+
+    res = np.full((capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+    res[:arr.shape[0]] = arr
+    return res
+
+
+def _compactionMap(count, free):
+    # Old-to-new index map that closes up the free slots, with -1 for the free slots themselves.
+
+    keep = np.ones(count, dtype=bool)
+    keep[free] = False
+    return np.where(keep, np.cumsum(keep) - 1, -1), keep
+
+
+def _nodeKey(n1, n2):
+    # The key of the edge joining nodes n1 and n2 in the node-pair index: the smaller node
+    # number in the upper 32 bits and the larger in the lower.
+    n1, n2 = int(n1), int(n2)
+    return (n1 << 32) | n2 if n1 < n2 else (n2 << 32) | n1
+
+
+class nodeTable:
+    def __init__(self, capacity=64):
+        self.xy    = np.zeros((capacity, 2))   # node co-ordinates.
+        self.count = 0
+
+        self.touched = None  # nodes changed since the operation log last read them.
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, num):
+        # Make room for 'num' additional nodes.
+
+        needed = self.count + num
+        if needed > self.xy.shape[0]:
+            self.xy = _grown(self.xy, max(needed, 2*self.xy.shape[0]), 0.0)
+
+    def append(self, xy):
+        self.reserve(1)
+        self.xy[self.count] = xy
+        self.touch(self.count)
+        self.count += 1
+        return self.count - 1
+
+    def extend(self, xyList):
+        xyList = np.asarray(xyList, dtype=float).reshape(-1, 2)
+
+        self.reserve(len(xyList))
+        self.xy[self.count:self.count+len(xyList)] = xyList
+        if self.touched is not None: self.touched.update(range(self.count, self.count+len(xyList)))
+        self.count += len(xyList)
+
+    def touch(self, ix):
+        if self.touched is not None: self.touched.add(ix)
+
+    def touchAll(self):
+        if self.touched is not None: self.touched.update(range(self.count))
+
+    @property
+    def coords(self):
+        # (N,2) view of the live co-ordinates.
+        return self.xy[:self.count]
+
+
+class edgeTable:
+    def __init__(self, capacity=64):
+        self.nodes   = np.zeros((capacity, 2), dtype=np.int64)    # end nodes of each edge.
+        self.parents = np.full((capacity, 2), -1, dtype=np.int64) # parent elements, -1 if unused.
+        self.npar    = np.zeros(capacity, dtype=np.int8)          # number of parent elements.
+        self.bnd     = np.zeros(capacity, dtype=bool)             # edge lies on the hull.
+        self.feature = np.zeros(capacity, dtype=bool)             # edge is a prescribed boundary edge.
+        self.count   = 0
+
+        self._index = {}  # _nodeKey(n1, n2) -> edge, for the live edges; None until needed.
+
+        self.newFeatures = []  # edges whose feature flag or end nodes have changed since the list was last drained.
+
+        self.free = []  # deleted edges whose slots can be reused.
+
+        self.touched = None  # edges changed since the operation log last read them.
+
+    def __len__(self):
+        return self.count
+
+    def touch(self, ie):
+        if self.touched is not None: self.touched.add(ie)
+
+    def touchAll(self):
+        if self.touched is not None: self.touched.update(range(self.count))
+
+    def reserve(self, num):
+        # Make room for 'num' additional edges.
+
+        needed = self.count + num
+        capacity = self.nodes.shape[0]
+        if needed > capacity:
+            capacity = max(needed, 2*capacity)
+            self.nodes   = _grown(self.nodes, capacity, 0)
+            self.parents = _grown(self.parents, capacity, -1)
+            self.npar    = _grown(self.npar, capacity, 0)
+            self.bnd     = _grown(self.bnd, capacity, False)
+            self.feature = _grown(self.feature, capacity, False)
+
+    def allocate(self):
+        # Index of an unused edge slot, reusing a deleted edge if there is one.
+        # The slot must be filled in with assign().
+
+        if len(self.free) > 0: return self.free.pop()
+
+        self.reserve(1)
+        self.count += 1
+        return self.count - 1
+
+    def assign(self, ie, nodes, parents=(), bnd=False, feature=False):
+        self.touch(ie)
+        self.nodes[ie] = nodes
+        self.setParents(ie, parents)
+        self.bnd[ie] = bnd
+        self.feature[ie] = False
+        if feature: self.setFeature(ie)
+
+        self.index.setdefault(_nodeKey(*nodes), ie)
+
+    def append(self, nodes, parents=(), bnd=False, feature=False):
+        ie = self.allocate()
+        self.assign(ie, nodes, parents, bnd, feature)
+        return ie
+
+    def release(self, ie):
+        # Delete edge ie and put its slot on the free list.
+
+        self.touch(ie)
+        self.unindex(ie)
+        if self.feature[ie]: self.setFeature(ie, False)
+        self.setParents(ie, [])
+        self.bnd[ie] = False
+        self.free.append(ie)
+
+    def compact(self):
+        # Close up the free slots. Returns the old-to-new edge map (-1 for the deleted edges).
+        # References to the edges held elsewhere (elements, newFeatures) must be remapped by the caller.
+
+        self.touchAll()
+
+        emap, keep = _compactionMap(self.count, self.free)
+        num = int(keep.sum())
+
+        for arr in (self.nodes, self.parents, self.npar, self.bnd, self.feature):
+            arr[:num] = arr[:self.count][keep]
+
+        self.parents[num:self.count] = -1
+        self.npar[num:self.count] = 0
+        self.count = num
+        self.free = []
+
+        self.reindex()
+
+        return emap
+
+    @property
+    def index(self):
+        if self._index is None: self.reindex()
+        return self._index
+
+    def reindex(self):
+        # Rebuild the node-pair index, e.g. after the nodes have been renumbered.
+
+        live = np.ones(self.count, dtype=bool)
+        live[self.free] = False
+        ies = np.flatnonzero(live)
+
+        nodes = self.nodes[ies]
+        keys = (nodes.min(axis=1) << 32) | nodes.max(axis=1)
+
+        # Where two live edges join the same nodes, the first of them is indexed.
+        self._index = dict(zip(keys[::-1].tolist(), ies[::-1].tolist()))
+
+    def invalidateIndex(self):
+        # Drop the node-pair index, to be rebuilt when it is next used.
+        self._index = None
+
+    def setBnd(self, ie, bnd=True):
+        self.touch(ie)
+        self.bnd[ie] = bnd
+
+    def setFeature(self, ie, feature=True):
+        self.touch(ie)
+        self.feature[ie] = feature
+        self.newFeatures.append(ie)
+
+    def find(self, n1, n2):
+        # The edge joining nodes n1 and n2, or None.
+        return self.index.get(_nodeKey(n1, n2))
+
+    def unindex(self, ie):
+        # Remove edge ie from the node-pair index, e.g. once it has been deleted.
+
+        key = _nodeKey(*self.nodes[ie])
+        if self.index.get(key) == ie: del self.index[key]
+
+    def getNodes(self, ie):
+        return self.nodes[ie].tolist()
+
+    def setNodes(self, ie, nodes):
+        self.touch(ie)
+        self.unindex(ie)
+        self.nodes[ie] = nodes
+        self.index.setdefault(_nodeKey(*nodes), ie)
+
+        if self.feature[ie]: self.newFeatures.append(ie)
+
+    def getParents(self, ie):
+        return self.parents[ie, :self.npar[ie]].tolist()
+
+    def numParents(self, ie):
+        return int(self.npar[ie])
+
+    def setParents(self, ie, parents):
+        if len(parents) > 2:
+            raise ValueError("An edge can have at most two parent elements.")
+
+        self.touch(ie)
+        self.parents[ie] = -1
+        self.parents[ie, :len(parents)] = parents
+        self.npar[ie] = len(parents)
+
+    def setParent(self, ie, ipos, iel):
+        # Overwrite the parent element held in position ipos.
+
+        if ipos >= self.npar[ie]:
+            raise IndexError("Edge {} has no parent in position {}.".format(ie, ipos))
+        self.touch(ie)
+        self.parents[ie, ipos] = iel
+
+    def addParent(self, ie, iel):
+        self.setParents(ie, self.getParents(ie) + [iel])
+
+    def removeParent(self, ie, iel):
+        # Remove iel from the parent elements of ie (if present), preserving the order of the rest.
+
+        pelist = self.getParents(ie)
+        if iel in pelist:
+            pelist.remove(iel)
+            self.setParents(ie, pelist)
+
+    def replaceParent(self, ie, ielOld, ielNew):
+        pelist = self.getParents(ie)
+        self.touch(ie)
+        self.parents[ie, pelist.index(ielOld)] = ielNew
+
+
+class elementTable:
+    def __init__(self, capacity=64):
+        self.edges = np.zeros((capacity, 3), dtype=np.int64)  # edges of each element.
+        self.orn   = np.zeros((capacity, 3), dtype=bool)      # orientation of each of those edges.
+        self.nside = np.zeros(capacity, dtype=np.int8)        # 3 - triangle, 1 - boundary element, 0 - deleted.
+        self.count = 0
+
+        self.free = []    # deleted elements whose slots can be reused.
+        self.last = None  # the most recently allocated element.
+
+        self.touched = None  # elements changed since the operation log last read them.
+
+    def __len__(self):
+        return self.count
+
+    def touch(self, iel):
+        if self.touched is not None: self.touched.add(iel)
+
+    def touchAll(self):
+        if self.touched is not None: self.touched.update(range(self.count))
+
+    def reserve(self, num):
+        # Make room for 'num' additional elements.
+
+        needed = self.count + num
+        capacity = self.edges.shape[0]
+        if needed > capacity:
+            capacity = max(needed, 2*capacity)
+            self.edges = _grown(self.edges, capacity, 0)
+            self.orn   = _grown(self.orn, capacity, False)
+            self.nside = _grown(self.nside, capacity, 0)
+
+    def allocate(self):
+        # Index of an unused element slot, reusing a deleted element if there is one.
+
+        if len(self.free) > 0:
+            iel = self.free.pop()
+        else:
+            self.reserve(1)
+            iel = self.count
+            self.count += 1
+
+        self.touch(iel)
+        self.nside[iel] = 0
+        self.last = iel
+        return iel
+
+    def append(self, sides):
+        # sides is a list of (edge, orientation) pairs.
+
+        iel = self.allocate()
+        self.setSides(iel, sides)
+        return iel
+
+    def release(self, iel):
+        # Delete element iel and put its slot on the free list.
+
+        self.touch(iel)
+        self.nside[iel] = 0
+        self.free.append(iel)
+
+    def compact(self):
+        # Close up the free slots. Returns the old-to-new element map (-1 for the deleted elements).
+        # The edge parents must be remapped by the caller.
+
+        self.touchAll()
+
+        elmap, keep = _compactionMap(self.count, self.free)
+        num = int(keep.sum())
+
+        for arr in (self.edges, self.orn, self.nside):
+            arr[:num] = arr[:self.count][keep]
+
+        self.nside[num:self.count] = 0
+        if self.last is not None: self.last = None if elmap[self.last] < 0 else int(elmap[self.last])
+        self.count = num
+        self.free = []
+
+        return elmap
+
+    def getSides(self, iel):
+        ns = self.nside[iel]
+        return list(zip(self.edges[iel, :ns].tolist(), self.orn[iel, :ns].tolist()))
+
+    def numSides(self, iel):
+        return int(self.nside[iel])
+
+    def setSides(self, iel, sides):
+        if len(sides) > 3:
+            raise ValueError("An element can have at most three sides.")
+
+        self.touch(iel)
+        self.nside[iel] = len(sides)
+        for ix, (ie, orn) in enumerate(sides):
+            self.edges[iel, ix] = ie
+            self.orn[iel, ix]   = orn
+
+    def setSideEdge(self, iel, ipos, ie):
+        self.touch(iel)
+        self.edges[iel, ipos] = ie
+
+    def removeSide(self, iel, ie):
+        # Remove the first side of iel that references edge ie.
+
+        sides = self.getSides(iel)
+        for ix, xx in enumerate(sides):
+            if xx[0] == ie:
+                del sides[ix]
+                self.setSides(iel, sides)
+                break
+
+    def triangles(self):
+        # Indices of the live triangular elements.
+        return np.nonzero(self.nside[:self.count] == 3)[0]
+
+
+# Compatibility views presenting the tables in the original list-of-dicts shape,
+# i.e. edges[ie] -> {'nodes', 'parent_elements', 'bnd', 'feature'} and
+# elements[iel] -> [{'edge', 'orn'}, ...]. These are convenient for inspection
+# but slow; the meshing code itself works on the tables directly.
+
+def _checkIndex(ix, num):
+    if ix < 0: ix += num
+    if not 0 <= ix < num:
+        raise IndexError("index out of range")
+    return ix
+
+
+class edgeRecord(MutableMapping):
+    # Live dict-like view of a single edge. Writing a key writes through to the table.
+
+    _keys = ('nodes', 'parent_elements', 'bnd', 'feature')
+
+    def __init__(self, table, ie):
+        self.table = table
+        self.ie    = ie
+
+    def __getitem__(self, key):
+        if key == 'nodes':           return self.table.getNodes(self.ie)
+        if key == 'parent_elements': return self.table.getParents(self.ie)
+        if key == 'bnd':             return bool(self.table.bnd[self.ie])
+        if key == 'feature':         return bool(self.table.feature[self.ie])
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if   key == 'nodes':           self.table.setNodes(self.ie, value)
+        elif key == 'parent_elements': self.table.setParents(self.ie, value)
+        elif key == 'bnd':             self.table.setBnd(self.ie, value)
+        elif key == 'feature':         self.table.setFeature(self.ie, value)
+        else: raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError("Edge fields cannot be deleted.")
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class edgeListView:
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, ie):
+        if isinstance(ie, slice):
+            return [self[ix] for ix in range(*ie.indices(len(self)))]
+        return edgeRecord(self.table, _checkIndex(ie, len(self)))
+
+    def __iter__(self):
+        for ie in range(len(self)):
+            yield edgeRecord(self.table, ie)
+
+
+class elementListView:
+    # elements[iel] returns a fresh list of {'edge', 'orn'} dicts; assign a whole
+    # list to elements[iel] to modify an element.
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, iel):
+        if isinstance(iel, slice):
+            return [self[ix] for ix in range(*iel.indices(len(self)))]
+        iel = _checkIndex(iel, len(self))
+        return [{'edge':ie, 'orn':orn} for ie, orn in self.table.getSides(iel)]
+
+    def __setitem__(self, iel, sides):
+        iel = _checkIndex(iel, len(self))
+        self.table.setSides(iel, [(xx['edge'], xx['orn']) for xx in sides])
+
+    def __iter__(self):
+        for iel in range(len(self)):
+            yield self[iel]
@@ -0,0 +1,210 @@
+import numpy as np
+
+from geometry import orientation_batch, incircle_batch
+
+# Checks of the invariants of a mesh, made on the arrays of its tables in a few vectorized
+# passes (see mesh.validate). Each check returns the numbers of the offending elements as a
+# sorted integer array, except the feature checks: checkFeatureEdges returns edge numbers and
+# checkFeaturePairs row numbers of its features argument.
+
+
+def _liveSides(el):
+    # The (element, position, edge) of every side of every live element.
+
+    nside = el.nside[:len(el)]
+    iel, ipos = np.nonzero(np.arange(3) < nside[:, None])
+    return iel, ipos, el.edges[iel, ipos]
+
+
+def _knownNodes(m, ielems):
+    # Which of the triangles ielems have sides that are all known edges, between known nodes.
+
+    el = m.elementTable
+    edges = el.edges[ielems]
+    ok = ((edges >= 0) & (edges < len(m.edgeTable))).all(axis=1)
+    nn = m.edgeTable.nodes[edges[ok]]
+    ok[ok] = ((nn >= 0) & (nn < len(m.nodeTable))).all(axis=(1, 2))
+    return ok
+
+
+def checkNodes(m):
+    # Elements with a side whose edge references a node that does not exist. Sides that reference
+    # an unknown edge are left to checkConnectivity.
+
+    el = m.elementTable
+    iel, ipos, ie = _liveSides(el)
+    known = (ie >= 0) & (ie < len(m.edgeTable))
+    iel, ie = iel[known], ie[known]
+
+    nn = m.edgeTable.nodes[ie]
+    unknown = ((nn < 0) | (nn >= len(m.nodeTable))).any(axis=1)
+
+    return np.unique(iel[unknown]).astype(np.int64)
+
+
+def checkOrientation(m):
+    # Triangles that are not strictly counter-clockwise. Triangles with a side that references an
+    # unknown edge or node are left to checkConnectivity and checkNodes.
+
+    tris = m.elementTable.triangles()
+    tris = tris[_knownNodes(m, tris)]
+    nn = m.getElementNodeArray(tris)
+    xy = m.nodes
+
+    return tris[orientation_batch(xy[nn[:, 0]], xy[nn[:, 1]], xy[nn[:, 2]]) <= 0]
+
+
+def checkConnectivity(m):
+    # Elements whose sides and the parents of their edges disagree: a side that references a
+    # deleted or unknown edge, or an edge that does not list the element as a parent; a parent
+    # of an edge that is not a live element with that edge as a side; an edge with two triangles
+    # that both run the same way along it; and triangles whose sides do not join end to end.
+
+    et = m.edgeTable
+    el = m.elementTable
+    numEdges = len(et)
+    numElements = len(el)
+
+    bad = []
+
+    iel, ipos, ie = _liveSides(el)
+
+    edgeLive = np.ones(numEdges, dtype=bool)
+    edgeLive[et.free] = False
+
+    known = (ie >= 0) & (ie < numEdges)
+    bad.append(iel[~known])
+    iel, ipos, ie = iel[known], ipos[known], ie[known]
+
+    listed = (et.parents[ie, 0] == iel) | (et.parents[ie, 1] == iel)
+    bad.append(iel[~edgeLive[ie] | ~listed])
+
+    # Each edge must be a side of exactly the elements listed as its parents.
+
+    npar = et.npar[:numEdges].astype(np.int64)
+    uses = np.bincount(ie, minlength=numEdges)
+
+    ieb, ip = np.nonzero(np.arange(2) < npar[:, None])
+    parent = et.parents[ieb, ip]
+
+    valid = (parent >= 0) & (parent < numElements)
+    valid[valid] = el.nside[parent[valid]] > 0
+    bad.append(parent[(parent >= 0) & (parent < numElements) & ~valid])
+
+    ieb, parent = ieb[valid], parent[valid]
+    hasSide = (el.edges[parent] == ieb[:, None]) & (np.arange(3) < el.nside[parent][:, None])
+    bad.append(parent[~hasSide.any(axis=1)])
+
+    mismatch = np.flatnonzero(uses != npar)
+    bad.append(iel[np.isin(ie, mismatch)])
+
+    # Two triangles that share an edge must run in opposite directions along it.
+
+    ie2 = np.flatnonzero(edgeLive & (npar == 2) & (uses == 2))
+    p0, p1 = et.parents[ie2, 0], et.parents[ie2, 1]
+    both = (p0 >= 0) & (p0 < numElements) & (p1 >= 0) & (p1 < numElements)
+    ie2, p0, p1 = ie2[both], p0[both], p1[both]
+    both = (el.nside[p0] == 3) & (el.nside[p1] == 3)
+    ie2, p0, p1 = ie2[both], p0[both], p1[both]
+
+    orn0 = el.orn[p0, np.argmax(el.edges[p0] == ie2[:, None], axis=1)]
+    orn1 = el.orn[p1, np.argmax(el.edges[p1] == ie2[:, None], axis=1)]
+    bad.append(np.concatenate([p0[orn0 == orn1], p1[orn0 == orn1]]))
+
+    # The sides of a triangle must join end to end.
+
+    tris = el.triangles()
+    tris = tris[~np.isin(tris, np.concatenate(bad))]
+    edges = el.edges[tris]
+    orn = el.orn[tris]
+    start = et.nodes[edges, np.where(orn, 0, 1)]
+    end = et.nodes[edges, np.where(orn, 1, 0)]
+    bad.append(tris[(end != np.roll(start, -1, axis=1)).any(axis=1)])
+
+    return np.unique(np.concatenate(bad)).astype(np.int64)
+
+
+def checkFeatureEdges(m):
+    # Feature edges that are missing from the mesh: the numbers of the edges marked as features
+    # that have been deleted or that are not a side of any triangle.
+
+    et = m.edgeTable
+    el = m.elementTable
+    numEdges = len(et)
+
+    edgeLive = np.ones(numEdges, dtype=bool)
+    edgeLive[et.free] = False
+
+    iel, ipos, ie = _liveSides(el)
+    onTriangle = np.zeros(numEdges, dtype=bool)
+    onTriangle[ie[(el.nside[iel] == 3) & (ie >= 0) & (ie < numEdges)]] = True
+
+    return np.flatnonzero(et.feature[:numEdges] & ~(edgeLive & onTriangle)).astype(np.int64)
+
+
+def checkFeaturePairs(m, features):
+    # Rows of features, an (F,2) array of node pairs that must be joined by feature edges, whose
+    # pair is not joined by an edge or whose edge is not marked as a feature.
+
+    et = m.edgeTable
+    features = np.asarray(features, dtype=np.int64).reshape(-1, 2)
+    found = [et.find(n1, n2) for n1, n2 in features.tolist()]
+    missing = [k for k, ie in enumerate(found) if ie is None or not et.feature[ie]]
+
+    return np.array(missing, dtype=np.int64)
+
+
+def checkDelaunay(m):
+    # Pairs of triangles either side of an interior edge that is not a feature, where the apex
+    # of one lies strictly inside the circumcircle of the other.
+
+    et = m.edgeTable
+    el = m.elementTable
+    numEdges = len(et)
+    xy = m.nodes
+
+    npar = et.npar[:numEdges]
+    p0 = et.parents[:numEdges, 0]
+    p1 = et.parents[:numEdges, 1]
+
+    edgeLive = np.ones(numEdges, dtype=bool)
+    edgeLive[et.free] = False
+
+    interior = edgeLive & (npar == 2) & ~et.feature[:numEdges]
+    interior &= (p0 >= 0) & (p0 < len(el)) & (p1 >= 0) & (p1 < len(el))
+    interior[interior] = (el.nside[p0[interior]] == 3) & (el.nside[p1[interior]] == 3)
+    ie = np.flatnonzero(interior)
+
+    # Triangles with a side that references an unknown edge or node are left to checkConnectivity
+    # and checkNodes.
+    for p in (p0, p1):
+        ie = ie[_knownNodes(m, p[ie])]
+
+    p0, p1 = p0[ie], p1[ie]
+    nn0 = m.getElementNodeArray(p0)
+    nn1 = m.getElementNodeArray(p1)
+
+    # The apex of p1 is its node that is not on the edge.
+    onEdge = (nn1 == et.nodes[ie, 0][:, None]) | (nn1 == et.nodes[ie, 1][:, None])
+    single = (~onEdge).sum(axis=1) == 1
+    apex = nn1[np.arange(len(ie)), np.argmax(~onEdge, axis=1)]
+
+    inside = single & (incircle_batch(xy[nn0[:, 0]], xy[nn0[:, 1]], xy[nn0[:, 2]], xy[apex]) > 0)
+
+    return np.unique(np.concatenate([p0[inside], p1[inside]])).astype(np.int64)
+
+
+def validateMesh(m, features=None, delaunay=True):
+    # Run the checks on mesh m. Returns a dict of check -> offending element numbers, except for
+    # 'featureEdges' (edge numbers) and 'featurePairs' (row numbers of features), all empty if the
+    # mesh is valid.
+
+    res = {'nodes':        checkNodes(m),
+           'orientation':  checkOrientation(m),
+           'connectivity': checkConnectivity(m),
+           'featureEdges': checkFeatureEdges(m),
+           'featurePairs': checkFeaturePairs(m, [] if features is None else features)}
+
+    if delaunay: res['delaunay'] = checkDelaunay(m)
+
+    return res
@@ -0,0 +1,157 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from draw import meshArtist, meshState, padded, changedRows
+
+# Offline rendering of the frames of a video.
+#
+# While a mesh is built, a frameRecorder stores each frame as the change in the drawn
+# state of the mesh (see draw.meshState) since the previous frame. Once the mesh is
+# complete, runs of consecutive frames are rendered in a pool of worker processes, each
+# of which draws its run incrementally with a meshArtist, and the pixels of the frames
+# are passed in order to a single ffmpeg encoder.
+
+
+def emptyState():
+    # The state of an empty mesh: node co-ordinates followed by the arrays of draw.meshState().
+    return np.zeros((0, 2)), np.zeros(0, dtype=np.int8), np.zeros((0, 2), dtype=np.int64), np.zeros((0, 3), dtype=np.int64)
+
+
+def stateChanges(state, prevState):
+    # The frame that turns prevState into state: for the nodes, the edge slots and the element
+    # slots in turn, the size of the table, the rows that have changed and their new contents.
+
+    nodes, style, enodes, eedges = state
+    prevXY, prevStyle, prevNodes, prevEdges = prevState
+
+    ix = changedRows(nodes, prevXY, np.nan)
+    ix = ix[ix < len(nodes)]
+    ie = np.union1d(changedRows(style, prevStyle, -1), changedRows(enodes, prevNodes, -1))
+    ie = ie[ie < len(style)]
+    iel = changedRows(eedges, prevEdges, -1)
+    iel = iel[iel < len(eedges)]
+
+    return (len(nodes), ix, nodes[ix], len(style), ie, style[ie], enodes[ie], len(eedges), iel, eedges[iel])
+
+
+def applyFrame(state, frame):
+    # The mesh state that results from applying a recorded frame to 'state'.
+
+    nodes, style, enodes, eedges = state
+    numNodes, ix, ixy, numEdges, ie, istyle, inodes, numElements, iel, iedges = frame
+
+    nodes = padded(nodes, numNodes, np.nan)
+    style = padded(style, numEdges, -1)
+    enodes = padded(enodes, numEdges, -1)
+    eedges = padded(eedges, numElements, -1)
+
+    nodes[ix] = ixy
+    style[ie] = istyle
+    enodes[ie] = inodes
+    eedges[iel] = iedges
+
+    return nodes, style, enodes, eedges
+
+
+class frameRecorder:
+
+# The frames of a video, recorded as a mesh is built and rendered later by writeVideo().
+# labels, arrows and internal are as for draw_mesh_external().
+
+    def __init__(self, labels=False, arrows=False, internal=True):
+        self.labels = labels
+        self.arrows = arrows
+        self.internal = internal
+
+        self.state = emptyState()  # the mesh state of the last frame.
+        self.frames = []           # the changes made by each frame, as returned by stateChanges().
+
+    def __len__(self):
+        return len(self.frames)
+
+    def record(self, nodes, edges, elements):
+
+        # nodes is an (N,2) array of co-ordinates, edges an edgeTable and elements an elementTable.
+
+        self.add((np.array(nodes, dtype=float),) + meshState(edges, elements, self.internal))
+
+    def add(self, state):
+        # Add a frame showing the mesh state 'state' (see emptyState).
+
+        self.frames.append(stateChanges(state, self.state))
+        self.state = state
+
+
+def _renderFrames(state, frames, figsize, dpi, labels, arrows, internal):
+    # Render the frames that follow the mesh state 'state' and return the RGBA pixels of
+    # each. Runs in a worker process.
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    artist = meshArtist(fig.subplots(1, 1), labels=labels, arrows=arrows, internal=internal)
+
+    res = []
+    for frame in frames:
+        state = applyFrame(state, frame)
+        artist.draw(*state)
+
+        canvas.draw()
+        res.append(bytes(canvas.buffer_rgba()))
+
+    return res
+
+
+def renderFrames(recorder, figsize, dpi, workers=None, chunksize=16):
+    # Render the frames of a frameRecorder on figures of size figsize (inches) at resolution dpi.
+    # This is a generator, which yields the RGBA pixels of each frame in order. The frames are
+    # rendered in runs of 'chunksize' by 'workers' processes (by default, one per CPU); with
+    # workers=1 they are rendered in this process.
+
+    options = (recorder.labels, recorder.arrows, recorder.internal)
+
+    def runs():
+        state = emptyState()
+        for ix in range(0, len(recorder.frames), chunksize):
+            frames = recorder.frames[ix:ix+chunksize]
+            yield state, frames
+
+            for frame in frames: state = applyFrame(state, frame)
+
+    if workers == 1:
+        for state, frames in runs():
+            for rgba in _renderFrames(state, frames, figsize, dpi, *options):
+                yield rgba
+        return
+
+    if workers is None: workers = os.cpu_count()
+
+    # Only a few runs are queued ahead of the one being encoded, to bound the memory taken by
+    # the rendered frames.
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        for state, frames in runs():
+            pending.append(executor.submit(_renderFrames, state, frames, figsize, dpi, *options))
+
+            if len(pending) > 2*workers:
+                for rgba in pending.popleft().result():
+                    yield rgba
+
+        while pending:
+            for rgba in pending.popleft().result():
+                yield rgba
+
+
+def writeVideo(recorder, writer, fig, fpath, dpi, workers=None, chunksize=16):
+    # Encode the frames of a frameRecorder into the video file fpath with writer, a canvasWriter.
+    # The frames take the size of the Figure fig, at resolution dpi, as they would with writer.saving(fig, fpath, dpi).
+
+    with writer.saving(fig, fpath, dpi):
+        for rgba in renderFrames(recorder, fig.get_size_inches(), fig.dpi, workers, chunksize):
+            writer.writeFrame(rgba)